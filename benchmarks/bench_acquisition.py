@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+#coding:utf-8
+"""
+  Purpose:  Acquisition benchmark. Records the first chamber of the config
+            (chambers.toml, with its driver options) against the simulated
+            instruments (drivers/simulatedDevices.py) and reports, per driver
+            command, p50/p95/p99 latency, Inficon bursts resent and retries
+            per command, bytes on the wire and the achieved samples per
+            second. Results are also written as JSON so runs can be compared
+            for regressions.
+  Created:  18/10/26
+
+  Run from the repository root:
+    python benchmarks/bench_acquisition.py --samples 100 --period 0.5
+    python benchmarks/bench_acquisition.py --drop 0.001 --corrupt 0.01 --seed 1 -o faults.json
+
+  The same --seed replays the same noise and fault sequence.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import importlib.util
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from drivers.simulatedDevices import Faults
+from monitor import config
+from monitor.metrics import Metrics
+
+
+def load_monitor():
+    """Import echo-monitor.py, which cannot be imported by name"""
+    spec = importlib.util.spec_from_file_location('echo_monitor', os.path.join(ROOT, 'echo-monitor.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values) + 0.5)) - 1))]
+
+
+class Timings(object):
+    """Wrap driver methods in place to time every call"""
+
+    def __init__(self):
+        self.calls = {}
+        self.counts = {}
+
+    def wrap(self, obj, method, name=None):
+        """Time obj.method, keyed by name, or by name(*args) if callable"""
+        function = getattr(obj, method)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                key = name(*args) if callable(name) else (name or method)
+                self.calls.setdefault(key, []).append(time.perf_counter() - start)
+
+        setattr(obj, method, timed)
+
+    def count(self, obj, method, name):
+        """Count the calls of obj.method"""
+        function = getattr(obj, method)
+
+        def counted(*args, **kwargs):
+            self.counts[name] = self.counts.get(name, 0) + 1
+            return function(*args, **kwargs)
+
+        setattr(obj, method, counted)
+
+    def summary(self):
+        summary = {}
+        for key, values in sorted(self.calls.items()):
+            values = sorted(values)
+            summary[key] = {'count': len(values),
+                            'mean_ms': sum(values) / len(values) * 1e3,
+                            'p50_ms': percentile(values, 50) * 1e3,
+                            'p95_ms': percentile(values, 95) * 1e3,
+                            'p99_ms': percentile(values, 99) * 1e3}
+        return summary
+
+
+def instrument(tcu, pcu, inf, timings):
+    """Time the driver calls made by recordChamber. Single Inficon commands
+    are counted, including those resending a failed burst; the bursts,
+    their resends and the retries of single commands are counted by the
+    driver's own metrics."""
+    timings.wrap(inf, 'comm', lambda command: 'inficon comm ' + command)
+    timings.wrap(inf, 'comm_many', lambda commands: 'inficon comm_many x%d' % len(commands))
+    timings.count(inf, 'comm', 'inficon commands')
+    timings.wrap(tcu, 'read_block', 'tcu read_block')
+    timings.wrap(tcu.MB, 'read_holding_registers', 'tcu read_holding_registers')
+    timings.wrap(pcu, 'pressure_gauges', 'tpg pressure_gauges')
+    timings.wrap(pcu, 'latest_pressures', 'tpg latest_pressures')
+
+
+def read_log(path, names):
+    """Per instrument read latency and stale fraction from the CSV log"""
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(line for line in f if not line.startswith('#')))
+    instruments = {}
+    for name in names:
+        read = [row for row in rows if row[name + ' Status'] != '']    # blank: not due that tick
+        fresh = [row for row in read if row[name + ' Status'] == '0']
+        latency = sorted(float(row[name + ' End']) - float(row[name + ' Start']) for row in fresh)
+        instruments[name] = {'stale_fraction': 1 - len(fresh) / len(read) if read else float('nan'),
+                             'p50_ms': percentile(latency, 50) * 1e3,
+                             'p95_ms': percentile(latency, 95) * 1e3,
+                             'p99_ms': percentile(latency, 99) * 1e3}
+    return len(rows), instruments
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=50, help="samples to record")
+    parser.add_argument('--period', type=float, default=0.5, help="requested sample period (s)")
+    parser.add_argument('--latency', type=float, default=0.001, help="device turn-around (s)")
+    parser.add_argument('--jitter', type=float, default=0.0, help="latency standard deviation (s)")
+    parser.add_argument('--drop', type=float, default=0.0, help="probability of dropping a reply byte")
+    parser.add_argument('--corrupt', type=float, default=0.0, help="probability of corrupting a reply")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--config', default=os.path.join(ROOT, 'chambers.toml'),
+                        help="chambers and instruments, the first chamber is recorded (default %(default)s)")
+    parser.add_argument('--polled-pressure', action='store_true',
+                        help="read the TPG with PRX every sample instead of continuous output")
+    parser.add_argument('-o', '--output', default='bench_acquisition.json', help="JSON results file")
+    args = parser.parse_args(arguments)
+
+    monitor = load_monitor()
+    faults = {name: Faults(args.latency, args.jitter, args.drop, args.corrupt, seed=args.seed + i)
+              for i, name in enumerate(['tcu', 'inficon', 'tpg'])}
+    # The drivers as production builds them, on the simulator's ports
+    chamber = config.load(args.config)[0]
+    echo = chamber.simulate(faults=faults, seed=args.seed)
+    drivers = {instrument.kind: instrument.driver for instrument in chamber.instruments}
+    tcu, pcu, inf = drivers['eurotherm'], drivers['tpg261'], drivers['inficon']
+    if not args.polled_pressure:
+        pcu.start_continuous(mode=0)
+
+    timings = Timings()
+    instrument(tcu, pcu, inf, timings)
+    metrics = Metrics()
+    metrics.attach(inf)
+
+    # The chamber's logs are in saved-logs/ of the working directory
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.mkdir(os.path.join(tmp, 'saved-logs'))
+        os.chdir(tmp)
+        try:
+            start = time.monotonic()
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                monitor.recordChamber(chamber, period=args.period, sample_max=args.samples)
+            elapsed = time.monotonic() - start
+            log = [name for name in os.listdir(chamber.logs) if name.endswith('.csv')][0]
+            samples, instruments = read_log(os.path.join(chamber.logs, log),
+                                            [instrument.name for instrument in chamber.instruments])
+        finally:
+            os.chdir(cwd)
+
+    if not args.polled_pressure:
+        pcu.stop_continuous()
+    echo.close()
+
+    counters = {name: value for (name, labels), value in metrics.counters.items()}
+    bursts = counters.get('echo_inficon_bursts_total', 0)
+    resends = counters.get('echo_inficon_burst_resends_total', 0)
+    commands = timings.counts.get('inficon commands', 0)
+    results = {
+        'config': vars(args),
+        'samples': samples,
+        'elapsed_s': elapsed,
+        'samples_per_s': samples / elapsed,
+        'commands': timings.summary(),
+        'instruments': instruments,
+        'inficon_bursts': bursts,
+        'inficon_bursts_resent': resends / bursts if bursts else 0,
+        'inficon_commands': commands,
+        'inficon_retries_per_command': counters.get('echo_inficon_retries_total', 0) / commands if commands else 0,
+        'bytes': {name: {'to_device': port.bytes_in, 'from_device': port.bytes_out}
+                  for name, port in echo.ports.items()},
+    }
+
+    print('{:<36}{:>8}{:>10}{:>10}{:>10}'.format('Command', 'Calls', 'p50 ms', 'p95 ms', 'p99 ms'))
+    print('-' * 74)
+    for key, stats in results['commands'].items():
+        print('{:<36}{:>8}{:>10.2f}{:>10.2f}{:>10.2f}'.format(key, stats['count'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms']))
+    print('-' * 74)
+    for name, stats in instruments.items():
+        print('{:<36}{:>8.1%}{:>10.2f}{:>10.2f}{:>10.2f}'.format(name + ' read (stale %)', stats['stale_fraction'],
+                                                                 stats['p50_ms'], stats['p95_ms'], stats['p99_ms']))
+    print('-' * 74)
+    print('Inficon bursts resent: {:.1%} of {}'.format(results['inficon_bursts_resent'], bursts))
+    print('Inficon retries per command: {:.3f} over {}'.format(results['inficon_retries_per_command'], commands))
+    for name, counts in results['bytes'].items():
+        print('Bytes {:<8} to device {:>8}  from device {:>8}'.format(name, counts['to_device'], counts['from_device']))
+    print('Samples per second: {:.2f} (requested {:.2f})'.format(results['samples_per_s'], 1 / args.period))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('\nResults saved:', args.output)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
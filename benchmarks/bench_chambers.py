@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+#coding:utf-8
+"""
+  Purpose:  Multi-chamber benchmark. Records 1, 2, 4... simulated chambers
+            at once, each an ECHO described as in chambers.toml
+            (monitor/config.py) on its own simulated instruments, at a
+            fixed period, and reports the achieved samples per second of
+            every chamber and the time taken by a sample's reads. Both
+            should stay flat as chambers are added. Results are also
+            written as JSON.
+  Created:  18/10/26
+
+  Run from the repository root:
+    python benchmarks/bench_chambers.py
+    python benchmarks/bench_chambers.py --chambers 1 2 4 8 --samples 40 --period 0.5
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import tempfile
+import threading
+import contextlib
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from monitor import config
+from bench_acquisition import load_monitor, percentile
+
+
+def chambers(count):
+    """`count` copies of the ECHO, named SIM1, SIM2... on ports of their own"""
+    document = {'chamber': []}
+    for i in range(count):
+        document['chamber'].append({
+            'name': 'SIM%d' % (i + 1),
+            'instrument': [{'driver': instrument.kind, 'port': '%s-%d' % (instrument.port, i + 1),
+                            'channels': list(instrument.channels) or [1], 'options': instrument.options}
+                           for instrument in config.default()[0].instruments]})
+    return config.parse(document)
+
+
+def read_log(path, instruments):
+    """(sample times, read durations) of a log, a read being from the first
+    instrument started to the last one done"""
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(line for line in f if not line.startswith('#')))
+    t = [float(row['Monotonic']) for row in rows]
+    reads = [max(float(row[name + ' End']) for name in instruments)
+             - min(float(row[name + ' Start']) for name in instruments)
+             for row in rows if all(row[name + ' Status'] == '0' for name in instruments)]
+    return t, reads
+
+
+def run(monitor, count, samples, period):
+    recorded = chambers(count)
+    echoes = [chamber.simulate() for chamber in recorded]
+    names = [instrument.name for instrument in recorded[0].instruments]
+    for chamber in recorded:
+        chamber['TPG'].driver.start_continuous(mode=0)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                recorders = [threading.Thread(target=monitor.recordChamber, args=(chamber,),
+                                              kwargs={'period': period, 'sample_max': samples,
+                                                      'rotate': None, 'quiet': True})
+                             for chamber in recorded]
+                start = time.monotonic()
+                for recorder in recorders:
+                    recorder.start()
+                for recorder in recorders:
+                    recorder.join()
+                elapsed = time.monotonic() - start
+            logs = [os.path.join('saved-logs', name) for name in sorted(os.listdir('saved-logs'))
+                    if name.endswith('.csv')]
+            results = [read_log(log, names) for log in logs]
+        finally:
+            os.chdir(cwd)
+
+    for chamber, echo in zip(recorded, echoes):
+        chamber['TPG'].driver.stop_continuous()
+        echo.close()
+
+    rates = [(len(t) - 1) / (t[-1] - t[0]) for t, _ in results]
+    reads = sorted(read for _, durations in results for read in durations)
+    return {
+        'chambers': count,
+        'elapsed_s': elapsed,
+        'samples_per_s': {'min': min(rates), 'mean': sum(rates) / len(rates)},
+        'read_ms': {'p50': percentile(reads, 50) * 1e3,
+                    'p95': percentile(reads, 95) * 1e3,
+                    'p99': percentile(reads, 99) * 1e3},
+    }
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chambers', type=int, nargs='+', default=[1, 2, 4], help="chambers recorded at once")
+    parser.add_argument('--samples', type=int, default=30, help="samples per chamber")
+    parser.add_argument('--period', type=float, default=0.5, help="sampling period (s)")
+    parser.add_argument('-o', '--output', default='bench_chambers.json', help="JSON results file")
+    args = parser.parse_args(arguments)
+
+    monitor = load_monitor()
+    results = {'config': vars(args), 'runs': []}
+    print('{:>9}{:>16}{:>16}{:>30}'.format('Chambers', 'Samples/s min', 'Samples/s mean', 'Sample reads p50/p95/p99 (ms)'))
+    print('-' * 71)
+    for count in args.chambers:
+        result = run(monitor, count, args.samples, args.period)
+        results['runs'].append(result)
+        print('{:>9}{:>16.2f}{:>16.2f}{:>10.1f}{:>10.1f}{:>10.1f}'.format(
+            count, result['samples_per_s']['min'], result['samples_per_s']['mean'], *result['read_ms'].values()))
+    print('Requested {:.2f} samples/s per chamber'.format(1 / args.period))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('\nResults saved:', args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
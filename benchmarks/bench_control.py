@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+#coding:utf-8
+"""
+  Purpose:  Rate control benchmark. Runs recordECHO with a RateController
+            (monitor/control.py) against the simulated chamber
+            (drivers/simulatedDevices.py), depositing a film from source 1
+            at a target rate: approach with the shutter closed, open once
+            settled, close at the thickness. Reports settling time,
+            overshoot, the rate error with the shutter open, the thickness
+            deposited and the latency from a rate reading to the setpoint
+            write it caused. Results are also written as JSON.
+  Created:  18/10/26
+
+  Run from the repository root:
+    python benchmarks/bench_control.py
+    python benchmarks/bench_control.py --rate 1.0 --thickness 0.1 --start 100 --tau 10
+
+  The source starts preheated at --start C, below the temperature of the
+  target rate, so the run covers the approach as well as the hold.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import tempfile
+import threading
+import contextlib
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from drivers.simulatedDevices import SimulatedECHO
+from monitor.adaptive import ProcessState
+from monitor.control import RateController, RateLoop
+from bench_acquisition import load_monitor, percentile
+
+
+def read_log(path, channel):
+    """(t, rate, thickness, setpoint) lists of the rows with a fresh Inficon reading"""
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(line for line in f if not line.startswith('#')))
+    rows = [row for row in rows if row['Inficon Status'] == '0']
+    setpoint = 'Temp %d Setpoint' % channel
+    return ([float(row['Inficon Start']) for row in rows],
+            [float(row['Rate %d' % channel]) for row in rows],
+            [float(row['Thick %d' % channel]) for row in rows],
+            [float(row[setpoint]) if row[setpoint] else None for row in rows])
+
+
+def settling(t, rate, target, band):
+    """Time from the first reading until the rate stays within band * target"""
+    settled = None
+    for ti, value in zip(t, rate):
+        if abs(value - target) > band * target:
+            settled = None
+        elif settled is None:
+            settled = ti
+    return None if settled is None else settled - t[0]
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=float, default=0.5, help="target rate (A/s)")
+    parser.add_argument('--thickness', type=float, default=0.05, help="film to deposit (kA)")
+    parser.add_argument('--start', type=float, default=120.0, help="initial source temperature (C)")
+    parser.add_argument('--tau', type=float, default=30.0, help="time constant of the simulated source (s)")
+    parser.add_argument('--ramp', type=float, default=30.0, help="TCU ramp limit (C/min)")
+    parser.add_argument('--band', type=float, default=0.1, help="settled within this fraction of the target")
+    parser.add_argument('--timeout', type=float, default=600.0, help="give up after (s)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default='bench_control.json', help="JSON results file")
+    args = parser.parse_args(arguments)
+
+    monitor = load_monitor()
+    echo = SimulatedECHO(seed=args.seed)
+    chamber = echo.chamber
+    with chamber.lock:
+        chamber.tau = args.tau
+        chamber.temperature[0] = chamber.target_sp[0] = chamber.alt_sp[0] = chamber.working_sp[0] = args.start
+    tcu, pcu, inf = echo.connect()
+    pcu.start_continuous(mode=0)
+
+    loop = RateLoop(1, args.rate, args.thickness, ramp=args.ramp)
+    controller = RateController([loop])
+
+    # Latency from the start of the Inficon read behind a setpoint to its write
+    latencies = []
+    shutter = {}
+    set_altSP = tcu.set_altSP
+
+    def timed_set_altSP(*args):
+        set_altSP(*args)
+        latencies.append(time.monotonic() - loop.written_at)
+
+    def logged(name, method):
+        def call():
+            result = method()
+            shutter[name] = (time.monotonic(), result)
+            return result
+        return call
+
+    tcu.set_altSP = timed_set_altSP
+    inf.shutterOpen = logged('open', inf.shutterOpen)
+    inf.shutterClose = logged('close', inf.shutterClose)
+
+    stop = threading.Event()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.mkdir(os.path.join(tmp, 'saved-logs'))
+        os.chdir(tmp)
+        try:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                recorder = threading.Thread(target=monitor.recordECHO, args=(tcu, pcu, inf),
+                                            kwargs={'adaptive': ProcessState(), 'control': controller,
+                                                    'rotate': None, 'stop': stop})
+                start = time.monotonic()
+                recorder.start()
+                while 'close' not in shutter and time.monotonic() - start < args.timeout:
+                    time.sleep(0.5)
+                time.sleep(1)
+                stop.set()
+                recorder.join()
+            elapsed = time.monotonic() - start
+            log = [name for name in os.listdir('saved-logs') if name.endswith('.csv')][0]
+            t, rate, thick, setpoints = read_log(os.path.join('saved-logs', log), 1)
+        finally:
+            os.chdir(cwd)
+
+    pcu.stop_continuous()
+    echo.close()
+
+    # Approach up to the shutter opening, deposition from there to its closing
+    opened = shutter.get('open', (float('inf'),))[0]
+    closed = shutter.get('close', (float('inf'),))[0]
+    approach = [i for i, ti in enumerate(t) if ti < opened]
+    deposit = [i for i, ti in enumerate(t) if opened <= ti < closed]
+    settle = settling([t[i] for i in approach], [rate[i] for i in approach], args.rate, args.band)
+    held = [rate[i] for i in deposit]
+    latencies.sort()
+    results = {
+        'config': vars(args),
+        'elapsed_s': elapsed,
+        'readings': len(t),
+        'reading_period_s': (t[-1] - t[0]) / (len(t) - 1) if len(t) > 1 else float('nan'),
+        'settling_s': settle,
+        'opened_after_s': opened - t[0] if deposit else None,
+        'overshoot': max(rate[i] for i in approach + deposit) / args.rate - 1 if rate else float('nan'),
+        'held_mean_error': sum(held) / len(held) / args.rate - 1 if held else float('nan'),
+        'held_rms_error': (sum((value / args.rate - 1) ** 2 for value in held) / len(held)) ** 0.5 if held else float('nan'),
+        'shutter': {name: result for name, (_, result) in shutter.items()},
+        'shutter_closed': 'close' in shutter and not chamber.shutter_open,
+        'deposited_kA': thick[deposit[-1]] - thick[deposit[0]] if deposit else float('nan'),
+        'setpoint_writes': len(latencies),
+        'final_setpoint_C': next((value for value in reversed(setpoints) if value is not None), None),
+        'write_latency_ms': {'p50': percentile(latencies, 50) * 1e3,
+                             'p95': percentile(latencies, 95) * 1e3,
+                             'p99': percentile(latencies, 99) * 1e3},
+    }
+
+    print('Target {:.3f} A/s to {:.3f} kA, source from {:.0f} C'.format(args.rate, args.thickness, args.start))
+    print('-' * 60)
+    print('{:<36}{:>12.3f}'.format('Rate reading period (s)', results['reading_period_s']))
+    print('{:<36}{:>12}'.format('Settling time, {:.0%} band (s)'.format(args.band),
+                                 'never' if settle is None else '{:.1f}'.format(settle)))
+    print('{:<36}{:>12}'.format('Shutter opened after (s)', 'never' if results['opened_after_s'] is None
+                                else '{:.1f}'.format(results['opened_after_s'])))
+    print('{:<36}{:>12.1%}'.format('Overshoot', results['overshoot']))
+    print('{:<36}{:>12.2%}'.format('Rate mean error, shutter open', results['held_mean_error']))
+    print('{:<36}{:>12.2%}'.format('Rate rms error, shutter open', results['held_rms_error']))
+    print('{:<36}{:>12}'.format('Shutter closed', 'yes' if results['shutter_closed'] else 'NO'))
+    print('{:<36}{:>12.4f}'.format('Deposited (kA)', results['deposited_kA']))
+    print('{:<36}{:>12}'.format('Setpoint writes', results['setpoint_writes']))
+    print('{:<36}{:>12}'.format('Final setpoint (C)', results['final_setpoint_C']))
+    print('{:<36}{:>12.1f}{:>10.1f}{:>10.1f}'.format('Write latency p50/p95/p99 (ms)', *results['write_latency_ms'].values()))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('\nResults saved:', args.output)
+    return 0 if results['shutter_closed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+#coding:utf-8
+"""
+  Purpose:  Compare the table-driven Inficon CRC with the original bit-by-bit
+            version. Checks that both give identical bytes, then times them.
+  Created:  18/10/26
+
+  Run from the repository root:  python benchmarks/bench_crc.py
+"""
+
+import os
+import sys
+import random
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from drivers.inficonDriver import inficon310C
+
+
+def crc_calc_bitwise(input_string):
+    """The original inficon310C.crc_calc, kept as the reference"""
+    command_string = []
+    for i in range(0, len(input_string)):
+        command_string.append(ord(input_string[i]))
+    crc = int('3fff', 16)
+    mask = int('2001', 16)
+    for command in command_string:
+        crc = command ^ crc
+        for i in range(0, 8):
+            old_crc = crc
+            crc = crc >> 1
+            if old_crc % 2 == 1:
+                crc = crc ^ mask
+    crc1_mask = int('1111111', 2)
+    crc1 = chr((crc & crc1_mask) + 34)
+    crc2 = chr((crc >> 7) + 34)
+    return(crc1, crc2)
+
+
+def check(n=10000):
+    """Both implementations must agree on random frames of any byte value"""
+    rng = random.Random(0)
+    for i in range(n):
+        data = bytes(rng.randrange(256) for j in range(rng.randrange(0, 40)))
+        expected = crc_calc_bitwise(data.decode('latin-1'))
+        assert inficon310C.crc_calc(data.decode('latin-1')) == expected, data
+        assert inficon310C.crc_bytes(data) == ''.join(expected).encode('latin-1'), data
+        assert inficon310C.crc_bytes(memoryview(data)) == ''.join(expected).encode('latin-1'), data
+
+
+def main():
+    check()
+    print('Table and bitwise CRC agree')
+
+    # A typical rate reply, as checked on every exchange
+    reply = b'\x28A0.123'
+    number = 100000
+    results = [
+        ('bitwise crc_calc (str)', lambda: crc_calc_bitwise(reply.decode('latin-1'))),
+        ('table crc_calc (str)', lambda: inficon310C.crc_calc(reply.decode('latin-1'))),
+        ('table crc_bytes (bytes)', lambda: inficon310C.crc_bytes(reply)),
+        ('table crc_bytes (memoryview)', lambda: inficon310C.crc_bytes(memoryview(reply))),
+    ]
+    for name, function in results:
+        t = min(timeit.repeat(function, number=number, repeat=5))
+        print('{:<30}{:>10.2f} us/call'.format(name, t / number * 1e6))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+#coding:utf-8
+"""
+  Purpose:  Import-time budget of the acquisition path. Imports each module
+            in a fresh interpreter with -X importtime, reports the cumulative
+            time, and fails if it is over budget or if it pulls in a plotting
+            or analysis package (numpy, pandas, matplotlib), which only the
+            dashboard, plots and archive should load.
+  Created:  18/10/26
+
+  Run from the repository root:
+    python benchmarks/bench_imports.py
+    python benchmarks/bench_imports.py --budget 0.1 --repeat 5
+
+  Exits with status 1 if any check fails, so it can gate a change.
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# What a restarted logger imports before it records
+TARGETS = [
+    ('drivers.eurothermDriver', 'import drivers.eurothermDriver'),
+    ('drivers.inficonDriver', 'import drivers.inficonDriver'),
+    ('drivers.pressureDriver', 'import drivers.pressureDriver'),
+    ('drivers.simulatedDevices', 'import drivers.simulatedDevices'),
+    ('monitor.polling', 'import monitor.polling'),
+    ('monitor.logsink', 'import monitor.logsink'),
+    ('monitor.binlog', 'import monitor.binlog'),
+    ('monitor.derived', 'import monitor.derived'),
+    ('monitor.adaptive', 'import monitor.adaptive'),
+    ('monitor.control', 'import monitor.control'),
+    ('monitor.config', 'import monitor.config'),
+    ('monitor.server', 'import monitor.server'),
+    ('monitor.metrics', 'import monitor.metrics'),
+    ('echo-monitor.py',
+     "import importlib.util as u; s = u.spec_from_file_location('echo_monitor', 'echo-monitor.py'); "
+     "s.loader.exec_module(u.module_from_spec(s))"),
+    ('echo-monitor.py + drivers',
+     "import importlib.util as u; s = u.spec_from_file_location('echo_monitor', 'echo-monitor.py'); "
+     "s.loader.exec_module(u.module_from_spec(s)); "
+     "import drivers.eurothermDriver, drivers.inficonDriver, drivers.pressureDriver"),
+]
+
+HEAVY = ('numpy', 'pandas', 'matplotlib')
+
+
+def importtime(code):
+    """Import in a fresh interpreter. Returns (total s, {top level module: s})"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    total = 0
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):    # top level import of the snippet
+            total += int(cumulative_us)
+        modules[name.strip()] = int(cumulative_us) / 1e6
+    return total / 1e6, modules
+
+
+def main(arguments):
+
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', type=float, default=0.25,
+                        help="Longest import of each target, s (default %(default)s)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Imports per target, the fastest counts (default %(default)s)")
+
+    args = parser.parse_args(arguments)
+
+    failed = False
+    print('{:<30}{:>12}  {}'.format('target', 'import [ms]', ''))
+    for name, code in TARGETS:
+        runs = [importtime(code) for _ in range(args.repeat)]
+        total, modules = min(runs, key=lambda run: run[0])
+        problems = ['imports ' + heavy for heavy in HEAVY if heavy in modules]
+        if total > args.budget:
+            problems.append('over the {:.0f} ms budget'.format(args.budget * 1e3))
+        failed = failed or bool(problems)
+        print('{:<30}{:>12.1f}  {}'.format(name, total * 1e3, ', '.join(problems) or 'ok'))
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+#coding:utf-8
+"""
+  Purpose:  Measure the cost of writing log rows: the old reopen-per-sample
+            append against the buffered CSVLogSink.
+  Created:  18/10/26
+
+  Run from the repository root:  python benchmarks/bench_logsink.py [-n ROWS] [--dir DIR]
+  DIR defaults to /dev/shm (tmpfs) so the numbers are not dominated by the disk.
+"""
+
+import os
+import sys
+import csv
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from monitor.logsink import CSVLogSink
+
+HEADER = ['Sample', 'Temp 1', 'Temp 2', 'Temp 3', 'Rate 1', 'Rate 2', 'Rate 3', 'Thick 1', 'Thick 2', 'Thick 3', 'Pressure']
+
+
+def rows(n):
+    for sample in range(n):
+        yield [sample, 20.4, 20.5, 137.9, 0.01, 0.0, 0.02, 0.001, 0.0, 0.124, 2.35e-06]
+
+
+def reopen_per_row(path, n):
+    """What recordECHO used to do for every sample"""
+    with open(path, 'x') as f:
+        csv.writer(f).writerow(HEADER)
+    for row in rows(n):
+        with open(path, 'a') as f:
+            csv.writer(f).writerow(row)
+
+
+def log_sink(path, n):
+    with CSVLogSink(path, HEADER) as sink:
+        for row in rows(n):
+            sink.write(row)
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, default=21600, help="rows per run (default: one 12 h run)")
+    parser.add_argument('--dir', default='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    args = parser.parse_args(arguments)
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        for name, writer in [('reopen per row', reopen_per_row), ('CSVLogSink', log_sink)]:
+            path = os.path.join(tmp, name.replace(' ', '-') + '.csv')
+            start = time.perf_counter()
+            writer(path, args.n)
+            elapsed = time.perf_counter() - start
+            print('{:<16}{:>10.2f} us/row{:>10.3f} s total'.format(name, elapsed / args.n * 1e6, elapsed))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -32,14 +32,13 @@ CHANGES:
 from pymodbus.pdu import ModbusRequest #TCU comm. superfluous?
 from pymodbus.client.sync import ModbusSerialClient as ModbusClient #TCU comm
 import time
-import numpy as np
-import matplotlib.pyplot as plt
 
 class TCU():
     '''TCU control class
         Use hex(address) to get correct address'''
         
     __verbose__ = True
+    metrics = None #set to a monitor.metrics.Metrics to count modbus errors and time requests
     
     def __init__(self, connectionPars, channels = [1,2,3]):
         '''constructor'''
@@ -58,16 +57,15 @@ class TCU():
         #rint ("\tTCU Connection successful\n")
            
         #remote state of each channel. Important to return channels to manual mode at end
-        self.remote = {
-                        1 : False,
-                        2 : False,
-                        3: False}
+        self.remote = {ch: False for ch in channels}
         
         #conversion brings from physical units to eurotherm readable values
         self.commands = {
+                "readPV":{"type" : "R", "address": 0x1, "conversion" : 0.1},
                 "readSP":{"type" : "R", "address": 0x2, "conversion" : 0.1}, 
+                "readPower":{"type" : "R", "address": 0x4, "conversion" : 0.01},
                 "setRmSP":{"type" : "W", "address": 0x1a, "conversion" : 10, "help" : "Use implemented function"},
-                "setRamp":{"type" : "W", "address": 0x23, "conversion" : 0.1 },
+                "setRamp":{"type" : "W", "address": 0x23, "conversion" : 10 },   # C/min, 1 decimal
                 "readRamp":{"type" : "W", "address": 0x23},
                 }
     
@@ -75,6 +73,13 @@ class TCU():
         #now should do some stuff with the remote output power (278/79) to make it safe.
         # this could be setting it to 111/112
 
+    def reconnect(self):
+        '''close and reopen the modbus connection, e.g. after the RS485 adapter
+        was unplugged. Raises IOError if the port cannot be opened'''
+        self.MB.close()
+        if not self.MB.connect():
+            raise IOError('Unable to connect to TCU')
+
     def __del__(self):
         '''safely delete object'''
         for channel in self.channels:
@@ -88,7 +93,7 @@ class TCU():
         
         command_ = self.commands[commandName]
         if command_['type'] == "W":
-            val = value*command_["conversion"]
+            val = int(round(value*command_["conversion"])) #registers hold integers
             self.MB.write_register(command_['address'], val, unit = channel)
         elif command_['type'] == "R":
             val = self.MB.read_holding_registers(command_['address'], unit = channel)
@@ -113,7 +118,7 @@ class TCU():
         ''' Set the alternative set point 
         (SP1 but for remote coms). Address 26
         '''
-        temp = temp_inC *10 #switch to eurotherm language
+        temp = int(round(temp_inC *10)) #switch to eurotherm language
         if not self.remote[channel]:
             self.setRemote(channel)
         self.MB.write_register(0x1a, temp, unit=channel)
@@ -135,6 +140,38 @@ class TCU():
         return temp
     
     
+    def read_block(self, channels=None, registers=('readPV', 'readSP', 'readPower')):
+        '''read several registers (names from self.commands) of each unit with
+        a single request spanning their address range, instead of one
+        request per register. Returns {channel: {commandName: value}}'''
+        if channels is None:
+            channels = self.channels
+        addresses = [self.commands[name]['address'] for name in registers]
+        start = min(addresses)
+        count = max(addresses) - start + 1
+        # divide rather than multiply so 204*0.1 reads 20.4 and not 20.400000000000002
+        divisors = [1 / self.commands[name]['conversion'] for name in registers]
+
+        block = {}
+        for channel in channels:
+            t0 = time.monotonic()
+            try:
+                reply = self.MB.read_holding_registers(start, count, unit = channel)
+            except Exception:
+                if self.metrics is not None:
+                    self.metrics.inc('echo_tcu_modbus_errors_total', unit=channel)
+                raise
+            if self.metrics is not None:
+                self.metrics.observe('echo_tcu_round_trip_seconds', time.monotonic() - t0, unit=channel)
+            if reply.isError():
+                if self.metrics is not None:
+                    self.metrics.inc('echo_tcu_modbus_errors_total', unit=channel)
+                raise IOError('TCU unit %s returned %s' % (channel, reply))
+            block[channel] = {name: reply.getRegister(address - start) / divisor
+                              for name, address, divisor in zip(registers, addresses, divisors)}
+        return block
+
+
     def read_powerOut(self, channel):
         '''read current power output parameter which can be used to calculate
         the current on the source provided conversion is known.
@@ -7,9 +7,35 @@ import serial
 import time
 import csv
 
+CRC_INIT = 0x3fff
+CRC_POLY = 0x2001
+
+def _crc_table():
+    """ CRC update for every possible byte, so replies are checked a byte
+    (not a bit) at a time """
+    table = []
+    for byte in range(256):
+        crc = byte
+        for i in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ CRC_POLY
+            else:
+                crc = crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+CRC_TABLE = _crc_table()
+
 class inficon310C(object):
     """ Driver for Inficon SQM160 QCM controller """
-    def __init__(self, port='/dev/ttyUSB2'):
+
+    metrics = None # Set to a monitor.metrics.Metrics to count retries and time round trips
+
+    def __init__(self, port='/dev/ttyUSB2', reply_timeout=0.5, retries=20):
+        """ reply_timeout is the deadline (s) for a complete reply frame,
+        retries the number of times a command is resent before giving up """
+        self.reply_timeout = reply_timeout
+        self.retries = retries
         # This command opens the serial port
         try: 
             self.serial = serial.Serial(port=port,
@@ -37,52 +63,115 @@ class inficon310C(object):
         except ConnectionError:
             print ('Cannot connect to instrument')
 
+    def frame(self, command):
+        """ Wrap a command string in the '!', length and crc bytes """
+        payload = bytes((len(command) + 34,)) + command.encode('latin-1')
+        return b'!' + payload + self.crc_bytes(payload)
+
     def comm(self, command):
         """ Implements actual communication with device """
-        length = chr(len(command) + 34)       
-        crc = self.crc_calc(length + command)
-        command = '!' + length + command + crc[0] + crc[1]
-        command_bytes = bytearray()
-        for i in range(0, len(command)):
-            command_bytes.append(ord(command[i]))
-        error = 0
-        while (error > -1) and (error < 20):
+        command_bytes = self.frame(command)
+        for attempt in range(self.retries):
+            if attempt and self.metrics is not None:
+                self.metrics.inc('echo_inficon_retries_total')
+            start = time.monotonic()
+            self.serial.reset_input_buffer() # Drop late replies to earlier attempts so they are not read as this one
             self.serial.write(command_bytes) # sends command to instrument in byte type
-            time.sleep(0.1) # Give it a second (or a tenth of one)
-            reply = self.serial.read(self.serial.inWaiting()) # Reads number of bytes in recieved input buffer
-            reply_chr = reply.decode('cp437') # Convert to string as serial for python 3 reads back bytes (?) utf-8 fucks up.
-            crc = self.crc_calc(reply_chr[1:-2]) # make crc error check?
-            try:
-                crc_ok = (reply[-2] == ord(crc[0]) and reply[-1] == ord(crc[1]))
-            except IndexError:
-                crc_ok = False
-            if crc_ok:
-                error = -1
-                return_val = reply[3:-2]
-                return return_val
-            else:
-                error = error + 1
+            reply = self.read_frame(start + self.reply_timeout)
+            if reply is not None:
+                if self.metrics is not None:
+                    self.metrics.observe('echo_inficon_round_trip_seconds', time.monotonic() - start, command=command[0])
+                return reply[3:-2]
+        if self.metrics is not None:
+            self.metrics.inc('echo_inficon_failed_commands_total')
         return 
 
+    def comm_many(self, commands):
+        """ Send several commands in one write and read the replies back in
+        order, so a burst costs one round trip instead of one per command.
+        Replies are matched to commands by their order only, so the burst
+        is all or nothing: every reply must start right where the last one
+        ended and nothing may be left over. Otherwise all of its replies
+        are dropped and each command is resent through comm(). Commands
+        left without a reply are None """
+        start = time.monotonic()
+        self.serial.reset_input_buffer()
+        self.serial.write(b''.join(self.frame(command) for command in commands))
+        replies = []
+        for command in commands:
+            reply = self.read_frame(time.monotonic() + self.reply_timeout, strict=True)
+            if reply is None:
+                break
+            replies.append(reply[3:-2])
+        if len(replies) == len(commands) and self.serial.in_waiting:
+            replies = []  # More bytes than the replies: one of them was not what it seemed
+        if self.metrics is not None:
+            self.metrics.observe('echo_inficon_round_trip_seconds', time.monotonic() - start, command='burst')
+            self.metrics.inc('echo_inficon_bursts_total')
+        if len(replies) == len(commands):
+            return replies
+        if self.metrics is not None:
+            self.metrics.inc('echo_inficon_burst_resends_total')
+        replies = []
+        for command in commands:
+            reply = self.comm(command)
+            if reply is None:
+                break  # Retries exhausted: the controller is gone, do not wait on the rest
+            replies.append(reply)
+        return replies + [None] * (len(commands) - len(replies))
+
+    def read_frame(self, deadline, strict=False):
+        """ Read one reply frame, returning as soon as it is complete.
+        A frame is '!', a length byte (payload length + 34), the payload
+        and two CRC bytes. Returns the whole frame as bytes, or None if the
+        frame is incomplete at the deadline (time.monotonic()) or fails the
+        CRC. Noise before the '!' is skipped, unless strict """
+        start = b''
+        while start != b'!':
+            start = self._read(1, deadline)
+            if not start or (strict and start != b'!'):
+                return None
+        length = self._read(1, deadline)
+        if not length or length[0] < 34:
+            return None
+        size = length[0] - 34 + 2 # payload and CRC
+        body = self._read(size, deadline)
+        if len(body) < size:
+            if self.metrics is not None:
+                self.metrics.inc('echo_inficon_short_replies_total')
+            return None
+        frame = start + length + body
+        if frame[-2:] == self.crc_bytes(memoryview(frame)[1:-2]):
+            return frame
+        if self.metrics is not None:
+            self.metrics.inc('echo_inficon_crc_failures_total')
+        return None
+
+    def _read(self, size, deadline):
+        """ Read up to size bytes, blocking no later than the deadline """
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return b''
+        self.serial.timeout = remaining
+        return self.serial.read(size)
+
+    @staticmethod
+    def crc_bytes(data):
+        """ Calculate the two crc bytes of a bytes-like object (bytes,
+        bytearray or memoryview) using the precomputed CRC_TABLE """
+        crc = CRC_INIT
+        table = CRC_TABLE
+        for byte in data:
+            crc = table[(crc ^ byte) & 0xff] ^ (crc >> 8)
+        return bytes(((crc & 0x7f) + 34, (crc >> 7) + 34))
+
     @staticmethod # This means the method can be called without an instance of the class
     def crc_calc(input_string):
-        """ Calculate crc value of command """
-        command_string = []
-        for i in range(0, len(input_string)):
-            command_string.append(ord(input_string[i])) # Input string is already in ordinal format. This is silly
-        crc = int('3fff', 16) # Convert 3fff (hexidecimal) to an integer in base 16
-        mask = int('2001', 16) # Convert 2001 (hexidecimal) to an integer in base 16
-        for command in command_string:
-            crc = command ^ crc
-            for i in range(0, 8):
-                old_crc = crc
-                crc = crc >> 1 # Bitwise right shift 
-                if old_crc % 2 == 1:
-                    crc = crc ^ mask
-        crc1_mask = int('1111111', 2)
-        crc1 = chr((crc & crc1_mask) + 34)
-        crc2 = chr((crc >> 7) + 34) 
-        return(crc1, crc2)
+        """ Calculate crc value of command, returned as two characters """
+        if isinstance(input_string, str):
+            input_string = input_string.encode('latin-1')
+        crc = inficon310C.crc_bytes(input_string)
+        return(chr(crc[0]), chr(crc[1]))
 
     def show_version(self):
         """ Read the firmware version """
@@ -97,10 +186,24 @@ class inficon310C(object):
         return value_string
         
 
+    def reconnect(self):
+        """ Close and reopen the serial port, e.g. after the USB adapter was
+        unplugged and plugged back in """
+        self.serial.close()
+        self.serial.open()
+
+    @staticmethod
+    def _replied(*values):
+        """ Raise IOError if a command got no valid reply after all retries """
+        if None in values:
+            raise IOError('No reply from the Inficon')
+        return values
+
     def rate(self, channel=1):
         """ Return the deposition rate """
         command = 'L' + str(channel)
         value_string = self.comm(command)
+        self._replied(value_string)
         rate = float(value_string)
         return rate
 
@@ -108,10 +211,32 @@ class inficon310C(object):
         """ Return the film thickness """
         command = 'N' + str(channel)
         value_string = self.comm(command)
+        self._replied(value_string)
         value_string = value_string.decode()
         thickness = str(value_string)
         return thickness
 
+    def rates(self, channels=(1, 2, 3)):
+        """ Return the deposition rates of several channels in one exchange """
+        values = self._replied(*self.comm_many(['L' + str(channel) for channel in channels]))
+        return [float(value) for value in values]
+
+    def thicknesses(self, channels=(1, 2, 3)):
+        """ Return the film thicknesses of several channels in one exchange """
+        values = self._replied(*self.comm_many(['N' + str(channel) for channel in channels]))
+        return [float(value.decode()) for value in values]
+
+    def snapshot(self, channels=(1, 2, 3)):
+        """ Return rates and thicknesses of several channels in one exchange
+        :return: {'rate': [rate, ...], 'thickness': [thickness, ...]}
+        :rtype: dict
+        """
+        commands = ['L' + str(channel) for channel in channels]
+        commands += ['N' + str(channel) for channel in channels]
+        values = self._replied(*self.comm_many(commands))
+        return {'rate': [float(value) for value in values[:len(channels)]],
+                'thickness': [float(value.decode()) for value in values[len(channels):]]}
+
     #def frequency(self, channel=1):
     """ Return the frequency of the crystal """
         #command = 'P' + str(channel)
@@ -136,10 +261,11 @@ class inficon310C(object):
         #Unlocks the relay back to instrument
         command2 = 'GE' + str(relay) + str(3)
         
-        response1 = str(self.comm(command1))
-        response2 = str(self.comm(command2))
+        response1 = self.comm(command1)
+        response2 = self.comm(command2)
         
-        if response1 == response2 == 'A':
+        # comm strips the 'A' status: an acknowledged command returns b''
+        if response1 == response2 == b'':
             return "Shutter Open"
         else:
             return "Failed"
@@ -155,10 +281,10 @@ class inficon310C(object):
         self.comm(command1)
         self.comm(command2)
         
-        response1 = str(self.comm(command1))
-        response2 = str(self.comm(command2))
+        response1 = self.comm(command1)
+        response2 = self.comm(command2)
         
-        if response1 == response2 == 'A':
+        if response1 == response2 == b'':
             return "Shutter Closed"
         else:
             return "Failed"
@@ -5,6 +5,7 @@ Code adapted from https://github.com/CINF/PyExpLabSys/blob/master/PyExpLabSys/dr
 """
 
 import time
+import threading
 import serial
 
 # Code translations constants
@@ -39,6 +40,7 @@ class TPG26x(object):
     * PR[1,2]: Pressure measurement (measurement data) gauge [1, 2]
     * PRX: Pressure measurement (measurement data) gauge 1 and 2
     * TID: Transmitter identification (gauge identification)
+    * COM: Continuous output of both gauges
     * UNI: Pressure unit
     * RST: RS232 test
     This class also contains the following class variables, for the specific
@@ -58,6 +60,8 @@ class TPG26x(object):
     ACK = chr(6)  # \x06
     NAK = chr(21)  # \x15
 
+    metrics = None  # Set to a monitor.metrics.Metrics to count NAKs
+
     def __init__(self, port='/dev/ttyS0', baudrate=9600):
         """Initialize internal variables and serial connection
         :param port: The COM port to open. See the documentation for
@@ -72,6 +76,10 @@ class TPG26x(object):
         # handshake. These are all default for Serial and therefore not input
         # below
         self.serial = serial.Serial(port=port, baudrate=baudrate, timeout=1)
+        # Continuous output mode, see start_continuous
+        self._reader = None
+        self._latest = None
+        self._mode = None
 
     def _cr_lf(self, string):
         """Pad carriage return and line feed to a string
@@ -87,15 +95,25 @@ class TPG26x(object):
         :param command: The command to send
         :type command: str
         :raises IOError: if the negative acknowledged or a unknown response
-            is returned
+            is returned, or the gauge is in continuous output mode
         """
+        if self.continuous:
+            # The command would end continuous output and its reply be lost in it
+            raise IOError('The gauge is in continuous output mode, no command can be sent')
+        start = time.monotonic()
         self.serial.write(self._cr_lf(command).encode())
         response = self.serial.readline()
+        if self.metrics is not None:
+            self.metrics.observe('echo_tpg_round_trip_seconds', time.monotonic() - start)
         
         if response == self._cr_lf(self.NAK).encode():
+            if self.metrics is not None:
+                self.metrics.inc('echo_tpg_naks_total')
             message = 'Serial communication returned negative acknowledge'
             raise IOError(message)
         elif response != self._cr_lf(self.ACK).encode():
+            if self.metrics is not None:
+                self.metrics.inc('echo_tpg_bad_responses_total')
             message = 'Serial communication returned unknown response:\n{}'\
                 ''.format(repr(response))
             raise IOError(message)
@@ -127,10 +145,13 @@ class TPG26x(object):
         self._send_command('PNR')
         return self._get_data()
 
-    def pressure_gauge(self, gauge=1):
-        """Return the pressure measured by gauge X
+    def pressure_gauge(self, gauge=1, max_age=5):
+        """Return the pressure measured by gauge X. In continuous output
+        mode, from the last line received
         :param gauge: The gauge number, 1 or 2
         :type gauge: int
+        :param max_age: oldest acceptable line in continuous output mode (s)
+        :type max_age: float
         :raises ValueError: if gauge is not 1 or 2
         :return: (value, (status_code, status_message))
         :rtype: tuple
@@ -138,28 +159,132 @@ class TPG26x(object):
         if gauge not in [1, 2]:
             message = 'The input gauge number can only be 1 or 2'
             raise ValueError(message)
+        if self.continuous:
+            return self.latest_pressures(max_age)[2 * (gauge - 1)]
         self._send_command('PR' + str(gauge))
         reply = self._get_data()
         status_code = int(reply.split(',')[0])
         value = float(reply.split(',')[1])
         return value
 
-    def pressure_gauges(self):
-        """Return the pressures measured by the gauges
+    def _parse_pressures(self, reply):
+        """Parse a PRX (or continuous output) reply of both gauges
+        :param reply: reply on the form x,sx.xxxxEsxx,y,sy.yyyyEsyy
+        :type reply: str
         :return: (value1, (status_code1, status_message1), value2,
             (status_code2, status_message2))
         :rtype: tuple
         """
-        self._send_command('PRX')
-        reply = self._get_data()
-        # The reply is on the form: x,sx.xxxxEsxx,y,sy.yyyyEsyy
-        status_code1 = int(reply.split(',')[0])
-        value1 = float(reply.split(',')[1])
-        status_code2 = int(reply.split(',')[2])
-        value2 = float(reply.split(',')[3])
+        fields = reply.split(',')
+        status_code1 = int(fields[0])
+        value1 = float(fields[1])
+        status_code2 = int(fields[2])
+        value2 = float(fields[3])
         return (value1, (status_code1, MEASUREMENT_STATUS[status_code1]),
                 value2, (status_code2, MEASUREMENT_STATUS[status_code2]))
 
+    def pressure_gauges(self, max_age=5):
+        """Return the pressures measured by the gauges. In continuous output
+        mode, from the last line received
+        :param max_age: oldest acceptable line in continuous output mode (s)
+        :type max_age: float
+        :return: (value1, (status_code1, status_message1), value2,
+            (status_code2, status_message2))
+        :rtype: tuple
+        """
+        if self.continuous:
+            return self.latest_pressures(max_age)
+        self._send_command('PRX')
+        return self._parse_pressures(self._get_data())
+
+    def start_continuous(self, mode=1, wait=2.5):
+        """Switch the gauge to continuous output of both pressures and parse
+        the lines on a background thread, so reading the pressure costs no
+        serial round trip at all (see latest_pressures). No other command
+        can be sent until stop_continuous is called.
+        :param mode: output interval, 0: 100 ms, 1: 1 s, 2: 1 min
+        :type mode: int
+        :param wait: wait up to this long for the first line (s), so a read
+            straight after does not count as a fault
+        :type wait: float
+        :raises IOError: if the gauge does not acknowledge
+        :returns: True if the first line has been received
+        :rtype: bool
+        """
+        self._send_command('COM,' + str(mode))
+        self.serial.write(self.ENQ.encode())
+        self._mode = mode
+        self._reader = threading.Thread(target=self._read_continuous, daemon=True)
+        self._reader.start()
+        deadline = time.monotonic() + wait
+        while self._latest is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return self._latest is not None
+
+    @property
+    def continuous(self):
+        """True while the gauge is in continuous output mode"""
+        return self._reader is not None
+
+    def _read_continuous(self):
+        """Keep the latest line of continuous output with its timestamp"""
+        while self._reader is threading.current_thread():   # until stopped or replaced
+            try:
+                line = self.serial.readline().decode(errors='replace')
+            except (serial.SerialException, OSError, TypeError):
+                break  # Port gone or closed; latest_pressures goes stale until reconnect
+            try:
+                self._latest = self._parse_pressures(line) + (time.monotonic(),)
+            except (ValueError, IndexError, KeyError):
+                pass  # Partial line after a timeout, or the ACK of the COM command
+
+    def latest_pressures(self, max_age=None, timestamp=False):
+        """Return the last pressures received in continuous output mode
+        :param max_age: oldest acceptable reading in seconds, None for any
+        :type max_age: float
+        :param timestamp: also return the time.monotonic() the line arrived
+        :type timestamp: bool
+        :raises IOError: if no (recent enough) reading has been received
+        :return: (value1, (status_code1, status_message1), value2,
+            (status_code2, status_message2)), followed by the arrival time
+            if timestamp
+        :rtype: tuple
+        """
+        latest = self._latest
+        if latest is None:
+            raise IOError('No continuous output received from the gauge')
+        if max_age is not None and time.monotonic() - latest[-1] > max_age:
+            raise IOError('Continuous output from the gauge stopped')
+        return latest if timestamp else latest[:-1]
+
+    def stop_continuous(self):
+        """Leave continuous output mode"""
+        reader, self._reader = self._reader, None
+        self.serial.write(self.ETX.encode())  # Any input ends continuous output
+        if reader is not None:
+            reader.join()
+        time.sleep(0.1)
+        self.serial.reset_input_buffer()  # Drop any output sent before the ETX
+        self._latest = None
+        self._mode = None
+
+    def reconnect(self):
+        """Close and reopen the serial port, e.g. after the USB adapter was
+        unplugged, and resume continuous output if it was on
+        :raises IOError: if the port cannot be opened or the gauge does not
+            acknowledge
+        """
+        mode, self._reader, self._latest = self._mode, None, None
+        self.serial.close()     # also ends a reader blocked in readline
+        self.serial.open()
+        # The gauge may still be in continuous output: stop it, and drop
+        # what it sent, so the next reply read is really the reply
+        self.serial.write(self.ETX.encode())
+        time.sleep(0.1)
+        self.serial.reset_input_buffer()
+        if mode is not None:
+            self.start_continuous(mode)
+
     def gauge_identification(self):
         """Return the gauge identication
         :return: (id_code_1, id_1, id_code_2, id_2)
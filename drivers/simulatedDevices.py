@@ -0,0 +1,475 @@
+"""
+Simulated ECHO instruments for running the monitor without hardware.
+Each device speaks the real wire protocol of its instrument:
+    * InficonSim:   Inficon SQC310C framed packets ('!', length, data, CRC)
+    * TPGSim:       Pfeiffer TPG 261 ACK/ENQ lines, including COM output
+    * EurothermSim: Modbus RTU holding registers of the Eurotherm TCU units
+and is served on a pseudo-terminal by a SimulatedPort, so the unmodified
+drivers open it like any serial port. Latency, jitter, dropped bytes and
+CRC faults can be injected per port with Faults.
+
+use:
+    echo = SimulatedECHO(faults=Faults(drop=0.001))
+    tcu, pcu, inf = echo.connect()
+    ...
+    echo.close()
+
+Linux and macOS only (uses pty). Try it from the repository root with
+    python -m drivers.simulatedDevices
+"""
+
+import os
+import pty
+import tty
+import termios
+import math
+import time
+import heapq
+import random
+import select
+import threading
+
+from drivers.inficonDriver import inficon310C
+
+
+class Chamber(object):
+    """ Shared physics of the evaporator: source temperatures follow the TCU
+    setpoints, deposition rates follow the source temperatures and the
+    crystals integrate the rates into thicknesses """
+
+    ROOM_T = 20.0
+
+    def __init__(self, sources=3, seed=None):
+        """
+        :param sources: number of sources (TCU unit n heats, Inficon channel n sees source n)
+        :param seed: seed of the measurement noise, for replayable runs
+        """
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.time = time.monotonic()
+        self.temperature = [self.ROOM_T] * sources
+        self.target_sp = [self.ROOM_T] * sources    # SP used in local mode
+        self.alt_sp = [self.ROOM_T] * sources       # remote SP, used in remote mode
+        self.working_sp = [self.ROOM_T] * sources   # SP after the ramp limit
+        self.remote = [False] * sources
+        self.ramp = [0.0] * sources                 # C/min, 0 for no limit
+        self.rate = [0.0] * sources                 # A/s
+        self.thickness = [0.0] * sources            # kA
+        self.shutter_open = False
+        self.base_pressure = 2.35e-6                # mbar
+
+        # Source time constant (s) and rate(T) = exp((T - rate_T) / rate_scale) A/s
+        self.tau = 30.0
+        self.rate_T = 150.0
+        self.rate_scale = 15.0
+
+    def step(self):
+        """ Advance the physics to now. Call with the lock held """
+        now = time.monotonic()
+        dt = now - self.time
+        self.time = now
+        if dt <= 0:
+            return
+        for i in range(len(self.temperature)):
+            target = self.alt_sp[i] if self.remote[i] else self.target_sp[i]
+            if self.ramp[i] > 0:
+                limit = self.ramp[i] / 60 * dt
+                self.working_sp[i] += max(-limit, min(limit, target - self.working_sp[i]))
+            else:
+                self.working_sp[i] = target
+            self.temperature[i] += (self.working_sp[i] - self.temperature[i]) * (1 - math.exp(-dt / self.tau))
+            self.rate[i] = math.exp((self.temperature[i] - self.rate_T) / self.rate_scale)
+            self.thickness[i] += self.rate[i] * dt / 1000
+
+    def read_rate(self, i):
+        return self.rate[i] + self.random.gauss(0, 0.01)
+
+    def read_pressure(self):
+        # Hot sources outgas a little
+        heating = sum(max(0, t - self.ROOM_T) for t in self.temperature)
+        return self.base_pressure * (1 + heating / 500) * (1 + self.random.gauss(0, 0.005))
+
+    def output_power(self, i):
+        """ Output power in % needed to hold the source at its temperature """
+        return max(0.0, min(100.0, (self.temperature[i] - self.ROOM_T) / 5 + (self.working_sp[i] - self.temperature[i]) * 2))
+
+
+class Faults(object):
+    """ Transport faults injected on replies """
+
+    def __init__(self, latency=0.001, jitter=0.0, drop=0.0, corrupt=0.0, seed=None):
+        """
+        :param latency: device turn-around time in s, before the reply starts
+        :param jitter: standard deviation of the latency in s
+        :param drop: probability of losing each byte of a reply
+        :param corrupt: probability of flipping a bit in a reply (CRC fault)
+        :param seed: seed for replayable fault sequences
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.drop = drop
+        self.corrupt = corrupt
+        self.random = random.Random(seed)
+
+    def delay(self):
+        return max(0.0, self.random.gauss(self.latency, self.jitter) if self.jitter else self.latency)
+
+    def apply(self, reply):
+        if self.drop:
+            reply = bytes(byte for byte in reply if self.random.random() >= self.drop)
+        if self.corrupt and reply and self.random.random() < self.corrupt:
+            reply = bytearray(reply)
+            reply[self.random.randrange(len(reply))] ^= 1 << self.random.randrange(7)
+            reply = bytes(reply)
+        return reply
+
+
+class SimulatedDevice(object):
+    """ Base class of the devices: bytes in, replies out """
+
+    baudrate = 9600
+
+    def __init__(self, chamber):
+        self.chamber = chamber
+        self.buffer = b''
+
+    def receive(self, data):
+        """ Take bytes written by the driver, return a list of replies """
+        raise NotImplementedError
+
+    def idle(self):
+        """ Return a list of unsolicited output (continuous modes) """
+        return []
+
+
+class InficonSim(SimulatedDevice):
+    """ Inficon SQC310C: '!', length (+34), command, two CRC bytes """
+
+    baudrate = 115200
+
+    def receive(self, data):
+        self.buffer += data
+        replies = []
+        while True:
+            start = self.buffer.find(b'!')
+            if start < 0:
+                self.buffer = b''
+                break
+            self.buffer = self.buffer[start:]
+            if len(self.buffer) < 2:
+                break
+            size = 2 + self.buffer[1] - 34 + 2
+            if len(self.buffer) < size:
+                break
+            frame, self.buffer = self.buffer[:size], self.buffer[size:]
+            if frame[-2:] != inficon310C.crc_bytes(frame[1:-2]):
+                continue  # The controller ignores corrupt commands
+            replies.append(self.reply(self.answer(frame[2:-2].decode('latin-1'))))
+        return replies
+
+    def reply(self, data):
+        payload = bytes((len(data) + 34,)) + data.encode('latin-1')
+        return b'!' + payload + inficon310C.crc_bytes(payload)
+
+    def answer(self, command):
+        """ Status character ('A' for ok) followed by the data """
+        chamber = self.chamber
+        with chamber.lock:
+            chamber.step()
+            try:
+                if command == '@':
+                    return 'ASQC-310C SIM Ver 1.00'
+                if command[0] == 'L':
+                    return 'A%.2f' % chamber.read_rate(int(command[1:]) - 1)
+                if command[0] == 'N':
+                    return 'A%.3f' % chamber.thickness[int(command[1:]) - 1]
+                if command[:2] == 'PA':
+                    return 'A0 %.1f 12' % (5980000.0 - 100 * chamber.thickness[int(command[2:]) - 1])
+                if command[:2] == 'GE':
+                    if command[3] in '12':
+                        chamber.shutter_open = command[3] == '1'
+                    return 'A'
+                if command[:2] == 'A1':
+                    return 'ASIM FILM'
+            except (ValueError, IndexError):
+                pass
+        return 'C'  # Invalid command
+
+
+class TPGSim(SimulatedDevice):
+    """ Pfeiffer TPG 261: one gauge, commands acknowledged, data on ENQ """
+
+    ENQ = b'\x05'
+    ETX = b'\x03'
+    INTERVALS = {0: 0.1, 1: 1.0, 2: 60.0}
+
+    def __init__(self, chamber):
+        super(TPGSim, self).__init__(chamber)
+        self.pending = None         # Command waiting for its ENQ
+        self.continuous = None      # Interval of continuous output
+        self.next_output = 0
+
+    def pressures(self):
+        with self.chamber.lock:
+            self.chamber.step()
+            p1 = self.chamber.read_pressure()
+        return '0,{:+.4E},5,{:+.4E}'.format(p1, 2.0e-2)
+
+    def data(self, command):
+        if command == 'PRX':
+            return self.pressures()
+        if command == 'PR1':
+            return self.pressures()[:13]
+        if command == 'PR2':
+            return '5,{:+.4E}'.format(2.0e-2)
+        if command == 'PNR':
+            return '302-515-SIM'
+        if command == 'TID':
+            return 'PKR,noSEn'
+        if command == 'UNI':
+            return '0'
+        return ''
+
+    def receive(self, data):
+        replies = []
+        if self.continuous is not None:
+            self.continuous = None  # Any input ends continuous output
+        self.buffer += data
+        while self.buffer:
+            if self.buffer[:1] in (self.ENQ, self.ETX):
+                byte, self.buffer = self.buffer[:1], self.buffer[1:]
+                if byte == self.ETX:
+                    self.pending = None
+                elif self.pending is not None and self.pending.startswith('COM'):
+                    mode = int(self.pending[4:] or 1) if self.pending[3:4] == ',' else 1
+                    self.continuous = self.INTERVALS.get(mode, 1.0)
+                    self.next_output = time.monotonic()
+                elif self.pending is not None:
+                    replies.append((self.data(self.pending) + '\r\n').encode())
+                continue
+            end = self.buffer.find(b'\n')
+            if end < 0:
+                break
+            line, self.buffer = self.buffer[:end].rstrip(b'\r').decode(errors='replace'), self.buffer[end + 1:]
+            if line.split(',')[0] in ('PRX', 'PR1', 'PR2', 'PNR', 'TID', 'UNI', 'COM', 'RST'):
+                self.pending = line
+                replies.append(b'\x06\r\n')
+            else:
+                self.pending = None
+                replies.append(b'\x15\r\n')
+        return replies
+
+    def idle(self):
+        if self.continuous is None or time.monotonic() < self.next_output:
+            return []
+        self.next_output += self.continuous
+        return [(self.pressures() + '\r\n').encode()]
+
+
+def modbus_crc(data):
+    """ Modbus RTU CRC-16, returned low byte first as on the wire """
+    crc = 0xffff
+    for byte in data:
+        crc ^= byte
+        for i in range(8):
+            crc = (crc >> 1) ^ 0xa001 if crc & 1 else crc >> 1
+    return bytes((crc & 0xff, crc >> 8))
+
+
+class EurothermSim(SimulatedDevice):
+    """ Eurotherm 3216 units of the TCU on one RS485 bus (Modbus RTU,
+    function 3 read holding registers and 6 write single register) """
+
+    PV, TARGET_SP, OUTPUT_POWER, SP1, ALT_SP, RAMP, REMOTE = 0x1, 0x2, 0x4, 0x18, 0x1a, 0x23, 0x114
+
+    def __init__(self, chamber, units=(1, 2, 3)):
+        super(EurothermSim, self).__init__(chamber)
+        self.units = units
+
+    def read_register(self, i, address):
+        chamber = self.chamber
+        if address == self.PV:
+            return int(round(chamber.temperature[i] * 10))
+        if address == self.TARGET_SP:
+            return int(round(chamber.target_sp[i] * 10))
+        if address == self.OUTPUT_POWER:
+            return int(round(chamber.output_power(i) * 100))
+        if address == self.ALT_SP:
+            return int(round(chamber.alt_sp[i] * 10))
+        if address == self.RAMP:
+            return int(round(chamber.ramp[i] * 10))
+        if address == self.REMOTE:
+            return int(chamber.remote[i])
+        return 0
+
+    def write_register(self, i, address, value):
+        chamber = self.chamber
+        if address in (self.TARGET_SP, self.SP1):
+            chamber.target_sp[i] = value / 10
+        elif address == self.ALT_SP:
+            chamber.alt_sp[i] = value / 10
+        elif address == self.RAMP:
+            chamber.ramp[i] = value / 10
+        elif address == self.REMOTE:
+            chamber.remote[i] = bool(value)
+
+    def receive(self, data):
+        self.buffer += data
+        replies = []
+        # Both supported requests are 8 bytes: unit, function, address, count/value, CRC
+        while len(self.buffer) >= 8:
+            frame = self.buffer[:8]
+            if modbus_crc(frame[:6]) != frame[6:]:
+                self.buffer = self.buffer[1:]  # Resynchronise
+                continue
+            self.buffer = self.buffer[8:]
+            unit, function = frame[0], frame[1]
+            address = int.from_bytes(frame[2:4], 'big')
+            value = int.from_bytes(frame[4:6], 'big')
+            if unit not in self.units:
+                continue  # Other units stay silent
+            i = self.units.index(unit)
+            with self.chamber.lock:
+                self.chamber.step()
+                if function == 3:
+                    registers = [self.read_register(i, address + n) & 0xffff for n in range(value)]
+                    reply = bytes((unit, 3, 2 * value)) + b''.join(r.to_bytes(2, 'big') for r in registers)
+                elif function == 6:
+                    self.write_register(i, address, value)
+                    reply = frame[:6]
+                else:
+                    reply = bytes((unit, function | 0x80, 1))  # Illegal function
+            replies.append(reply + modbus_crc(reply))
+        return replies
+
+
+class SimulatedPort(threading.Thread):
+    """ Serve a SimulatedDevice on a pseudo-terminal. Open .port with the
+    real driver as if it were /dev/ttyUSBx """
+
+    def __init__(self, device, faults=None):
+        super(SimulatedPort, self).__init__(daemon=True)
+        self.device = device
+        self.faults = faults or Faults()
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)  # No echo or line editing until the driver configures the port
+        self.fresh = termios.tcgetattr(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.bytes_in = 0       # bytes written by the driver
+        self.bytes_out = 0      # bytes sent back, after faults
+        self.outbox = []        # heap of (due time, sequence, bytes)
+        self.sequence = 0
+        self.last_due = 0
+        self.running = True
+        self.unplugged = False  # Device silent and deaf, as if its adapter was pulled
+
+    def send(self, reply):
+        """ Queue a reply, delivered after the latency and wire time """
+        reply = self.faults.apply(reply)
+        if not reply:
+            return
+        wire_time = len(reply) * 10 / self.device.baudrate  # 8N1 or 8E1 ~ 10 bits per byte
+        due = max(time.monotonic() + self.faults.delay(), self.last_due) + wire_time
+        self.last_due = due
+        heapq.heappush(self.outbox, (due, self.sequence, reply))
+        self.sequence += 1
+
+    def run(self):
+        while self.running:
+            timeout = 0.005
+            if self.outbox:
+                timeout = max(0, min(timeout, self.outbox[0][0] - time.monotonic()))
+            readable, _, _ = select.select([self.master], [], [], timeout)
+            if readable:
+                try:
+                    data = os.read(self.master, 4096)
+                except OSError:
+                    data = b''  # Driver side closed
+                self.bytes_in += len(data)
+                if self.unplugged:
+                    continue
+                for reply in self.device.receive(data):
+                    self.send(reply)
+            if self.unplugged:
+                self.outbox = []
+                continue
+            for output in self.device.idle():
+                self.send(output)
+            while self.outbox and self.outbox[0][0] <= time.monotonic():
+                reply = heapq.heappop(self.outbox)[2]
+                os.write(self.master, reply)
+                self.bytes_out += len(reply)
+
+    def unplug(self):
+        self.unplugged = True
+
+    def plug(self):
+        """ Back as a fresh device node. Linux refuses to configure a pty
+        again once a driver has set parity, unlike a real adapter """
+        termios.tcsetattr(self.slave, termios.TCSANOW, self.fresh)
+        self.unplugged = False
+
+    def close(self):
+        self.running = False
+        self.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+class SimulatedECHO(object):
+    """ The three ECHO instruments around one simulated chamber """
+
+    def __init__(self, faults=None, seed=None):
+        """
+        :param faults: Faults applied to every port, or a dict of
+            {'tcu': Faults, 'inficon': Faults, 'tpg': Faults}
+        :param seed: seed of the chamber noise
+        """
+        if not isinstance(faults, dict):
+            faults = {'tcu': faults, 'inficon': faults, 'tpg': faults}
+        self.chamber = Chamber(seed=seed)
+        self.ports = {
+            'tcu': SimulatedPort(EurothermSim(self.chamber), faults.get('tcu')),
+            'inficon': SimulatedPort(InficonSim(self.chamber), faults.get('inficon')),
+            'tpg': SimulatedPort(TPGSim(self.chamber), faults.get('tpg')),
+        }
+        for port in self.ports.values():
+            port.start()
+
+    def connect(self):
+        """ Open the real drivers on the simulated ports
+        :return: (tcu, pcu, inf), the drivers recordECHO in echo-monitor.py takes
+        """
+        from drivers.eurothermDriver import TCU
+        from drivers.pressureDriver import TPG261
+
+        tcu = TCU({"method": "rtu",
+                   "port": self.ports['tcu'].port,
+                   "parity": 'E',
+                   "baudrate": 9600,
+                   "bytesize": 8})
+        pcu = TPG261(port=self.ports['tpg'].port)
+        inf = inficon310C(port=self.ports['inficon'].port)
+        return tcu, pcu, inf
+
+    def unplug(self, name):
+        """ Silence one instrument ('tcu', 'inficon' or 'tpg') until plug """
+        self.ports[name].unplug()
+
+    def plug(self, name):
+        self.ports[name].plug()
+
+    def close(self):
+        for port in self.ports.values():
+            port.close()
+
+
+if __name__ == "__main__":
+    echo = SimulatedECHO()
+    tcu, pcu, inf = echo.connect()
+
+    #Test driver functionality against the simulator
+    print(inf.show_version())
+    print('Rates and thicknesses:', inf.snapshot())
+    print('Pressures:', pcu.pressure_gauges())
+    print('TCU:', tcu.read_block())
@@ -6,94 +6,361 @@
   Created:  17/02/19
 """
 
-from drivers.eurothermDriver import TCU
-from drivers.inficonDriver import inficon310C
-from drivers.pressureDriver import TPG261
+from monitor.polling import Poller
+from monitor.logsink import CSVLogSink
+from monitor.binlog import BinaryLogSink
+from monitor.derived import Derived
+from monitor.adaptive import ProcessState, TICK
+from monitor.control import RateController, parse_loop
+from monitor import config
 
+import os
 import datetime
-import csv
-from time import sleep
+import argparse
+import threading
 
 
 # ----------------------------------------------------------------------
-def makeConnections():
-        """Make connections to all drives"""
+def temperatureReader(tcu, channels=(1, 2, 3), sources=None):
+        """Return a function reading all TCU channels, logged as the
+        Temp of their sources (the channel numbers by default)"""
+        sources = sources or channels
 
-        tempUnitConnectionPars = {
-                "method": "rtu",
-                "port": '/dev/ttyUSB0',
-            "parity": 'E',
-                          "baudrate": 9600,
-                          "bytesize": 8
-        }
+        def read():
+                block = tcu.read_block(channels, registers=('readPV',))  # One Modbus request per unit
+                return {'Temp %d' % n: block[ch]['readPV'] for ch, n in zip(channels, sources)}
 
-        tempUnit = TCU(tempUnitConnectionPars)
-        pressureUnit = TPG261(port='/dev/ttyUSB2')
-        inficon = inficon310C(port='/dev/ttyUSB1')
+        return read
 
-        return tempUnit, pressureUnit, inficon
+
+# ----------------------------------------------------------------------
+def inficonReader(inf, channels=(1, 2, 3), sources=None):
+        """Return a function reading rate and thickness of all Inficon channels"""
+        sources = sources or channels
+
+        def read():
+                snapshot = inf.snapshot(channels)                       # One exchange for all channels
+                values = {'Rate %d' % n: rate for n, rate in zip(sources, snapshot['rate'])}
+                values.update({'Thick %d' % n: thick for n, thick in zip(sources, snapshot['thickness'])})
+                return values
+
+        return read
 
 
 # ----------------------------------------------------------------------
-def recordECHO(tcu, pcu, inf):
-        """Continuosly check ECHO status"""
+def pressureReader(pcu):
+        """Return a function reading both gauges of the pressure unit"""
 
-        # Path and filename of data
+        def read():
+                # An IOError is logged by the poller as a gap, TPG Status FAULT
+                if pcu.continuous:                       # No serial traffic at all
+                        p1, s1, p2, s2 = pcu.latest_pressures(max_age=5)
+                else:
+                        p1, s1, p2, s2 = pcu.pressure_gauges()
+                return {'Pressure': p1, 'Pressure Status': s1[0],
+                        'Pressure 2': p2, 'Pressure 2 Status': s2[0]}
+
+        return read
+
+
+# ----------------------------------------------------------------------
+def instrumentReader(instrument):
+        """Return the read function of a connected instrument (monitor/config.py)"""
+        if instrument.kind == 'eurotherm':
+                return temperatureReader(instrument.driver, instrument.channels, instrument.sources)
+        if instrument.kind == 'inficon':
+                return inficonReader(instrument.driver, instrument.channels, instrument.sources)
+        return pressureReader(instrument.driver)
+
+
+# ----------------------------------------------------------------------
+def logHeader(setpoints=(), chamber=None):
+        """Return the columns of the log of a chamber (monitor/config.py),
+        the ECHO by default, with the setpoint of the sources under rate
+        control (monitor/control.py)"""
+        if chamber is None:
+                chamber = config.default()[0]
+
+        header = ['Sample', 'Time', 'Monotonic'] + chamber.columns()
+        # When each instrument was read, to see the latency it adds (time.monotonic())
+        for instrument in chamber.instruments:
+                header += [instrument.name + ' Status', instrument.name + ' Start', instrument.name + ' End']
+        # Process state setting the sampling rates (monitor/adaptive.py), blank at a fixed period
+        header += ['State']
+        header += ['Temp %d Setpoint' % ch for ch in setpoints]
+        return header
+
+
+# ----------------------------------------------------------------------
+def openLogs(header, path='saved-logs/', name='ECHO'):
+        """Create a new log of chamber `name` and return (sinks, filename).
+        A log started in the same minute as an existing one also gets the
+        seconds in its name."""
+
+        os.makedirs(path, exist_ok=True)
         now = datetime.datetime.now()
-        path = 'saved-logs/'
-        filename = str(str(now.date()) + '-' + str(now.hour) + '-' + str(now.minute) + '-ECHO-LOG.csv')
+        filename = str(str(now.date()) + '-' + str(now.hour) + '-' + str(now.minute) + '-' + name + '-LOG.csv')
+        if os.path.exists(path + filename):
+                filename = filename.replace('-' + name + '-LOG', '-' + str(now.second) + '-' + name + '-LOG')
+
+        # CSV for reading by eye, binary for fast loading (monitor/binlog.py)
+        sinks = [CSVLogSink(str(path + filename), header),
+                 BinaryLogSink(str(path + filename[:-4] + '.bin'), header)]
+        return sinks, filename
+
+
+# ----------------------------------------------------------------------
+def recordECHO(tcu, pcu, inf, period=2, **options):
+        """Continuosly check ECHO status, from its connected drivers. See
+        recordChamber for the options."""
+        chamber = config.default()[0]
+        chamber['TCU'].driver, chamber['TPG'].driver, chamber['Inficon'].driver = tcu, pcu, inf
+        recordChamber(chamber, period=period, **options)
+
+
+# ----------------------------------------------------------------------
+def recordChamber(chamber, period=None, sample_max=None, serve=None, ring=None, stop=None, derived=None,
+                  adaptive=None, rotate=6 * 3600, control=None, quiet=False, metrics=None):
+        """Continuosly record a chamber (monitor/config.py) whose instruments
+        are connected
+
+        period: seconds between samples, the chamber's period or 2 if None
+
+        sample_max: samples to record, forever (until interrupted) if None
+        serve: Unix socket path to share the instruments and latest sample
+        with other programs while recording (monitor/server.py)
+        ring: SampleRing (monitor/ringbuffer.py) receiving every sample, for
+        live consumers in the same process. Needs a column per header entry.
+        stop: threading.Event ending the recording when set, for when it does
+        not run in the main thread and so never sees a KeyboardInterrupt
+        derived: Derived stage (monitor/derived.py) adding smoothed rates and
+        heating rates to each sample for the server and ring. They are not
+        logged: derive() recomputes them from a log.
+        adaptive: ProcessState (monitor/adaptive.py) setting how often each
+        instrument is read, or None to read all of them every period. A
+        sample then only holds the instruments read at that tick.
+        rotate: seconds after which the log is closed and a new one started,
+        so a run of days stays in files of a manageable size. None for one log.
+        control: RateController (monitor/control.py) holding sources at a
+        target rate from the samples. Its setpoints are logged.
+        quiet: do not show the samples on the terminal, for all but one of
+        the chambers recorded at once
+        metrics: Metrics (monitor/metrics.py) counting the reads, retries and
+        control writes of this chamber, labelled with its name
+        """
+
+        # Path and filename of data
+        path = chamber.logs
+        period = period or chamber.period or 2
 
         # Create file and add header
-        with open(str(path + filename), 'x') as f:
-                writer = csv.writer(f)
-                header = ['Sample', 'Temp 1', 'Temp 2', 'Temp 3', 'Rate 1', 'Rate 2', 'Rate 3', 'Thick 1', 'Thick 2', 'Thick 3', 'Pressure']
-                writer.writerow(header)
+        display = ['Sample'] + chamber.display()
+        header = logHeader(control.sources if control is not None else (), chamber)
+        sinks, filename = openLogs(header, path, chamber.name)
+
+        # One worker per serial port, so a slow instrument only delays itself.
+        # One which fails is logged as a gap and reconnected, see monitor/polling.py
+        instruments = {instrument.name: instrument.driver for instrument in chamber.instruments}
+        poller = Poller({instrument.name: instrumentReader(instrument) for instrument in chamber.instruments},
+                        period=period,
+                        reconnects={name: driver.reconnect for name, driver in instruments.items()},
+                        tick=None if adaptive is None else TICK)
+        if adaptive is not None:
+                poller.set_periods(chamber.periods(adaptive.periods()))
+        if control is not None:
+                control.start(poller, chamber)
+        if metrics is not None:
+                metrics.attach(poller, *poller.workers, *instruments.values(),
+                               *([control] if control is not None else []), chamber=chamber.name)
 
-        sample = 0
-        sample_max = 21600  # 12 hours taking recordings every 2 secs
+        if derived is None:
+                derived = Derived(chamber.derived_columns())
 
-        print ('\n')
-        print ('-' * 124)
-        print ('{:>4}{:>12}{:>12}{:>12}{:>12}{:>12}{:>12}{:>12}{:>12}{:>12}{:>12}'.format(
-                'Time', 'Temp 1', 'Temp 2', 'Temp 3', 'Rate 1', 'Rate 2', 'Rate 3', 'Thick 1', 'Thick 2', 'Thick 3', 'Pressure'))
+        server = None
+        if serve:
+                from monitor.server import MonitorServer
+                server = MonitorServer(serve, poller, chamber)
+                server.start()
 
-        print ('-' * 124)
+        row = '{:>4}' + '{:>12}' * (len(display) - 1)
+        if not quiet:
+                print ('\n')
+                print ('-' * (4 + 12 * (len(display) - 1)))
+                print (row.format('Time', *display[1:]))
 
+                print ('-' * (4 + 12 * (len(display) - 1)))
+
+        latest = {}                                             # Last value of every column, for the display and state
+        opened = None
+        reason = 'error'
         try:
                 # while un-interrupted by the keyboard, record the following data
-                while sample < sample_max:
-                        t1 = float(tcu.read_T(1))				# Temperature channel 1
-                        t2 = float(tcu.read_T(2))				# Temperature channel 2
-                        t3 = float(tcu.read_T(3))				# Temperature channel 3
-                        i1 = float(inf.rate(1))					# Inficon channel 1
-                        i2 = float(inf.rate(2))					# Inficon channel 2
-                        i3 = float(inf.rate(3))					# Inficon channel 3
-                        th1 = float(inf.thickness(1))			        # Inficon channel 1
-                        th2 = float(inf.thickness(2))			        # Inficon channel 2
-                        th3 = float(inf.thickness(3))			        # Inficon channel 3
+                with poller:
+                        for record in poller.run(sample_max):
+                                if stop is not None and stop.is_set():
+                                        reason = 'interrupted'
+                                        break
+                                derived.process(record)
+                                if control is not None:
+                                        control.process(record)
+                                latest.update(record)
+                                if adaptive is not None:
+                                        if adaptive.update(latest, record['Monotonic']):
+                                                poller.set_periods(chamber.periods(adaptive.periods()))
+                                        record['State'] = adaptive.state
+                                if server is not None:
+                                        server.update(record)
+                                if ring is not None:
+                                        ring.append(record)
 
-                        try:
-                                p = pcu.pressure_gauge(gauge=1)		        # Pressure
-                        except IOError:
-                                p = 1010                                        # Atmospheric pressure
+                                if opened is None:
+                                        opened = record['Monotonic']
+                                elif rotate and record['Monotonic'] - opened >= rotate:
+                                        for sink in sinks:
+                                                sink.close('rotated')
+                                        print('\nLogfile saved:', path, filename)
+                                        sinks, filename = openLogs(header, path, chamber.name)
+                                        opened = record['Monotonic']
+
+                                # Instruments which were not read this sample are left blank
+                                log = [record.get(column, '') for column in header]
 
-                        print('{:>4}{:>12}{:>12}{:>12}{:>12}{:>12}{:>12}{:>12}{:>12}{:>12}{:>12}'.format(sample, t1, t2, t3, i1, i2, i3, th1, th2, th3, p), end='\r')
-                        log = [sample, t1, t2, t3, i1, i2, i3, th1, th2, th3, p]
-                        
-                        # Append readings to log file
-                        with open(str(path + filename), 'a') as f:
-                                writer = csv.writer(f)
-                                writer.writerow(log)
+                                if not quiet:
+                                        print(row.format(*[latest.get(column, '') for column in display]), end='\r')
 
-                        sample += 1
-                        sleep(2)
+                                # Append readings to log file (flushed in batches)
+                                for sink in sinks:
+                                        sink.write(log)
+
+                if reason != 'interrupted':
+                        reason = 'complete'
 
         except KeyboardInterrupt:
                 print('\nInterrupted!\n')
+                reason = 'interrupted'
+
+        finally:
+                if server is not None:
+                        server.close()
+                for sink in sinks:
+                        sink.close(reason)
 
         print('\nLogfile saved:', path, filename)
 
 
 if __name__ == "__main__":
-        tcu, pcu, inf = makeConnections()
-        recordECHO(tcu, pcu, inf)
+        parser = argparse.ArgumentParser(
+                description=__doc__,
+                formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument('--config', default=config.DEFAULT, metavar='FILE',
+                            help="Chambers and instruments to record, all at once (default chambers.toml, "
+                                 "see monitor/config.py)")
+        parser.add_argument('--simulate', action='store_true',
+                            help="Record from simulated instruments (drivers/simulatedDevices.py) instead of their ports")
+        parser.add_argument('--metrics-port', type=int,
+                            help="Serve driver and loop metrics on http://localhost:PORT/metrics")
+        parser.add_argument('--serve', metavar='SOCKET',
+                            help="Share the instruments of the first chamber with other programs over this Unix socket")
+        parser.add_argument('--live', action='store_true',
+                            help="Plot the first chamber live while recording (monitor/dashboard.py)")
+        parser.add_argument('--fixed-period', type=float, metavar='S',
+                            help="Read every instrument each S seconds, instead of faster while "
+                                 "depositing or heating and slower while idle (monitor/adaptive.py)")
+        parser.add_argument('--hold-rate', type=parse_loop, action='append', default=[], metavar='SOURCE:RATE[:THICK]',
+                            help="Hold SOURCE of the first chamber at RATE A/s by moving its TCU setpoint. "
+                                 "With THICK, open the shutter once the rate settles and close it after THICK kA "
+                                 "(monitor/control.py). May be repeated.")
+        parser.add_argument('--rotate', type=float, default=6, metavar='HOURS',
+                            help="Start a new log every HOURS hours, 0 for one log (default %(default)s)")
+        args = parser.parse_args()
+
+        try:
+                chambers = config.load(args.config)
+        except (OSError, ValueError) as error:
+                parser.error(str(error))
+        controller = RateController(args.hold_rate) if args.hold_rate else None
+        if controller is not None:
+                try:
+                        controller.configure(chambers[0])
+                except ValueError as error:
+                        parser.error('--hold-rate: ' + str(error))
+
+        metrics = None
+        if args.metrics_port:
+                from monitor.metrics import Metrics
+                metrics = Metrics()
+                metrics.serve(port=args.metrics_port)
+
+        for chamber in chambers:
+                if args.simulate:
+                        chamber.simulate()
+                else:
+                        chamber.connect()
+
+        # Each chamber has its own poller, so they are all sampled at their
+        # own rates however many there are; only the first is shown
+        stop = threading.Event()
+        options = []
+        for i, chamber in enumerate(chambers):
+                chamberOptions = {'rotate': args.rotate * 3600, 'serve': chamber.serve,
+                                  'quiet': i > 0, 'stop': stop, 'metrics': metrics}
+                if args.fixed_period:
+                        chamberOptions['period'] = args.fixed_period
+                elif not chamber.period:
+                        chamberOptions['adaptive'] = ProcessState(channels=chamber.sources())
+                options.append(chamberOptions)
+        if args.serve:
+                options[0]['serve'] = args.serve
+        if controller is not None:
+                options[0]['control'] = controller
+
+        gauges = [instrument for chamber in chambers for instrument in chamber.instruments
+                  if instrument.kind == 'tpg261']
+        recorders = []
+        try:
+                for gauge in gauges:
+                        # Both gauges every second, waiting for the first line so the
+                        # first sample is not a fault. A gauge which does not answer
+                        # is polled instead, its reads logged as faults until it does.
+                        try:
+                                if not gauge.driver.start_continuous(mode=1):
+                                        print('{}: no continuous output yet'.format(gauge.name))
+                        except IOError as error:
+                                print('{}: continuous output not started, polling it: {}'.format(gauge.name, error))
+
+                recorders = [threading.Thread(target=recordChamber, args=(chamber,), kwargs=chamberOptions)
+                             for chamber, chamberOptions in zip(chambers[1:], options[1:])]
+                for recorder in recorders:
+                        recorder.start()
+                if args.live:
+                        from monitor.ringbuffer import SampleRing
+                        from monitor.dashboard import Dashboard, RingSource
+
+                        # The window needs the main thread, so record in the background;
+                        # the dashboard only reads the ring and never holds up a sample.
+                        # It keeps its own decimated history of the run, so the ring only
+                        # needs the samples between refreshes: a minute of the fastest.
+                        derived = Derived(chambers[0].derived_columns())
+                        fastest = min(TICK, args.fixed_period or chambers[0].period or TICK)
+                        ring = SampleRing(logHeader([loop.source for loop in args.hold_rate], chambers[0]) + derived.columns,
+                                          capacity=int(60 / fastest))
+                        options[0].update(ring=ring, derived=derived)
+                        recorder = threading.Thread(target=recordChamber, args=(chambers[0],), kwargs=options[0])
+                        recorder.start()
+                        recorders.append(recorder)
+                        try:
+                                Dashboard(RingSource(ring)).show()
+                        except KeyboardInterrupt:
+                                pass
+                else:
+                        recordChamber(chambers[0], **options[0])
+        finally:
+                stop.set()                                      # One ended: end the logs of all
+                for recorder in recorders:
+                        recorder.join()
+                for gauge in gauges:
+                        if gauge.driver.continuous:
+                                try:
+                                        gauge.driver.stop_continuous()
+                                except IOError as error:
+                                        print('{}: continuous output not stopped: {}'.format(gauge.name, error))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+#coding:utf-8
+"""
+  Purpose:  Sampling rates which follow the state of the process. The
+            Inficon is read fast while a source is depositing or heating,
+            the temperatures and pressure slowly while the chamber idles or
+            pumps down, instead of every instrument every 2 s all run.
+  Created:  18/10/26
+
+  The state is worked out from the latest readings and derived columns
+  (monitor/derived.py), highest first:
+
+    DEPOSITING  a smoothed rate above RATE_ON, or a rate from the
+                thickness above THICK_ON
+    HEATING     a source temperature changing faster than SLOPE_ON
+    PUMPING     pressure above PUMPED
+    IDLE        none of these
+
+  A higher state is entered straight away, a lower one only after the
+  higher one has not been seen for `hold` seconds, so the rates do not
+  flap at a threshold.
+
+    state = ProcessState()
+    if state.update(latest, now):           # True when it changed
+        poller.set_periods(state.periods())
+"""
+
+IDLE = 0
+PUMPING = 1
+HEATING = 2
+DEPOSITING = 3
+
+NAMES = {IDLE: 'idle', PUMPING: 'pumping', HEATING: 'heating', DEPOSITING: 'depositing'}
+
+# Seconds between reads of each instrument, per state
+PERIODS = {
+    DEPOSITING: {'Inficon': 0.1, 'TCU': 1.0, 'TPG': 2.0},
+    HEATING: {'Inficon': 0.5, 'TCU': 1.0, 'TPG': 2.0},
+    PUMPING: {'Inficon': 2.0, 'TCU': 5.0, 'TPG': 5.0},
+    IDLE: {'Inficon': 2.0, 'TCU': 5.0, 'TPG': 10.0},
+}
+
+TICK = 0.1          # s, the shortest period
+RATE_ON = 0.05      # A/s
+# A/s. The thickness is read in 1 A counts, and a single count over the 5
+# sample window of 'Rate n Thick' is 2.5 A/s at the 0.1 s Inficon period
+THICK_ON = 3.0
+SLOPE_ON = 2.0      # C/min
+PUMPED = 1e-4       # mbar
+HOLD = 30           # s
+
+
+def classify(latest, channels=(1, 2, 3)):
+    """State shown by one set of readings, {column: value}. Missing and NaN
+    values count as nothing happening."""
+
+    def above(column, threshold):
+        value = latest.get(column)
+        return value is not None and value != '' and abs(float(value)) > threshold
+
+    for ch in channels:
+        if above('Rate %d EWMA' % ch, RATE_ON) or above('Rate %d Thick' % ch, THICK_ON):
+            return DEPOSITING
+    for ch in channels:
+        if above('Temp %d Slope' % ch, SLOPE_ON):
+            return HEATING
+    if above('Pressure', PUMPED):
+        return PUMPING
+    return IDLE
+
+
+class ProcessState(object):
+    """State of the process with hysteresis, and the sampling periods for it"""
+
+    def __init__(self, periods=None, hold=HOLD, channels=(1, 2, 3)):
+        """
+        :param periods: {state: {instrument name: s}}, PERIODS if None
+        :param hold: time (s) a higher state is kept after it was last seen
+        """
+        self.table = periods or PERIODS
+        self.hold = hold
+        self.channels = channels
+        self.state = IDLE
+        self.seen = None        # when the current state was last seen
+
+    def update(self, latest, now):
+        """Take new readings, `now` being a monotonic time in s. Returns True
+        if the state changed."""
+        state = classify(latest, self.channels)
+        if state >= self.state:
+            changed = state != self.state
+        elif self.seen is None or now - self.seen >= self.hold:
+            changed = True
+        else:
+            return False
+        self.state = state
+        self.seen = now
+        return changed
+
+    def periods(self):
+        """{instrument name: s} for the current state"""
+        return self.table[self.state]
+
+    @property
+    def name(self):
+        return NAMES[self.state]
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+#coding:utf-8
+"""
+  Purpose:  Index of the recorded runs. Every log in saved-logs/ is read
+            once and summarised into a SQLite catalogue: start, duration,
+            min/max/mean/final of every temperature, rate, thickness and
+            pressure column, and the shutter intervals inferred from the
+            rates. Later updates only read the logs which are new or have
+            changed since, so finding runs across years of logs is a query
+            rather than opening every file.
+  Created:  18/10/26
+
+  Tables:
+    runs      run, path, mtime, size, start, duration (s), samples, closed
+    stats     run, name, min, max, mean, final     (one row per column)
+    shutters  run, channel, open, close            (s from the start)
+
+  use:
+    python -m monitor.archive update saved-logs
+    python -m monitor.archive query "Rate 2 max > 1" "Pressure min < 5e-6"
+    python -m monitor.archive query "duration > 3600" --sql
+"""
+
+import os
+import re
+import sys
+import glob
+import sqlite3
+import datetime
+import argparse
+
+from monitor import binlog
+from monitor.tailreader import LogTail
+
+DATABASE = 'saved-logs/archive.sqlite'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run TEXT PRIMARY KEY,       -- log path without its extension
+    path TEXT, mtime REAL, size INTEGER,
+    start TEXT, duration REAL, samples INTEGER,
+    closed TEXT                 -- reason in the csv trailer, NULL if none
+);
+CREATE TABLE IF NOT EXISTS stats (
+    run TEXT, name TEXT, min REAL, max REAL, mean REAL, final REAL,
+    PRIMARY KEY (run, name)
+);
+CREATE TABLE IF NOT EXISTS shutters (
+    run TEXT, channel INTEGER, open REAL, close REAL
+);
+CREATE INDEX IF NOT EXISTS shutters_run ON shutters (run);
+'''
+
+# Summarised columns, by unit (see binlog.UNITS)
+SUMMARY_UNITS = {'C', 'A/s', 'kA', 'mbar'}
+# A source is taken to be depositing while its rate is above this (A/s),
+# for at least SHUTTER_SAMPLES samples in a row
+SHUTTER_RATE = 0.05
+SHUTTER_SAMPLES = 3
+# Seconds per sample of the logs without timestamps
+SAMPLE_PERIOD = 2
+
+RUN_FIELDS = {'start', 'duration', 'samples', 'closed'}
+STAT_FIELDS = {'min', 'max', 'mean', 'final'}
+CONDITION = re.compile(r'^\s*(.+?)\s*(<=|>=|!=|<|>|=)\s*(\S+)\s*$')
+FILENAME = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})-(\d{1,2})-(\d{1,2})(?:-(\d{1,2}))?-\w+?-LOG')
+
+
+def connect(database=DATABASE):
+    db = sqlite3.connect(database)
+    db.executescript(SCHEMA)
+    return db
+
+
+def findRuns(directory):
+    """Return {run: log path} of the logs under a directory, preferring the
+    binary log of a run which has both"""
+    runs = {}
+    for path in sorted(glob.glob(os.path.join(directory, '**', '*-LOG.*'), recursive=True)):
+        run, ext = os.path.splitext(path)
+        if ext == '.bin' or (ext == '.csv' and run not in runs):
+            runs[run] = path
+    return runs
+
+
+def loadRun(path):
+    """Return the samples of a csv or binary log"""
+    if path.endswith('.bin'):
+        data, units = binlog.load(path)
+        return data
+    return LogTail(path).read()
+
+
+def closedReason(run):
+    """Reason in the trailer of the run's csv log, None if it has none (the
+    monitor was killed, or there is only a binary log)"""
+    try:
+        with open(run + '.csv', 'rb') as log:
+            log.seek(max(0, os.fstat(log.fileno()).st_size - 256))
+            lines = log.read().decode(errors='replace').splitlines()
+    except OSError:
+        return None
+    if lines and lines[-1].startswith('# closed'):
+        return lines[-1].rsplit(',', 1)[-1].strip()
+    return None
+
+
+def elapsed(data):
+    """Seconds since the first sample"""
+    names = data.dtype.names
+    if 'Monotonic' in names and len(data) and data['Monotonic'][0] == data['Monotonic'][0]:
+        return data['Monotonic'] - data['Monotonic'][0]
+    return (data['Sample'] - data['Sample'][0]) * SAMPLE_PERIOD
+
+
+def startTime(data, path):
+    """ISO start time, from the Time column or else the log name"""
+    if 'Time' in data.dtype.names and len(data) and data['Time'][0] == data['Time'][0]:
+        return datetime.datetime.fromtimestamp(data['Time'][0]).isoformat(timespec='seconds')
+    match = FILENAME.search(os.path.basename(path))
+    if match:
+        return datetime.datetime(*[int(part) for part in match.groups() if part]).isoformat(timespec='seconds')
+    return None
+
+
+def shutterIntervals(seconds, rate):
+    """(open, close) times of the stretches where a source was depositing.
+    Rows in which the rate was not read are skipped."""
+    import numpy as np
+
+    read = np.isfinite(rate)
+    seconds, rate = np.asarray(seconds)[read], np.asarray(rate)[read]
+    depositing = np.concatenate([[False], rate > SHUTTER_RATE, [False]])
+    edges = np.flatnonzero(np.diff(depositing.astype(np.int8)))
+    intervals = []
+    for first, end in zip(edges[::2], edges[1::2]):
+        if end - first >= SHUTTER_SAMPLES:
+            intervals.append((float(seconds[first]), float(seconds[end - 1])))
+    return intervals
+
+
+def summarise(data):
+    """Return [(name, min, max, mean, final)] of the summarised columns"""
+    import numpy as np
+
+    rows = []
+    for name, unit in zip(data.dtype.names, binlog.units_for(data.dtype.names)):
+        if unit not in SUMMARY_UNITS:
+            continue
+        values = np.asarray(data[name])
+        values = values[np.isfinite(values)]
+        if len(values):
+            rows.append((name, float(values.min()), float(values.max()), float(values.mean()), float(values[-1])))
+        else:
+            rows.append((name, None, None, None, None))
+    return rows
+
+
+def indexRun(db, run, path):
+    """(Re)write the summary of one run"""
+    data = loadRun(path)
+    stat = os.stat(path)
+    if len(data):
+        seconds = elapsed(data)
+        duration = float(seconds[-1])
+    else:
+        seconds, duration = [], 0.0
+
+    db.execute('DELETE FROM stats WHERE run = ?', (run,))
+    db.execute('DELETE FROM shutters WHERE run = ?', (run,))
+    db.execute('INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+               (run, path, stat.st_mtime, stat.st_size, startTime(data, path), duration, len(data), closedReason(run)))
+    db.executemany('INSERT INTO stats VALUES (?, ?, ?, ?, ?, ?)',
+                   [(run,) + row for row in summarise(data)])
+    for name in data.dtype.names:
+        if name.startswith('Rate ') and name[5:].isdigit() and len(data):
+            db.executemany('INSERT INTO shutters VALUES (?, ?, ?, ?)',
+                           [(run, int(name[5:]), opened, closed)
+                            for opened, closed in shutterIntervals(seconds, data[name])])
+
+
+def update(db, directory='saved-logs'):
+    """Index the new and changed logs of a directory, and forget the removed
+    ones. Returns (indexed, unchanged, removed) counts."""
+    runs = findRuns(directory)
+    known = {run: (path, mtime, size) for run, path, mtime, size
+             in db.execute('SELECT run, path, mtime, size FROM runs')}
+
+    indexed = unchanged = 0
+    with db:
+        for run, path in runs.items():
+            stat = os.stat(path)
+            if known.get(run) == (path, stat.st_mtime, stat.st_size):
+                unchanged += 1
+                continue
+            indexRun(db, run, path)
+            indexed += 1
+        removed = [run for run in known if run not in runs and run.startswith(os.path.join(directory, ''))]
+        for run in removed:
+            for table in ('runs', 'stats', 'shutters'):
+                db.execute('DELETE FROM {} WHERE run = ?'.format(table), (run,))
+    return indexed, unchanged, len(removed)
+
+
+def buildQuery(conditions):
+    """SQL and parameters selecting the runs meeting all conditions, each
+    '<run field> <op> <value>' (e.g. 'duration > 3600') or
+    '<column> <min|max|mean|final> <op> <value>' (e.g. 'Rate 2 max > 1')"""
+    where, parameters = [], []
+    for condition in conditions:
+        match = CONDITION.match(condition)
+        if not match:
+            raise ValueError('Cannot read condition {!r}'.format(condition))
+        subject, op, value = match.groups()
+        try:
+            value = float(value)
+        except ValueError:
+            pass
+        if subject in RUN_FIELDS:
+            where.append('runs.{} {} ?'.format(subject, op))
+            parameters.append(value)
+            continue
+        name, _, field = subject.rpartition(' ')
+        if field not in STAT_FIELDS or not name:
+            raise ValueError('Unknown field in {!r}, use one of {} or a column and one of {}'.format(
+                condition, sorted(RUN_FIELDS), sorted(STAT_FIELDS)))
+        where.append('EXISTS (SELECT 1 FROM stats WHERE stats.run = runs.run AND name = ? AND {} {} ?)'.format(field, op))
+        parameters += [name, value]
+
+    sql = 'SELECT run, start, duration, samples, closed FROM runs'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    return sql + ' ORDER BY start', parameters
+
+
+def query(db, conditions):
+    """Return the runs meeting all conditions, see buildQuery"""
+    sql, parameters = buildQuery(conditions)
+    return db.execute(sql, parameters).fetchall()
+
+
+def main(arguments):
+
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=DATABASE, help="Catalogue file (default %(default)s)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    update_parser = commands.add_parser('update', help="Index new and changed logs")
+    update_parser.add_argument('directory', nargs='?', default='saved-logs')
+    query_parser = commands.add_parser('query', help="List the runs meeting all conditions")
+    query_parser.add_argument('conditions', nargs='*', help="e.g. 'Rate 2 max > 1' 'duration > 3600'")
+    query_parser.add_argument('--sql', action='store_true', help="Print the SQL too")
+    show_parser = commands.add_parser('show', help="Print the summary of a run")
+    show_parser.add_argument('run', help="Log path, with or without its extension")
+
+    args = parser.parse_args(arguments)
+    db = connect(args.db)
+
+    if args.command == 'update':
+        print('{} logs indexed, {} unchanged, {} removed'.format(*update(db, args.directory)))
+
+    elif args.command == 'query':
+        try:
+            if args.sql:
+                print(*buildQuery(args.conditions))
+            runs = query(db, args.conditions)
+        except ValueError as error:
+            parser.error(str(error))
+        for run, start, duration, samples, closed in runs:
+            print('{:<50}{:>22}{:>10.1f} min{:>8} samples  {}'.format(
+                run, start or '', duration / 60, samples, closed or ''))
+
+    else:
+        run = os.path.splitext(args.run)[0]
+        for row in db.execute('SELECT * FROM runs WHERE run = ?', (run,)):
+            print(row)
+        print('{:<20}{:>12}{:>12}{:>12}{:>12}'.format('', 'min', 'max', 'mean', 'final'))
+        for name, low, high, mean, final in db.execute(
+                'SELECT name, min, max, mean, final FROM stats WHERE run = ? ORDER BY rowid', (run,)):
+            print('{:<20}{:>12.4g}{:>12.4g}{:>12.4g}{:>12.4g}'.format(name, *(
+                value if value is not None else float('nan') for value in (low, high, mean, final))))
+        for channel, opened, closed in db.execute(
+                'SELECT channel, open, close FROM shutters WHERE run = ? ORDER BY open', (run,)):
+            print('Source {} depositing from {:.1f} to {:.1f} min'.format(channel, opened / 60, closed / 60))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+#coding:utf-8
+"""
+  Purpose:  Binary ECHO log format, written alongside the CSV log.
+            Every sample is one fixed-width record of little-endian float64,
+            one per column, after a header naming the columns and units.
+            Logs can be appended to while recording and memory-mapped with
+            NumPy for loading, and converted to and from the CSV layout.
+  Created:  18/10/26
+
+  File layout:
+    b'ECHOBIN1'             magic
+    uint32 (little-endian)  length of the JSON header in bytes
+    JSON header             {"columns": [...], "units": [...], "integer": [...]},
+                            space padded so the records start on an 8 byte
+                            boundary. "integer" flags the columns logged as
+                            integers in the CSV, guessed from the names for
+                            logs written before it.
+    records                 len(columns) float64 per sample
+
+  Convert from the command line:
+    python -m monitor.binlog to-bin saved-logs/<run>-ECHO-LOG.csv
+    python -m monitor.binlog to-csv saved-logs/<run>-ECHO-LOG.bin
+"""
+
+import os
+import sys
+import csv
+import json
+import struct
+import argparse
+
+from monitor.logsink import BatchedSink
+
+MAGIC = b'ECHOBIN1'
+NAN = float('nan')
+
+# Units of the logged quantities, by column name prefix, then suffix
+UNITS = [('Time', 's'), ('Monotonic', 's'), ('Temp', 'C'), ('Rate', 'A/s'), ('Thick', 'kA'), ('Pressure', 'mbar')]
+SUFFIX_UNITS = [('Start', 's'), ('End', 's'), ('Slope', 'C/min')]
+
+
+def units_for(columns):
+    """Return the unit of every column, '' for counters and status codes"""
+    units = []
+    for column in columns:
+        unit = ''
+        if not column.endswith('Status'):
+            for prefix, prefix_unit in UNITS:
+                if column.startswith(prefix):
+                    unit = prefix_unit
+            for suffix, suffix_unit in SUFFIX_UNITS:
+                if column.endswith(suffix):
+                    unit = suffix_unit
+        units.append(unit)
+    return units
+
+
+def integers_for(columns):
+    """Return whether every column holds integers: counters, status codes
+    and the process state (monitor/adaptive.py)"""
+    return [column in ('Sample', 'State') or column.endswith('Status') for column in columns]
+
+
+def _to_float(value):
+    """Blank and unparsable fields are stored as NaN"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return NAN
+
+
+class BinaryLogSink(BatchedSink):
+    """Append samples to a binary log, same interface as CSVLogSink"""
+
+    def __init__(self, path, header, units=None, integer=None, **batching):
+        """
+        :param path: log file to create, must not exist yet
+        :param header: list of column names
+        :param units: list of units, guessed from the column names if None
+        :param integer: list of flags of the integer columns, see integers_for
+        :param batching: flush_rows, flush_interval and fsync_interval, see
+            BatchedSink (monitor/logsink.py)
+        """
+        BatchedSink.__init__(self, path, **batching)
+        self.record = struct.Struct('<%dd' % len(header))
+        self.file = open(path, 'xb', buffering=64 * 1024)
+        self.file.write(_header_bytes(header, units or units_for(header),
+                                      integer if integer is not None else integers_for(header)))
+
+    def write(self, row):
+        """Buffer one sample, flushing if a batch is complete"""
+        self.file.write(self.record.pack(*[_to_float(value) for value in row]))
+        self._written()
+
+    def close(self, reason='complete'):
+        """Flush and close the log. There is no trailer, a crash can only
+        leave a partial last record, which readers ignore."""
+        if self.file.closed:
+            return
+        self.flush(fsync=True)
+        self.file.close()
+
+
+def _header_bytes(columns, units, integer):
+    header = json.dumps({'columns': list(columns), 'units': list(units), 'integer': list(integer)}).encode()
+    header += b' ' * (-(len(MAGIC) + 4 + len(header)) % 8)
+    return MAGIC + struct.pack('<I', len(header)) + header
+
+
+def read_header(f):
+    """Read the header of an open binary log
+    :return: (columns, units, integer flags, offset of the first record)
+    """
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError('{} is not a binary ECHO log'.format(f.name))
+    length, = struct.unpack('<I', f.read(4))
+    header = json.loads(f.read(length).decode())
+    columns = header['columns']
+    # Written before the flags: counters and status codes, by name
+    integer = header.get('integer') or [column == 'Sample' or column.endswith('Status') for column in columns]
+    return columns, header['units'], integer, len(MAGIC) + 4 + length
+
+
+def load(path):
+    """Memory-map a binary log with NumPy, without reading the samples
+    :return: (data, units) where data is a read-only structured array with
+        one float64 field per column (data['Rate 1']) and units a dict of
+        {column: unit}
+    """
+    import numpy as np
+
+    with open(path, 'rb') as f:
+        columns, units, integer, offset = read_header(f)
+    dtype = np.dtype([(column, '<f8') for column in columns])
+    samples = (os.path.getsize(path) - offset) // dtype.itemsize   # drop a partial last record
+    if samples == 0:
+        return np.zeros(0, dtype=dtype), dict(zip(columns, units))
+    data = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(samples,))
+    return data, dict(zip(columns, units))
+
+
+def _is_integer(cell):
+    return cell.lstrip('-').isdigit()
+
+
+def csv_to_binary(csv_path, bin_path=None):
+    """Convert a CSV log (e.g. Sample, Temp 1..3, Rate 1..3, Thick 1..3,
+    Pressure) to a binary log. Returns the binary log path. Columns are
+    flagged integer if all their cells are integers or blank."""
+    if bin_path is None:
+        bin_path = os.path.splitext(csv_path)[0] + '.bin'
+    with open(csv_path, newline='') as f:
+        reader = csv.reader(line for line in f if not line.startswith('#'))
+        header = next(reader)
+        rows = list(reader)
+    integer = [any(row[i] for row in rows) and all(_is_integer(row[i]) for row in rows if row[i])
+               for i in range(len(header))]
+    with BinaryLogSink(bin_path, header, integer=integer) as sink:
+        for row in rows:
+            sink.write(row)
+    return bin_path
+
+
+def binary_to_csv(bin_path, csv_path=None):
+    """Convert a binary log back to the CSV layout written by the monitor:
+    blank cells where there was no value (NaN), integers where flagged.
+    Returns the CSV log path."""
+    if csv_path is None:
+        csv_path = os.path.splitext(bin_path)[0] + '.csv'
+    with open(bin_path, 'rb') as f:
+        columns, units, integer, offset = read_header(f)
+        record = struct.Struct('<%dd' % len(columns))
+        with open(csv_path, 'x', newline='') as out:
+            writer = csv.writer(out)
+            writer.writerow(columns)
+            data = f.read()
+            data = data[:len(data) - len(data) % record.size]          # drop a partial last record
+            for values in record.iter_unpack(data):
+                writer.writerow(['' if value != value else int(value) if is_int else value
+                                 for value, is_int in zip(values, integer)])
+    return csv_path
+
+
+def main(arguments):
+
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('direction', choices=['to-bin', 'to-csv'])
+    parser.add_argument('file', help="The log to convert")
+    parser.add_argument('output', nargs='?', help="Defaults to the input with the other extension")
+
+    args = parser.parse_args(arguments)
+
+    if args.direction == 'to-bin':
+        print('Binary log saved:', csv_to_binary(args.file, args.output))
+    else:
+        print('CSV log saved:', binary_to_csv(args.file, args.output))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+#coding:utf-8
+"""
+  Purpose:  Latest-value cache in front of the instrument reads. Every
+            quantity has a max-age; a read younger than that is answered from
+            the cache, and simultaneous requests for the same quantity share
+            one read on the wire. The monitor's own samples keep it warm.
+  Created:  18/10/26
+"""
+
+import time
+import threading
+import collections
+from concurrent.futures import Future
+
+from monitor.polling import OK, CONTROL
+
+# value, time.monotonic() when it was read, and age in s when returned
+Reading = collections.namedtuple('Reading', ['value', 'timestamp', 'age'])
+
+# Default max-age (s) per quantity
+MAX_AGE = {'temperature': 0.5, 'rate': 0.2, 'thickness': 0.2, 'pressure': 1.0}
+
+
+class ReadingCache(object):
+    """Values by key, e.g. ('rate', 1), with single-flight refresh"""
+
+    def __init__(self, max_age=None):
+        """
+        :param max_age: dict of {quantity: s} overriding MAX_AGE
+        """
+        self.max_age = dict(MAX_AGE, **(max_age or {}))
+        self.lock = threading.Lock()
+        self.values = {}        # key: (value, timestamp)
+        self.inflight = {}      # key: Future of the read on the wire
+
+    def put(self, key, value, timestamp):
+        with self.lock:
+            cached = self.values.get(key)
+            if cached is None or cached[1] <= timestamp:
+                self.values[key] = (value, timestamp)
+
+    def get(self, key, fetch, max_age=None):
+        """Return a Reading of key no older than max_age, calling fetch()
+        only if needed and only once for concurrent callers.
+        :param key: (quantity, channel)
+        :param fetch: callable reading the value from the instrument, and
+            returning (value, time.monotonic() when it was read)
+        :param max_age: s, defaults to the max-age of the quantity
+        """
+        if max_age is None:
+            max_age = self.max_age.get(key[0], 0)
+
+        with self.lock:
+            now = time.monotonic()
+            cached = self.values.get(key)
+            if cached is not None and now - cached[1] <= max_age:
+                return Reading(cached[0], cached[1], now - cached[1])
+            future = self.inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self.inflight[key] = Future()
+
+        if owner:
+            try:
+                value, timestamp = fetch()
+            except BaseException as error:
+                future.set_exception(error)
+                raise
+            else:
+                self.put(key, value, timestamp)
+                future.set_result((value, timestamp))
+            finally:
+                with self.lock:
+                    del self.inflight[key]
+        else:
+            value, timestamp = future.result()
+
+        return Reading(value, timestamp, time.monotonic() - timestamp)
+
+
+def _timed(read):
+    """read(driver, channel) returning (value, when the read started)"""
+    def timed(driver, channel):
+        start = time.monotonic()
+        return read(driver, channel), start
+    return timed
+
+
+def _read_pressure(pcu, gauge, max_age=5):
+    """In continuous output, the gauge's last line, as old as it is, and an
+    IOError if it stopped more than max_age s ago (as pressure_gauge)"""
+    if pcu.continuous:
+        line = pcu.latest_pressures(max_age, timestamp=True)
+        return line[2 * (gauge - 1)], line[-1]
+    start = time.monotonic()
+    return pcu.pressure_gauge(gauge=gauge), start
+
+
+# quantity: (instrument driver, see monitor/config.py, read(driver, channel)
+# returning (value, timestamp), column in the sample record)
+QUANTITIES = {
+    'temperature': ('eurotherm', _timed(lambda tcu, channel: tcu.read_T(channel)), 'Temp {}'),
+    'rate': ('inficon', _timed(lambda inf, channel: float(inf.rate(channel))), 'Rate {}'),
+    'thickness': ('inficon', _timed(lambda inf, channel: float(inf.thickness(channel))), 'Thick {}'),
+    'pressure': ('tpg261', _read_pressure, 'Pressure {}'),
+}
+
+GAUGES = (1, 2)     # of a TPG 261
+
+
+def column(quantity, source):
+    """Column of a quantity in the sample record ('Pressure' for gauge 1)"""
+    if quantity == 'pressure' and source == 1:
+        return 'Pressure'
+    return QUANTITIES[quantity][2].format(source)
+
+
+def channels(chamber):
+    """{(quantity, source): (instrument, driver channel)} of a chamber
+    (monitor/config.py), sources numbered as in the log and pressures by
+    gauge. The first instrument reading a source is used, as Chamber.find."""
+    found = {}
+    for quantity, (driver, read, _) in QUANTITIES.items():
+        for instrument in chamber.instruments:
+            if instrument.kind != driver:
+                continue
+            if driver == 'tpg261':
+                pairs = zip(GAUGES, GAUGES)
+            else:
+                pairs = zip(instrument.sources, instrument.channels)
+            for source, channel in pairs:
+                found.setdefault((quantity, source), (instrument, channel))
+    return found
+
+
+class CachedReader(object):
+    """Cached reads of the monitor's instruments. Reads which miss the cache
+    run on the instrument's poller worker, so they never share a port with
+    the logging polls."""
+
+    def __init__(self, poller, chamber, cache=None, timeout=10):
+        """
+        :param poller: the monitor's Poller
+        :param chamber: the Chamber (monitor/config.py) it records, connected
+        :param cache: ReadingCache, a new one with the default max-ages if None
+        :param timeout: longest to wait for the instrument (s)
+        """
+        self.workers = {worker.name: worker for worker in poller.workers}
+        self.channels = channels(chamber)
+        self.cache = cache or ReadingCache()
+        self.timeout = timeout
+
+    def read(self, quantity, source=1, max_age=None):
+        """Return a Reading of e.g. ('rate', 4), the rate of the source logged
+        as Rate 4, from the cache if fresh enough. Pressures are by gauge.
+        Raises ValueError if no instrument of the chamber reads it."""
+        if (quantity, source) not in self.channels:
+            raise ValueError('No {} of source {}'.format(quantity, source))
+        instrument, channel = self.channels[quantity, source]
+        read = QUANTITIES[quantity][1]
+
+        def fetch():
+            future = self.workers[instrument.name].submit(read, instrument.driver, channel, priority=CONTROL)
+            return future.result(timeout=self.timeout)
+
+        return self.cache.get((quantity, source), fetch, max_age)
+
+    def update(self, record):
+        """Warm the cache with the fresh readings of a sample record"""
+        for (quantity, source), (instrument, channel) in self.channels.items():
+            name = column(quantity, source)
+            if record.get(instrument.name + ' Status') == OK and name in record:
+                self.cache.put((quantity, source), record[name], record[instrument.name + ' Start'])
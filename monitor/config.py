@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+#coding:utf-8
+"""
+  Purpose:  The chambers and instruments the monitor records, described in
+            a TOML file instead of written into echo-monitor.py: any number
+            of chambers, each with its own instruments, ports, channels and
+            logs. The log columns follow from the instruments.
+  Created:  18/10/26
+
+  chambers.toml, next to echo-monitor.py, describes the ECHO and is used
+  unless --config names another file. A second evaporator with two more
+  sources would add:
+
+    [[chamber]]
+    name = "EVAP2"                  # logs named <date>-EVAP2-LOG.csv
+    period = 1                      # fixed sampling period (s), adaptive if left out
+    serve = "/tmp/evap2.sock"       # see monitor/server.py
+
+      [[chamber.instrument]]
+      driver = "eurotherm"          # named TCU unless given a name
+      port = "/dev/ttyUSB3"
+      channels = [1, 2]             # Modbus units...
+      sources = [4, 5]              # ...logged as Temp 4 and Temp 5
+      options = {timeout = 0.5}     # passed to the driver
+
+      [[chamber.instrument]]
+      driver = "inficon"
+      port = "/dev/ttyUSB4"
+      channels = [1, 2]
+      sources = [4, 5]              # Rate 4, Rate 5, Thick 4, Thick 5
+
+  Instrument names must be unique within a chamber and ports across all of
+  them. The adaptive sampling periods (monitor/adaptive.py) follow the
+  driver, the dashboard uses the default names TCU, Inficon and TPG.
+
+  Check a file and print the log columns of each chamber:
+    python -m monitor.config chambers.toml
+"""
+
+import os
+import re
+import sys
+import argparse
+import importlib
+import collections
+
+DEFAULT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'chambers.toml')
+
+# driver: (default instrument name, module, class)
+DRIVERS = {
+    'eurotherm': ('TCU', 'drivers.eurothermDriver', 'TCU'),
+    'inficon': ('Inficon', 'drivers.inficonDriver', 'inficon310C'),
+    'tpg261': ('TPG', 'drivers.pressureDriver', 'TPG261'),
+}
+
+# Modbus settings of the Eurotherm units, options override them
+EUROTHERM = {"method": "rtu", "parity": 'E', "baudrate": 9600, "bytesize": 8}
+
+# Port of each driver in drivers/simulatedDevices.py
+SIMULATED = {'eurotherm': 'tcu', 'inficon': 'inficon', 'tpg261': 'tpg'}
+
+CHAMBER_KEYS = {'name', 'logs', 'period', 'serve', 'instrument'}
+INSTRUMENT_KEYS = {'driver', 'name', 'port', 'channels', 'sources', 'options'}
+NAME = re.compile(r'^\w+$')
+
+
+class Instrument(object):
+    """One instrument on its own port"""
+
+    def __init__(self, driver, port, name=None, channels=(1, 2, 3), sources=None, options=None):
+        """
+        :param driver: key of DRIVERS
+        :param channels: TCU units or Inficon channels read, unused for the TPG
+        :param sources: source numbers logged for the channels, the channel
+            numbers if None
+        :param options: keyword arguments of the driver
+        """
+        self.kind = driver
+        self.port = port
+        self.name = name or DRIVERS[driver][0]
+        self.channels = tuple(channels) if driver != 'tpg261' else ()
+        self.sources = tuple(sources) if sources is not None else self.channels
+        self.options = dict(options or {})
+        self.driver = None      # once connected
+
+    def columns(self):
+        """Columns of the readings of this instrument"""
+        if self.kind == 'eurotherm':
+            return ['Temp %d' % n for n in self.sources]
+        if self.kind == 'inficon':
+            return ['Rate %d' % n for n in self.sources] + ['Thick %d' % n for n in self.sources]
+        return ['Pressure', 'Pressure Status', 'Pressure 2', 'Pressure 2 Status']
+
+    def display(self):
+        """Columns shown on the terminal"""
+        if self.kind == 'tpg261':
+            return ['Pressure']
+        return self.columns()
+
+    def connect(self, port=None):
+        """Open the driver, on `port` instead of the configured one if given"""
+        name, module, cls = DRIVERS[self.kind]
+        cls = getattr(importlib.import_module(module), cls)
+        port = port or self.port
+        if self.kind == 'eurotherm':
+            pars = dict(EUROTHERM, port=port)
+            pars.update(self.options)
+            self.driver = cls(pars, channels=list(self.channels))
+        else:
+            self.driver = cls(port=port, **self.options)
+        return self.driver
+
+
+class Chamber(object):
+    """A chamber and its instruments, recorded to its own logs"""
+
+    def __init__(self, name, instruments, logs='saved-logs/', period=None, serve=None):
+        """
+        :param period: fixed sampling period (s), None for adaptive sampling
+        :param serve: Unix socket path of its MonitorServer, None for none
+        """
+        self.name = name
+        self.instruments = instruments
+        self.logs = logs if logs.endswith('/') else logs + '/'
+        self.period = period
+        self.serve = serve
+
+    def __getitem__(self, name):
+        for instrument in self.instruments:
+            if instrument.name == name:
+                return instrument
+        raise KeyError(name)
+
+    def __contains__(self, name):
+        return any(instrument.name == name for instrument in self.instruments)
+
+    def columns(self):
+        """Columns of the readings of all instruments, in order"""
+        return [column for instrument in self.instruments for column in instrument.columns()]
+
+    def display(self):
+        return [column for instrument in self.instruments for column in instrument.display()]
+
+    def sources(self):
+        return sorted({n for instrument in self.instruments for n in instrument.sources})
+
+    def find(self, driver, source):
+        """(instrument, channel) reading a source with the given driver.
+        Raises ValueError if there is none."""
+        for instrument in self.instruments:
+            if instrument.kind == driver and source in instrument.sources:
+                return instrument, instrument.channels[instrument.sources.index(source)]
+        raise ValueError('chamber {} has no {} reading source {}'.format(self.name, driver, source))
+
+    def derived_columns(self):
+        """Derived columns (monitor/derived.py) of the Inficon and TCU sources"""
+        from monitor.derived import rate_columns, temperature_columns
+
+        columns = collections.OrderedDict()
+        for instrument in self.instruments:
+            if instrument.kind == 'inficon':
+                columns.update(rate_columns(instrument.sources, instrument.name))
+        for instrument in self.instruments:
+            if instrument.kind == 'eurotherm':
+                columns.update(temperature_columns(instrument.sources, instrument.name))
+        return columns
+
+    def periods(self, periods):
+        """Per instrument periods from ones keyed by the default instrument
+        names, e.g. ProcessState.periods() (monitor/adaptive.py)"""
+        return {instrument.name: periods.get(instrument.name, periods.get(DRIVERS[instrument.kind][0]))
+                for instrument in self.instruments
+                if instrument.name in periods or DRIVERS[instrument.kind][0] in periods}
+
+    def connect(self):
+        for instrument in self.instruments:
+            instrument.connect()
+
+    def simulate(self, **kwargs):
+        """Connect the instruments to a SimulatedECHO instead of their ports,
+        and return it. The simulator has one instrument of each driver."""
+        from drivers.simulatedDevices import SimulatedECHO
+
+        kinds = [instrument.kind for instrument in self.instruments]
+        if len(set(kinds)) != len(kinds):
+            raise ValueError('chamber {}: can only simulate one instrument per driver'.format(self.name))
+        echo = SimulatedECHO(**kwargs)
+        for instrument in self.instruments:
+            instrument.connect(port=echo.ports[SIMULATED[instrument.kind]].port)
+        return echo
+
+
+def _check_keys(table, allowed, where):
+    unknown = set(table) - allowed
+    if unknown:
+        raise ValueError('{}: unknown {}'.format(where, ', '.join(sorted(unknown))))
+
+
+def parse(document):
+    """Return the Chambers of a parsed TOML document. Raises ValueError
+    naming the chamber or instrument at fault."""
+    chambers = []
+    ports = {}
+    for i, table in enumerate(document.get('chamber', [])):
+        where = 'chamber {}'.format(table.get('name', i + 1))
+        _check_keys(table, CHAMBER_KEYS, where)
+        if not NAME.match(str(table.get('name', ''))):
+            raise ValueError('{}: name must be letters, digits or _'.format(where))
+        if any(chamber.name == table['name'] for chamber in chambers):
+            raise ValueError('{}: defined twice'.format(where))
+
+        instruments = []
+        for j, entry in enumerate(table.get('instrument', [])):
+            where = 'chamber {} instrument {}'.format(table['name'], entry.get('name', j + 1))
+            _check_keys(entry, INSTRUMENT_KEYS, where)
+            if entry.get('driver') not in DRIVERS:
+                raise ValueError('{}: driver must be one of {}'.format(where, ', '.join(sorted(DRIVERS))))
+            if 'port' not in entry:
+                raise ValueError('{}: no port'.format(where))
+            if entry['port'] in ports:
+                raise ValueError('{}: port {} already used by {}'.format(where, entry['port'], ports[entry['port']]))
+            if 'sources' in entry and len(entry['sources']) != len(entry.get('channels', (1, 2, 3))):
+                raise ValueError('{}: needs one source per channel'.format(where))
+            instrument = Instrument(**entry)
+            if instrument.name in [other.name for other in instruments]:
+                raise ValueError('{}: name {} already used in the chamber'.format(where, instrument.name))
+            ports[instrument.port] = where
+            instruments.append(instrument)
+
+        chamber = Chamber(table['name'], instruments, **{key: table[key] for key in ('logs', 'period', 'serve')
+                                                         if key in table})
+        columns = chamber.columns()
+        repeated = sorted({column for column in columns if columns.count(column) > 1})
+        if repeated:
+            raise ValueError('chamber {}: columns {} come from several instruments, give them other sources'.format(
+                chamber.name, ', '.join(repeated)))
+        chambers.append(chamber)
+    if not chambers:
+        raise ValueError('no [[chamber]] defined')
+    return chambers
+
+
+def load(path=DEFAULT):
+    """Return the Chambers described by a TOML file"""
+    try:
+        import tomllib
+    except ImportError:     # Python < 3.11
+        import tomli as tomllib
+
+    with open(path, 'rb') as f:
+        try:
+            document = tomllib.load(f)
+        except tomllib.TOMLDecodeError as error:
+            raise ValueError('{}: {}'.format(path, error))
+    return parse(document)
+
+
+def default():
+    """The ECHO chamber, as described by chambers.toml"""
+    return load(DEFAULT)
+
+
+def main(arguments):
+
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('config', nargs='?', default=DEFAULT, help="TOML file (default chambers.toml)")
+
+    args = parser.parse_args(arguments)
+
+    try:
+        chambers = load(args.config)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+    for chamber in chambers:
+        print('{} (logs in {}, {})'.format(chamber.name, chamber.logs,
+                                           'every {} s'.format(chamber.period) if chamber.period else 'adaptive'))
+        for instrument in chamber.instruments:
+            print('  {:<10}{:<12}{:<16}{}'.format(instrument.name, instrument.kind, instrument.port,
+                                                  ', '.join(instrument.columns())))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+#coding:utf-8
+"""
+  Purpose:  Closed-loop deposition rate control. Holds a source at a target
+            rate by moving the remote setpoint of its TCU unit from the
+            Inficon rate. Sources given a thickness are deposited with the
+            usual sequence: approach the rate with the shutter closed, open
+            it once the rate has settled, close it at the thickness.
+  Created:  18/10/26
+
+  The controller runs inside the monitor and never opens a port itself: it
+  takes the rates from the sample records as they are logged, and its
+  setpoint writes and shutter command are queued on the instruments'
+  worker threads with CONTROL priority (monitor/polling.py), ahead of the
+  logging polls. Its loop time is therefore the Inficon sampling period,
+  0.1 s while depositing with adaptive sampling (monitor/adaptive.py).
+
+  The rate grows about exponentially with the source temperature, so the
+  loop works on the log of the rate: an error of 1 is a factor e, and the
+  proportional gain is the temperature step giving a factor e (`scale`),
+  which is also the feed-forward applied when the target changes. The TCU
+  ramp limit (setRamp) caps how fast any setpoint change reaches the source;
+  the loop limits its own output to the same ramp, so its integral does not
+  wind up while the source is still on its way.
+
+    python echo-monitor.py --hold-rate 1:0.5:0.2    # 0.5 A/s on source 1, deposit 0.2 kA
+
+  The Inficon has one shutter relay: it opens when every source with a
+  thickness has settled, and closes when the first of them reaches its
+  thickness. The rates are held on after that, and the units are left in
+  remote mode at their last setpoint when the recording ends.
+
+  A source is the number of its logged columns (Temp n, Rate n). Its TCU
+  unit and Inficon channel are those of the chamber config reading it
+  (monitor/config.py), the same numbers for the ECHO.
+"""
+
+import sys
+import math
+import argparse
+
+from monitor.polling import OK, CONTROL
+from monitor.derived import EWMA
+
+
+class PID(object):
+    """PID controller on an error signal. The output is clamped to
+    [low, high], and the integral is not accumulated while that pushes
+    further into the clamp (anti-windup)."""
+
+    def __init__(self, kp, ki=0.0, kd=0.0, low=-math.inf, high=math.inf, bias=0.0):
+        """
+        :param bias: constant output, e.g. a feed-forward term
+        """
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.low = low
+        self.high = high
+        self.bias = bias
+        self.integral = 0.0
+        self.error = None
+        self.t = None
+
+    def update(self, t, error):
+        dt = 0.0 if self.t is None else t - self.t
+        derivative = (error - self.error) / dt if dt > 0 else 0.0
+        integral = self.integral + self.ki * error * dt
+        output = self.bias + self.kp * error + integral + self.kd * derivative
+        if output > self.high:
+            output = self.high
+            if error < 0:
+                self.integral = integral
+        elif output < self.low:
+            output = self.low
+            if error > 0:
+                self.integral = integral
+        else:
+            self.integral = integral
+        self.error = error
+        self.t = t
+        return output
+
+
+class RateLoop(object):
+    """Rate control of one source"""
+
+    def __init__(self, source, rate, thickness=None, scale=15.0, ti=30.0, smooth=1.0,
+                 limits=(20.0, 350.0), ramp=30.0, floor=0.01, band=0.1, settle=30.0):
+        """
+        :param source: source number, as in the logged columns
+        :param rate: target rate (A/s)
+        :param thickness: film to deposit with the shutter open (kA), None
+            to only hold the rate
+        :param scale: temperature rise multiplying the rate by e (C), the
+            proportional gain
+        :param ti: integral time (s)
+        :param smooth: time constant of the rate smoothing (s)
+        :param limits: lowest and highest setpoint allowed (C)
+        :param ramp: TCU setpoint ramp limit (C/min), None to leave it
+        :param floor: rates below this (A/s) are taken as this, so the log
+            stays finite with a cold source
+        :param band: the rate is settled within this fraction of the target...
+        :param settle: ...for this long (s)
+        :raises ValueError: if the rate or thickness is not positive
+        """
+        _positive('rate', rate)
+        if thickness is not None:
+            _positive('thickness', thickness)
+        self.source = source
+        # Set from the chamber config by RateController.configure
+        self.tcu = 'TCU'            # instrument names...
+        self.inficon = 'Inficon'
+        self.unit = source          # ...its TCU unit...
+        self.qcm = source           # ...and Inficon channel
+        self.rate = rate
+        self.thickness = thickness
+        self.scale = scale
+        self.ramp = ramp
+        self.floor = floor
+        self.band = band
+        self.settle = settle
+        self.limits = limits
+        self.pid = PID(scale, scale / ti, low=limits[0], high=limits[1])
+        self.filter = EWMA(smooth)
+        self.engaged = False
+        self.within = None          # since when the rate is within the band
+        self.opened = None          # thickness when the shutter opened (kA)
+        self.setpoint = None        # last setpoint written
+        self.written_at = None
+        self.pending = None         # Future of the write in flight
+
+    def set_target(self, rate):
+        """Change the target rate, moving the setpoint straight away by the
+        expected temperature change"""
+        _positive('rate', rate)
+        self.pid.bias += self.scale * math.log(rate / self.rate)
+        self.rate = rate
+
+    def update(self, t, rate, temperature):
+        """Setpoint (C) for a new rate reading at monotonic time t. The first
+        call engages the loop at the current source temperature, for a
+        bumpless start."""
+        if not self.engaged:
+            self.pid.bias = temperature
+            self.engaged = True
+        elif self.ramp is not None:
+            step = self.ramp / 60 * (t - self.pid.t)
+            self.pid.low = max(self.limits[0], self.output - step)
+            self.pid.high = min(self.limits[1], self.output + step)
+        smoothed = self.filter.update(t, rate)
+        if abs(smoothed - self.rate) > self.band * self.rate:
+            self.within = None
+        elif self.within is None:
+            self.within = t
+        error = math.log(self.rate) - math.log(max(smoothed, self.floor))
+        self.output = self.pid.update(t, error)
+        return self.output
+
+    def settled(self, t):
+        return self.within is not None and t - self.within >= self.settle
+
+
+class RateController(object):
+    """Drives the RateLoops of a recording from its sample records"""
+
+    metrics = None  # monitor.metrics.Metrics, see Metrics.enable
+
+    def __init__(self, loops, write_period=0.5):
+        """
+        :param loops: RateLoops, one per controlled source
+        :param write_period: shortest time between setpoint writes to a unit (s)
+        """
+        self.loops = loops
+        self.write_period = write_period
+        self.temperatures = {}
+        self.workers = None
+        self.shutter = None         # 'open', then 'closed', by this controller
+
+    @property
+    def sources(self):
+        return [loop.source for loop in self.loops]
+
+    def configure(self, chamber):
+        """Take the TCU and Inficon reading each source, and their unit and
+        channel, from a chamber config (monitor/config.py). Raises ValueError
+        if the chamber has no TCU or Inficon for a source."""
+        for loop in self.loops:
+            tcu, loop.unit = chamber.find('eurotherm', loop.source)
+            inficon, loop.qcm = chamber.find('inficon', loop.source)
+            loop.tcu, loop.inficon = tcu.name, inficon.name
+
+    def start(self, poller, chamber):
+        """Attach to the poller of a recording of the chamber, whose workers
+        own the instruments, and set the ramp limits"""
+        self.configure(chamber)
+        self.workers = {worker.name: worker for worker in poller.workers}
+        self.drivers = {instrument.name: instrument.driver for instrument in chamber.instruments}
+        for loop in self.loops:
+            if loop.ramp is not None:
+                self.workers[loop.tcu].submit(self.drivers[loop.tcu].exec_command, 'setRamp', loop.unit, loop.ramp,
+                                              priority=CONTROL)
+
+    def process(self, record):
+        """Act on a new sample record, and add the setpoint of every loop to
+        it as 'Temp n Setpoint'. Returns the record."""
+        for loop in self.loops:
+            if record.get(loop.tcu + ' Status') == OK:
+                self.temperatures[loop.source] = record.get('Temp %d' % loop.source)
+
+        t = None
+        for loop in self.loops:
+            if record.get(loop.inficon + ' Status') == OK:
+                t = record[loop.inficon + ' Start']
+                self._step(loop, t, record)
+        if t is not None:
+            self._shutter(t, record)
+
+        for loop in self.loops:
+            if loop.setpoint is not None:
+                record['Temp %d Setpoint' % loop.source] = loop.setpoint
+        return record
+
+    def _shutter(self, t, record):
+        """Open the shutter once every source with a thickness has settled,
+        close it when one has deposited its thickness"""
+        depositing = [loop for loop in self.loops if loop.thickness is not None]
+        if not depositing or any('Thick %d' % loop.source not in record for loop in depositing):
+            return
+        if self.shutter is None and all(loop.settled(t) for loop in depositing):
+            for loop in depositing:
+                loop.opened = record['Thick %d' % loop.source]
+            self._command(depositing, 'shutterOpen', 'open')
+            print('\nRates settled, opening the shutter', file=sys.stderr)
+        elif self.shutter == 'open':
+            for loop in depositing:
+                if record['Thick %d' % loop.source] - loop.opened >= loop.thickness:
+                    self._command(depositing, 'shutterClose', 'closed')
+                    print('\nSource {} deposited {} kA, closing the shutter'.format(loop.source, loop.thickness),
+                          file=sys.stderr)
+                    break
+
+    def _command(self, loops, method, shutter):
+        """Send a shutter command to the Inficon of every loop"""
+        for name in sorted({loop.inficon for loop in loops}):
+            self.workers[name].submit(getattr(self.drivers[name], method), priority=CONTROL)
+        self.shutter = shutter
+        if self.metrics is not None:
+            self.metrics.inc('echo_control_shutter_total', action=shutter)
+
+    def _step(self, loop, t, record):
+        source = loop.source
+        temperature = self.temperatures.get(source)
+        if temperature is None or temperature != temperature:
+            return                                  # no temperature yet to engage from
+        setpoint = round(loop.update(t, record['Rate %d' % source], temperature), 1)
+
+        if loop.pending is not None:
+            if not loop.pending.done():
+                return                              # the unit is still busy with the last one
+            if loop.pending.exception() is not None:
+                print('\nSetpoint of source {} not written, {}'.format(source, loop.pending.exception()),
+                      file=sys.stderr)
+                if self.metrics is not None:
+                    self.metrics.inc('echo_control_errors_total', source=source)
+                loop.setpoint = None                # write it again
+            loop.pending = None
+        if setpoint == loop.setpoint or (loop.written_at is not None and t - loop.written_at < self.write_period):
+            return
+        loop.pending = self.workers[loop.tcu].submit(self.drivers[loop.tcu].set_altSP, loop.unit, setpoint,
+                                                     priority=CONTROL)
+        loop.setpoint = setpoint
+        loop.written_at = t
+        if self.metrics is not None:
+            self.metrics.inc('echo_control_writes_total', source=source)
+
+
+def _positive(name, value):
+    # The loop works on the log of the rate
+    if not 0 < value < math.inf:
+        raise ValueError('the {} must be a positive number, got {}'.format(name, value))
+
+
+def parse_loop(text):
+    """RateLoop from 'SOURCE:RATE[:THICKNESS]', as given on the command
+    line. Raises argparse.ArgumentTypeError, so argparse shows why."""
+    parts = text.split(':')
+    try:
+        if len(parts) not in (2, 3):
+            raise ValueError('expected SOURCE:RATE[:THICKNESS], got {!r}'.format(text))
+        thickness = float(parts[2]) if len(parts) == 3 else None
+        return RateLoop(int(parts[0]), float(parts[1]), thickness)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
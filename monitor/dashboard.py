@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+#coding:utf-8
+"""
+  Purpose:  Live dashboard of a running deposition, with the four panels of
+            saved-logs/plot_evaporation.py (temperatures, rates, thickness,
+            log pressure). Redraws only the data lines with blitting, and
+            decimates the history as it arrives to a bounded number of
+            points, folding in only the new samples at each refresh, so the
+            refresh cost stays flat as the run grows.
+  Created:  18/10/26
+
+  The dashboard never writes to the acquisition side, it only reads a
+  source such as the SampleRing that recordECHO appends to, or a log
+  which is still being written (monitor/tailreader.py):
+
+    python echo-monitor.py --live
+    python -m monitor.dashboard saved-logs/2026-10-18-11-11-ECHO-LOG.csv
+"""
+
+import sys
+import argparse
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from monitor.polling import FAULT
+from monitor.tailreader import LogTail
+
+# Panels as in plot_evaporation.py: (title, column prefix, scale, y label, log y)
+PANELS = [
+    ('Source Temperatures', 'Temp', 1, 'Temperature [C]', False),
+    ('Source Rates', 'Rate', 1, 'Rate [A/s]', False),
+    ('Film thickness', 'Thick', 100, 'Thickness [nm]', False),
+    ('Pressure', 'Pressure', 1, 'Pressure [mBar]', True),
+]
+
+# Status column of the instrument behind each column prefix. With adaptive
+# sampling (monitor/adaptive.py) a sample only holds the instruments read at
+# its tick, the others are blank and left out of their lines; a failed read
+# is kept, as a gap in the line.
+STATUS = {'Temp': 'TCU Status', 'Rate': 'Inficon Status', 'Thick': 'Inficon Status', 'Pressure': 'TPG Status'}
+
+
+def minmax_decimate(x, y, bins):
+    """Reduce a line to at most about 2 * bins points, keeping the minimum and
+    maximum of every bin in time order, so spikes and dropouts stay visible.
+    Returns (x, y) unchanged if it is short enough."""
+    n = len(y)
+    if n <= 2 * bins:
+        return x, y
+    size = -(-n // bins)   # samples per bin, rounded up
+    whole = n - n % size
+    shaped = y[:whole].reshape(-1, size)
+    missing = np.isnan(shaped)
+    low = np.where(missing, np.inf, shaped).argmin(axis=1)
+    high = np.where(missing, -np.inf, shaped).argmax(axis=1)
+    start = np.arange(0, whole, size)
+    index = np.sort(np.stack([start + low, start + high], axis=1), axis=1).ravel()
+    index = np.concatenate([index, np.arange(whole, n)])   # the last, partial bin as is
+    return x[index], y[index]
+
+
+class MinMaxDecimator(object):
+    """minmax_decimate of a line which grows: the minimum and maximum of
+    every full bin are kept, and new points are folded in as they come.
+    When there are `bins` bins, neighbouring pairs are merged and the bins
+    hold twice as many points, so there are never more than about
+    2 * bins points plus one partial bin."""
+
+    def __init__(self, bins):
+        self.bins = bins + bins % 2     # merged in pairs
+        self.size = 1                   # points per bin
+        self.x = np.empty((0, 2))       # per bin, (low, high) in time order
+        self.y = np.empty((0, 2))
+        self.pending_x = np.empty(0)    # the last, partial bin
+        self.pending_y = np.empty(0)
+
+    def extend(self, x, y):
+        self.pending_x = np.concatenate([self.pending_x, x])
+        self.pending_y = np.concatenate([self.pending_y, y])
+        whole = len(self.pending_y) - len(self.pending_y) % self.size
+        if whole:
+            shaped = self.pending_y[:whole].reshape(-1, self.size)
+            missing = np.isnan(shaped)
+            start = np.arange(0, whole, self.size)
+            low = start + np.where(missing, np.inf, shaped).argmin(axis=1)
+            high = start + np.where(missing, -np.inf, shaped).argmax(axis=1)
+            index = np.sort(np.stack([low, high], axis=1), axis=1)
+            self.x = np.concatenate([self.x, self.pending_x[index]])
+            self.y = np.concatenate([self.y, self.pending_y[index]])
+            self.pending_x = self.pending_x[whole:]
+            self.pending_y = self.pending_y[whole:]
+        while len(self.y) >= self.bins:
+            self._merge()
+
+    def _merge(self):
+        """Halve the number of bins, keeping the extremes of each pair"""
+        pairs = len(self.y) // 2
+        x = self.x[:2 * pairs].reshape(pairs, 4)
+        y = self.y[:2 * pairs].reshape(pairs, 4)
+        missing = np.isnan(y)
+        rows = np.arange(pairs)
+        low = np.where(missing, np.inf, y).argmin(axis=1)
+        high = np.where(missing, -np.inf, y).argmax(axis=1)
+        index = np.sort(np.stack([low, high], axis=1), axis=1)
+        self.x = np.concatenate([x[rows[:, None], index], self.x[2 * pairs:]])
+        self.y = np.concatenate([y[rows[:, None], index], self.y[2 * pairs:]])
+        self.size *= 2
+
+    def data(self):
+        """(x, y) of the decimated line"""
+        single = np.zeros(self.x.shape, bool)
+        single[:, 1] = self.x[:, 0] == self.x[:, 1]     # low and high the same point
+        return (np.concatenate([self.x[~single], self.pending_x]),
+                np.concatenate([self.y[~single], self.pending_y]))
+
+
+class RingSource(object):
+    """Dashboard source reading a SampleRing (monitor/ringbuffer.py)"""
+
+    def __init__(self, ring):
+        self.ring = ring
+
+    def read(self, count=0):
+        """Return (samples, count): the samples appended since `count`, oldest
+        first, as far as the ring still holds them, and the new count"""
+        return self.ring.since(count)
+
+
+class TailSource(object):
+    """Dashboard source following a csv log from another process, parsing
+    only the appended rows"""
+
+    def __init__(self, path):
+        self.tail = LogTail(path)
+
+    def read(self, count=0):
+        chunk = self.tail.read()
+        return chunk, count + len(chunk)
+
+
+class Dashboard(object):
+    """Four panel live plot of a sample source"""
+
+    def __init__(self, source, interval=1000, max_points=2000):
+        """
+        :param source: object whose read(count) returns the samples after
+            the first `count` (structured array) and the new count
+        :param interval: refresh period in ms
+        :param max_points: points drawn per line at most (min/max decimated)
+        """
+        self.source = source
+        self.interval = interval
+        self.bins = max_points // 2
+        self.count = 0
+        self.start = None   # time of the first sample
+
+        self.fig, axarr = plt.subplots(2, 2, figsize=(16, 8))
+        self.axes = list(axarr.ravel())
+        self.lines = []     # (axis, line, column, scale, MinMaxDecimator)
+        for ax, (title, prefix, scale, ylabel, logy) in zip(self.axes, PANELS):
+            ax.set_title(title)
+            ax.set_xlabel('Time [mins]')
+            ax.set_ylabel(ylabel)
+            if logy:
+                ax.set_yscale('log')
+            ax.tick_params('y', which='both', colors='k', direction='in')
+            ax.tick_params('x', colors='k', direction='in')
+            ax.grid()
+        self.backgrounds = None
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        self.fig.subplots_adjust(left=.06, bottom=.08, right=.98, top=.95, hspace=0.3, wspace=0.2)
+
+    def _add_lines(self, columns):
+        """Create one line per channel present in the source"""
+        for ax, (title, prefix, scale, ylabel, logy) in zip(self.axes, PANELS):
+            for column in columns:
+                if column == prefix or (column.startswith(prefix + ' ') and column[len(prefix) + 1:].isdigit()):
+                    line, = ax.plot([], [], '.', markersize=3, label=column, animated=True)
+                    self.lines.append((ax, line, column, scale, MinMaxDecimator(self.bins)))
+                    if column + ' EWMA' in columns:     # smoothed rate, monitor/derived.py
+                        smooth, = ax.plot([], [], '-', color=line.get_color(), animated=True)
+                        self.lines.append((ax, smooth, column + ' EWMA', scale, MinMaxDecimator(self.bins)))
+            ax.legend(loc='upper left')
+
+    def _on_draw(self, event):
+        """After a full redraw, keep the static parts to blit the lines onto"""
+        self.backgrounds = [self.fig.canvas.copy_from_bbox(ax.bbox) for ax in self.axes]
+        for ax, line, column, scale, decimator in self.lines:
+            ax.draw_artist(line)
+
+    def _rescale(self, ax, x, y):
+        """Grow the limits of an axis to hold the data, with headroom so full
+        redraws get rarer as the run goes on. Returns True if they changed."""
+        changed = False
+        x0, x1 = ax.get_xlim()
+        if len(x) and (x[-1] > x1 or x1 > 2 * max(x[-1], 1)):
+            ax.set_xlim(0, max(x[-1], 1) * 1.5)
+            changed = True
+        finite = y[np.isfinite(y)]
+        if ax.get_yscale() == 'log':
+            finite = finite[finite > 0]
+        if len(finite):
+            low, high = finite.min(), finite.max()
+            y0, y1 = ax.get_ylim()
+            if low < y0 or high > y1:
+                if ax.get_yscale() == 'log':
+                    ax.set_ylim(min(low, y0) / 2, max(high, y1) * 2)
+                else:
+                    margin = 0.25 * max(high - low, abs(high) * 0.1, 1e-3)
+                    ax.set_ylim(min(low, y0) - margin, max(high, y1) + margin)
+                changed = True
+        return changed
+
+    def update(self):
+        """Plot what is new in the source, blitting unless an axis had to grow"""
+        samples, count = self.source.read(self.count)
+        if count == self.count or len(samples) == 0:
+            return
+        self.count = count
+        if not self.lines:
+            self._add_lines(samples.dtype.names)
+
+        if 'Monotonic' in samples.dtype.names:
+            if self.start is None:
+                self.start = samples['Monotonic'][0]
+            minutes = (samples['Monotonic'] - self.start) / 60
+        else:
+            minutes = samples['Sample'] / 30
+
+        redraw = self.backgrounds is None
+        for ax, line, column, scale, decimator in self.lines:
+            # By value rather than status alone, as a chamber may have more
+            # than one TCU or Inficon (monitor/config.py)
+            read = np.isfinite(samples[column])
+            status = STATUS.get(column.split()[0])
+            if status in samples.dtype.names:
+                read |= samples[status] >= FAULT
+            decimator.extend(minutes[read], samples[column][read] * scale)
+            x, y = decimator.data()
+            line.set_data(x, y)
+            redraw = self._rescale(ax, x, y) or redraw
+
+        if redraw:
+            self.fig.canvas.draw()  # _on_draw draws the lines and stores the backgrounds
+        else:
+            for ax, background in zip(self.axes, self.backgrounds):
+                self.fig.canvas.restore_region(background)
+            for ax, line, column, scale, decimator in self.lines:
+                ax.draw_artist(line)
+            for ax in self.axes:
+                self.fig.canvas.blit(ax.bbox)
+        self.fig.canvas.flush_events()
+
+    def show(self):
+        """Open the window and refresh it until it is closed"""
+        timer = self.fig.canvas.new_timer(interval=self.interval)
+        timer.add_callback(self.update)
+        timer.start()
+        plt.show()
+
+
+def main(arguments):
+
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('log', help="The csv log of the run to follow")
+    parser.add_argument('--interval', type=float, default=2,
+                        help="Refresh period in s (default %(default)s)")
+    args = parser.parse_args(arguments)
+
+    Dashboard(TailSource(args.log), interval=int(args.interval * 1000)).show()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+#coding:utf-8
+"""
+  Purpose:  Quantities derived from the readings as they are sampled:
+            smoothed rates, the deposition rate implied by the thickness,
+            and the heating rate of the sources. Each filter costs O(1) per
+            sample whatever the history, and has a NumPy batch equivalent
+            giving the same values for a whole log.
+  Created:  18/10/26
+
+  Derived columns, per channel n:
+    Rate n Avg      moving average of the Inficon rate (A/s)
+    Rate n EWMA     exponentially weighted average of the rate (A/s)
+    Rate n Thick    rate from the change in thickness, kA -> A/s (A/s)
+    Temp n Slope    heating rate of the source (C/min)
+
+    stage = Derived()
+    stage.process(record)           # adds the columns to a sample record
+    columns = derive(data)          # the same for a loaded log
+"""
+
+import re
+import math
+import collections
+
+NAN = float('nan')
+
+
+class MovingAverage(object):
+    """Mean of the valid values among the last n samples"""
+
+    def __init__(self, n=5):
+        self.n = n
+        self.window = collections.deque()
+        self.total = 0.0
+        self.valid = 0
+
+    def update(self, t, value):
+        self.window.append(value)
+        if value == value:
+            self.total += value
+            self.valid += 1
+        if len(self.window) > self.n:
+            old = self.window.popleft()
+            if old == old:
+                self.total -= old
+                self.valid -= 1
+        return self.total / self.valid if self.valid else NAN
+
+
+class EWMA(object):
+    """Exponentially weighted moving average with time constant tau (s).
+    The weight of each sample follows the time since the last one, so
+    missed or late samples do not distort it. Missing values give NaN and
+    leave the average as it was."""
+
+    def __init__(self, tau=10):
+        self.tau = tau
+        self.value = NAN
+        self.t = None
+
+    def update(self, t, value):
+        if value != value:
+            return NAN
+        if self.t is None:
+            self.value = value
+        else:
+            self.value += (1 - math.exp(-(t - self.t) / self.tau)) * (value - self.value)
+        self.t = t
+        return self.value
+
+
+class Derivative(object):
+    """Slope over the last n samples, times scale (e.g. 60 for per minute)"""
+
+    def __init__(self, n=5, scale=1):
+        self.scale = scale
+        self.window = collections.deque(maxlen=n + 1)
+
+    def update(self, t, value):
+        self.window.append((t, value))
+        t0, v0 = self.window[0]
+        if t == t0:
+            return NAN
+        return (value - v0) / (t - t0) * self.scale    # NaN if either value is missing
+
+
+# Derived column: (source column, timestamp column, filter class, parameters)
+def rate_columns(channels=(1, 2, 3), instrument='Inficon'):
+    clock = instrument + ' Start'
+    columns = collections.OrderedDict()
+    for ch in channels:
+        columns['Rate %d Avg' % ch] = ('Rate %d' % ch, clock, MovingAverage, {'n': 5})
+        columns['Rate %d EWMA' % ch] = ('Rate %d' % ch, clock, EWMA, {'tau': 10})
+        columns['Rate %d Thick' % ch] = ('Thick %d' % ch, clock, Derivative, {'n': 5, 'scale': 1000})
+    return columns
+
+
+def temperature_columns(channels=(1, 2, 3), instrument='TCU'):
+    clock = instrument + ' Start'
+    columns = collections.OrderedDict()
+    for ch in channels:
+        columns['Temp %d Slope' % ch] = ('Temp %d' % ch, clock, Derivative, {'n': 5, 'scale': 60})
+    return columns
+
+
+def default_columns(channels=(1, 2, 3)):
+    """Derived columns of the ECHO, see Chamber.derived_columns
+    (monitor/config.py) for other instruments"""
+    columns = rate_columns(channels)
+    columns.update(temperature_columns(channels))
+    return columns
+
+
+class Derived(object):
+    """Streaming stage adding derived columns to each sample record"""
+
+    def __init__(self, columns=None):
+        """
+        :param columns: as returned by default_columns, which is the default
+        """
+        self.spec = columns or default_columns()
+        self.columns = list(self.spec)
+        self.filters = [(name, source, clock, cls(**parameters))
+                        for name, (source, clock, cls, parameters) in self.spec.items()]
+
+    def process(self, record):
+        """Add the derived columns to a record, in place, and return it.
+        Readings are timed by their instrument's read, else the sample time.
+        Columns of an instrument not read in this record are left out."""
+        for name, source, clock, filter in self.filters:
+            if source not in record:
+                continue
+            t = record.get(clock)
+            if t is None or t != t:
+                t = record.get('Monotonic', record.get('Sample', 0) * 2)
+            value = record.get(source, NAN)
+            record[name] = filter.update(t, NAN if value == '' else float(value))
+        return record
+
+
+# ----------------------------------------------------------------------
+# Batch equivalents, on arrays of a whole log
+
+def moving_average(t, values, n=5):
+    import numpy as np
+
+    valid = np.isfinite(values)
+    total = np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))])
+    count = np.concatenate([[0], np.cumsum(valid)])
+    start = np.maximum(np.arange(1, len(values) + 1) - n, 0)
+    end = np.arange(1, len(values) + 1)
+    counts = count[end] - count[start]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, (total[end] - total[start]) / counts, NAN)
+
+
+def ewma(t, values, tau=10, span=500):
+    """Vectorised in blocks of up to `span` time constants, within which the
+    exponential weights stay inside float64 range"""
+    import numpy as np
+
+    out = np.full(len(values), NAN)
+    index = np.flatnonzero(np.isfinite(values))
+    if len(index) == 0:
+        return out
+    t = np.asarray(t, dtype=float)[index]
+    v = np.asarray(values, dtype=float)[index]
+    # s_k = s_{k-1} + a_k (v_k - s_{k-1}), a_k = 1 - exp(-dt_k / tau), unrolls to
+    # s_k = exp(-(t_k - tb)/tau) * (c + sum_j a_j v_j exp((t_j - tb)/tau))
+    # with tb the time of the first sample of the block and c the value
+    # carried in from the previous block, decayed to tb
+    alpha = np.concatenate([[1.0], 1 - np.exp(-np.diff(t) / tau)])
+    previous = 0.0
+    start = 0
+    while start < len(t):
+        end = np.searchsorted(t, t[start] + span * tau, side='right')
+        growth = np.exp((t[start:end] - t[start]) / tau)
+        carried = previous * (1 - alpha[start])
+        s = (carried + np.cumsum(alpha[start:end] * v[start:end] * growth)) / growth
+        out[index[start:end]] = s
+        previous = s[-1]
+        start = end
+    return out
+
+
+def derivative(t, values, n=5, scale=1):
+    import numpy as np
+
+    t = np.asarray(t, dtype=float)
+    values = np.asarray(values, dtype=float)
+    old = np.maximum(np.arange(len(values)) - n, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = (values - values[old]) / (t - t[old]) * scale
+    slope[t == t[old]] = NAN
+    return slope
+
+
+BATCH = {MovingAverage: moving_average, EWMA: ewma, Derivative: derivative}
+
+
+def derive(data, columns=None):
+    """Return {derived column: array} for a log loaded as a structured array
+    (binlog.load, LogTail.read) or a DataFrame, the same values Derived
+    would have added while recording. Rows in which the instrument was not
+    read (blank status) are skipped and left NaN. By default, the columns
+    of every source in the log."""
+    import numpy as np
+
+    names = data.dtype.names if hasattr(data, 'dtype') and data.dtype.names else list(data.columns)
+    if 'Monotonic' in names:
+        default_t = np.asarray(data['Monotonic'], dtype=float)
+    else:
+        default_t = np.asarray(data['Sample'], dtype=float) * 2
+    if columns is None:
+        sources = lambda quantity: [int(name.split()[1]) for name in names if re.match(quantity + r' \d+$', name)]
+        columns = rate_columns(sources('Rate'))
+        columns.update(temperature_columns(sources('Temp')))
+    derived = collections.OrderedDict()
+    for name, (source, clock, cls, parameters) in columns.items():
+        if source not in names:
+            continue
+        t = np.asarray(data[clock], dtype=float) if clock in names else default_t
+        t = np.where(np.isfinite(t), t, default_t)
+        values = np.asarray(data[source], dtype=float)
+        status = clock.replace(' Start', ' Status')
+        read = np.isfinite(np.asarray(data[status], dtype=float)) if status in names else np.ones(len(t), bool)
+        derived[name] = np.full(len(t), NAN)
+        derived[name][read] = BATCH[cls](t[read], values[read], **parameters)
+    return derived
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+#coding:utf-8
+"""
+  Purpose:  Buffered CSV log writer for the ECHO monitor. Keeps one handle
+            open for the whole run and flushes rows in batches, instead of
+            reopening the log file for every sample.
+  Created:  18/10/26
+"""
+
+import os
+import csv
+import time
+import datetime
+
+
+class BatchedSink(object):
+    """Flushing policy of the log sinks. Rows are flushed to the OS every
+    flush_rows rows or flush_interval seconds, whichever comes first, and
+    fsync'd to disk at most every fsync_interval seconds. Subclasses open
+    self.file, with a buffer large enough that only these flushes reach
+    the disk, and call _written after each row."""
+
+    def __init__(self, path, flush_rows=15, flush_interval=30, fsync_interval=120):
+        """
+        :param path: log file to create, must not exist yet
+        :param flush_rows: flush after this many rows
+        :param flush_interval: flush at least this often (s)
+        :param fsync_interval: fsync at least this often (s), 0 for every flush
+        """
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.file = None
+
+        self.rows = 0
+        self.unflushed = 0
+        self.last_flush = self.last_fsync = time.monotonic()
+
+    def _written(self):
+        """Count a buffered row, flushing if a batch is complete"""
+        self.rows += 1
+        self.unflushed += 1
+
+        if self.unflushed >= self.flush_rows or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self, fsync=False):
+        """Hand the buffered rows to the OS, and to the disk when due"""
+        self.file.flush()
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+        if fsync or self.last_flush - self.last_fsync >= self.fsync_interval:
+            os.fsync(self.file.fileno())
+            self.last_fsync = self.last_flush
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        elif issubclass(exc_type, KeyboardInterrupt):
+            self.close('interrupted')
+        else:
+            self.close('error')
+
+
+class CSVLogSink(BatchedSink):
+    """Append rows to a CSV log through a single open file, flushed in
+    batches (BatchedSink).
+
+    close() writes a '#' trailer line recording when and why the run
+    ended. Everything before the trailer is complete rows, so a log
+    without a trailer is one that crashed.
+    """
+
+    def __init__(self, path, header, **batching):
+        """
+        :param path: log file to create, must not exist yet
+        :param header: list of column names, written as the first row
+        :param batching: flush_rows, flush_interval and fsync_interval, see
+            BatchedSink
+        """
+        BatchedSink.__init__(self, path, **batching)
+        self.file = open(path, 'x', newline='', buffering=64 * 1024)
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(header)
+
+    def write(self, row):
+        """Buffer one row, flushing if a batch is complete"""
+        self.writer.writerow(row)
+        self._written()
+
+    def close(self, reason='complete'):
+        """Write the trailer and close the log
+        :param reason: why the run ended, e.g. complete, interrupted or error
+        """
+        if self.file.closed:
+            return
+        self.file.write('# closed {}, {} rows, {}\n'.format(
+            datetime.datetime.now().isoformat(timespec='seconds'), self.rows, reason))
+        self.flush(fsync=True)
+        self.file.close()
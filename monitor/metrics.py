@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+#coding:utf-8
+"""
+  Purpose:  Counters and timers for the drivers and the acquisition loop,
+            served as Prometheus text on a local HTTP port.
+  Created:  18/10/26
+
+  The drivers and the poller have a class attribute `metrics`, None by
+  default, and only touch it behind an `if self.metrics is not None` check,
+  so instrumentation costs nothing until it is enabled:
+
+    metrics = Metrics()
+    metrics.enable(inficon310C, TCU, TPG26x, Poller, DeviceWorker)
+    metrics.serve(port=9101)        # curl http://localhost:9101/metrics
+
+  With several chambers recorded at once, set the hook of each chamber's
+  objects instead, so their series carry a chamber label:
+
+    metrics.attach(poller, *poller.workers, tcu, pcu, inf, chamber='EVAP1')
+"""
+
+import time
+import threading
+import contextlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Upper bounds (s) of the latency histogram buckets
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    labels = tuple(labels) + tuple(extra)
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, value) for key, value in labels) + '}'
+
+
+class Metrics(object):
+    """Registry of counters and latency histograms"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}    # key: [bucket counts..., count, sum]
+        self.server = None
+
+    def enable(self, *classes):
+        """Point the metrics hook of the given classes at this registry"""
+        for cls in classes:
+            cls.metrics = self
+
+    def attach(self, *objects, **labels):
+        """Point the metrics hook of the given objects at this registry,
+        adding labels (e.g. chamber='EVAP1') to everything they record"""
+        labelled = LabelledMetrics(self, labels)
+        for obj in objects:
+            obj.metrics = labelled
+
+    def inc(self, name, amount=1, **labels):
+        """Add to a counter"""
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        """Record one duration in a histogram"""
+        key = _key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += 1
+            histogram[-1] += seconds
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Time a block into a histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, list(value)) for key, value in self.histograms.items())
+
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append('# TYPE {} counter'.format(name))
+                typed.add(name)
+            lines.append('{}{} {}'.format(name, _format_labels(labels), value))
+
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                lines.append('# TYPE {} histogram'.format(name))
+                typed.add(name)
+            for bound, count in zip(BUCKETS, histogram):
+                lines.append('{}_bucket{} {}'.format(name, _format_labels(labels, [('le', bound)]), count))
+            lines.append('{}_bucket{} {}'.format(name, _format_labels(labels, [('le', '+Inf')]), histogram[-2]))
+            lines.append('{}_count{} {}'.format(name, _format_labels(labels), histogram[-2]))
+            lines.append('{}_sum{} {}'.format(name, _format_labels(labels), histogram[-1]))
+
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port=9101, host='127.0.0.1'):
+        """Serve /metrics over HTTP from a background thread"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # Keep the monitor display clean
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class LabelledMetrics(object):
+    """Metrics of a registry with some labels always set, see Metrics.attach"""
+
+    def __init__(self, registry, labels):
+        self.registry = registry
+        self.labels = labels
+
+    def inc(self, name, amount=1, **labels):
+        self.registry.inc(name, amount, **dict(self.labels, **labels))
+
+    def observe(self, name, seconds, **labels):
+        self.registry.observe(name, seconds, **dict(self.labels, **labels))
+
+    def timer(self, name, **labels):
+        return self.registry.timer(name, **dict(self.labels, **labels))
@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+#coding:utf-8
+"""
+  Purpose:  Concurrent per-instrument polling engine for the ECHO monitor.
+            Each instrument sits on its own serial port, so each one gets its
+            own worker thread. The poller triggers each of them at its own
+            period on a common tick, and merges whatever came back into one
+            sample record per tick.
+  Created:  18/10/26
+
+  A read which fails or hangs never stops the poller: that instrument's
+  columns are logged as NaN with a FAULT status, and the others carry on.
+  Instruments given a reconnect function also get a circuit breaker: after
+  a few faults in a row the instrument is OFFLINE and only a reconnect is
+  tried, with exponential backoff, until it answers again.
+"""
+
+import sys
+import threading
+import itertools
+import queue
+import time
+from concurrent.futures import Future, TimeoutError
+
+# Status codes recorded per instrument in every sample
+OK = 0          # fresh reading taken this cycle
+STALE = 1       # instrument still busy, previous reading repeated
+FAULT = 2       # read failed or timed out, values logged as NaN
+OFFLINE = 3     # not read, waiting to reconnect, values logged as NaN
+
+NAN = float('nan')
+
+# Job priorities, lowest first: control commands jump ahead of logging polls
+CONTROL = 0
+POLL = 10
+_STOP = 100
+
+
+class Breaker(object):
+    """Circuit breaker of one instrument. Closed while reads succeed; opens
+    after `failures` faults in a row, then allows one reconnect attempt
+    after a backoff doubling from `backoff` to at most `backoff_max` s."""
+
+    def __init__(self, failures=3, backoff=1.0, backoff_max=60.0, read_timeout=30.0):
+        """
+        :param read_timeout: a read still in flight after this long (s) is
+            counted as a fault, whatever timeouts the driver has
+        """
+        self.failures = failures
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.read_timeout = read_timeout
+        self.faults = 0             # in a row
+        self.delay = backoff
+        self.retry_at = None        # monotonic time of the next reconnect, None while closed
+
+    @property
+    def open(self):
+        return self.retry_at is not None
+
+    def allow(self, now):
+        """True if the instrument may be tried now"""
+        return self.retry_at is None or now >= self.retry_at
+
+    def success(self):
+        """Returns True if this closed the breaker"""
+        reopened = self.open
+        self.faults = 0
+        self.delay = self.backoff
+        self.retry_at = None
+        return reopened
+
+    def failure(self, now):
+        """Returns True if this opened the breaker"""
+        self.faults += 1
+        if self.open:
+            self.delay = min(2 * self.delay, self.backoff_max)
+        elif self.faults < self.failures:
+            return False
+        opening = not self.open
+        self.retry_at = now + self.delay
+        return opening
+
+
+class DeviceWorker(threading.Thread):
+    """Thread which owns one instrument and runs all jobs for it serially,
+    in order of priority"""
+
+    metrics = None  # monitor.metrics.Metrics, see Metrics.enable
+
+    def __init__(self, name, read, reconnect=None, breaker=None):
+        """
+        :param name: instrument name, used as a prefix in the sample record
+        :param read: callable returning a dict of {column: value}
+        :param reconnect: callable reopening the instrument's port, None to
+            keep reading a faulty instrument every cycle
+        :param breaker: Breaker, a default one if None and reconnect is given
+        """
+        super(DeviceWorker, self).__init__(name=name, daemon=True)
+        self.read = read
+        self.reconnect = reconnect
+        self.breaker = breaker or (Breaker() if reconnect is not None else None)
+        self.jobs = queue.PriorityQueue()
+        self.sequence = itertools.count()   # first in, first out within a priority
+        self.pending = None     # Future of the read currently in flight
+        self.started = None     # when it was submitted
+        self.hung = False       # it outlived the read timeout, already counted as a fault
+        self.last = {}          # last good reading, reused while busy
+
+    def timed_read(self):
+        """Read the instrument, adding when the read started and ended
+        (time.monotonic()) as '<name> Start' and '<name> End'"""
+        start = time.monotonic()
+        values = dict(self.read())
+        values[self.name + ' Start'] = start
+        values[self.name + ' End'] = time.monotonic()
+        if self.metrics is not None:
+            self.metrics.observe('echo_read_seconds', values[self.name + ' End'] - start, instrument=self.name)
+        return values
+
+    def recover(self):
+        """Reconnect, then read"""
+        if self.metrics is not None:
+            self.metrics.inc('echo_reconnects_total', instrument=self.name)
+        self.reconnect()
+        return self.timed_read()
+
+    def gap(self):
+        """Columns of this instrument, all NaN"""
+        return {column: NAN for column in self.last}
+
+    def submit(self, function, *args, priority=POLL):
+        """Queue a job for this instrument and return a Future for its result"""
+        future = Future()
+        self.jobs.put((priority, next(self.sequence), (future, function, args)))
+        return future
+
+    def run(self):
+        while True:
+            priority, sequence, job = self.jobs.get()
+            if job is None:
+                break
+            future, function, args = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(function(*args))
+            except BaseException as error:
+                future.set_exception(error)
+
+    def stop(self):
+        """Finish the queued jobs, then end the thread"""
+        self.jobs.put((_STOP, next(self.sequence), None))
+
+
+class Poller(object):
+    """Poll several instruments concurrently, each at its own period, on a
+    common tick"""
+
+    metrics = None  # monitor.metrics.Metrics, see Metrics.enable
+
+    def __init__(self, readers, period=2.0, reconnects=None, tick=None):
+        """
+        :param readers: dict of {instrument name: read callable}. Every
+            callable returns a dict of {column: value} for its instrument.
+        :param period: time between reads of each instrument in seconds,
+            see set_periods to change it per instrument
+        :param reconnects: dict of {instrument name: callable reopening its
+            port}, giving those instruments a Breaker
+        :param tick: time between records in seconds, period if None. Periods
+            are rounded to whole ticks.
+        """
+        self.period = period
+        self.tick = tick or period
+        reconnects = reconnects or {}
+        self.workers = [DeviceWorker(name, read, reconnects.get(name)) for name, read in readers.items()]
+        for worker in self.workers:
+            worker.period = period
+            worker.next_due = 0         # monotonic time of its next read
+            worker.collected = True     # the result of pending has been recorded
+
+    def set_periods(self, periods):
+        """Change the period of some instruments, {instrument name: s}. A
+        shorter period takes effect at the next tick."""
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.name in periods:
+                worker.period = periods[worker.name]
+                worker.next_due = min(worker.next_due, now + worker.period)
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def poll(self, deadline, now=None):
+        """Trigger the instruments which are due and merge the readings into
+        one record. Instruments neither due nor finishing a read are left
+        out of the record; it is empty if nothing happened.
+
+        A read which is not finished by the deadline stays in flight and is
+        recorded by a later poll, so one slow or retrying device does not
+        stretch the whole cycle. An instrument due again while its last read
+        is still in flight repeats its previous values, flagged as STALE.
+        One whose read failed is logged as a gap, see the module docstring.
+        """
+        if now is None:
+            now = time.monotonic()
+        record = {}
+        triggered = []
+        for worker in self.workers:
+            if worker.pending is not None and worker.pending.done() and not worker.collected:
+                self._collect(worker, record)                   # finished after its deadline
+            if worker.next_due - now > self.tick / 2:
+                continue
+            # From the due time to keep the phase, from now after a gap (the
+            # first read, a missed tick) so the next read is a period away
+            worker.next_due = max(worker.next_due, now) + worker.period
+
+            breaker = worker.breaker
+            if worker.pending is not None and not worker.pending.done():
+                if breaker is not None and time.monotonic() - worker.started > breaker.read_timeout:
+                    if not worker.hung:
+                        worker.hung = True
+                        self._fault(worker, 'no reply for {:.0f} s'.format(time.monotonic() - worker.started))
+                    self._record(record, worker, worker.gap(), FAULT)
+                else:
+                    self._record(record, worker, worker.last, STALE)
+                continue
+            if breaker is not None and not breaker.allow(now):
+                worker.pending = None                           # backing off
+                self._record(record, worker, worker.gap(), OFFLINE)
+                continue
+            job = worker.recover if breaker is not None and breaker.open else worker.timed_read
+            worker.pending = worker.submit(job)
+            worker.started = time.monotonic()
+            worker.hung = False
+            worker.collected = False
+            triggered.append(worker)
+
+        for worker in triggered:
+            try:
+                worker.pending.result(timeout=max(0, deadline - time.monotonic()))
+            except TimeoutError:
+                continue                                        # recorded when it finishes
+            except Exception:
+                pass
+            self._collect(worker, record)
+
+        if record and self.metrics is not None:
+            self.metrics.inc('echo_samples_total')
+        return record
+
+    def _collect(self, worker, record):
+        """Record the outcome of a finished read"""
+        worker.collected = True
+        try:
+            values = worker.pending.result(timeout=0)
+        except Exception as error:
+            self._fault(worker, '{}: {}'.format(type(error).__name__, error))
+            self._record(record, worker, worker.gap(), FAULT)
+            return
+        worker.last = values
+        if worker.breaker is not None and worker.breaker.success():
+            print('\n{} reconnected'.format(worker.name), file=sys.stderr)
+        self._record(record, worker, values, OK)
+
+    def _record(self, record, worker, values, status):
+        record.update(values)
+        record[worker.name + ' Status'] = status
+        if self.metrics is not None:
+            if status == STALE:
+                self.metrics.inc('echo_stale_readings_total', instrument=worker.name)
+            elif status != OK:
+                self.metrics.inc('echo_missed_readings_total', instrument=worker.name)
+
+    def _fault(self, worker, reason):
+        """Count a failed read, and open the instrument's breaker if due"""
+        if self.metrics is not None:
+            self.metrics.inc('echo_read_faults_total', instrument=worker.name)
+        breaker = worker.breaker
+        if breaker is None:
+            print('\n{} read failed, {}'.format(worker.name, reason), file=sys.stderr)
+        elif breaker.failure(time.monotonic()):
+            print('\n{} offline after {} faults ({}), reconnecting'.format(
+                worker.name, breaker.faults, reason), file=sys.stderr)
+
+    def run(self, sample_max=None):
+        """Yield one merged record per tick in which something was read,
+        until sample_max records (forever if None).
+
+        Every record carries the wall clock ('Time', time.time()) and
+        monotonic ('Monotonic', time.monotonic()) time of its tick.
+        """
+        sample = 0
+
+        for deadline in schedule(self.tick):
+            if sample_max is not None and sample >= sample_max:
+                break
+            record = {'Sample': sample, 'Time': time.time(), 'Monotonic': time.monotonic()}
+            values = self.poll(deadline + self.tick, now=deadline)
+            if not values:
+                continue
+            record.update(values)
+            yield record
+
+            sample += 1
+
+
+def schedule(period):
+    """Yield absolute deadlines start + k * period, sleeping until each one.
+
+    Deadlines are computed from the start, not from the previous sample, so
+    time spent on the serial ports does not accumulate as drift. A tick
+    which is late is run straight away, ticks missed entirely are skipped.
+    """
+    start = time.monotonic()
+    tick = 0
+
+    while True:
+        deadline = start + tick * period
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        yield deadline
+
+        tick = max(tick + 1, int((time.monotonic() - start) // period))
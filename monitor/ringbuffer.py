@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#coding:utf-8
+"""
+  Purpose:  Fixed-capacity in-memory history of the samples, for on-line
+            consumers (live plots, rate averaging, alarm checks) which need
+            the recent past without rereading the log.
+  Created:  18/10/26
+
+  The buffer is a preallocated NumPy structured array with one float64
+  field per column. Each sample is written twice, at i and i + capacity,
+  so the latest n samples are always one contiguous slice and every window
+  is a zero-copy view in time order. Memory stays constant however long
+  the run is.
+
+    ring = SampleRing(header, capacity=21600)
+    ring.append(record)
+    ring.window(150)['Rate 1'].mean()       # last 5 minutes at 2 s
+"""
+
+import threading
+
+NAN = float('nan')
+
+
+class SampleRing(object):
+    """Preallocated ring buffer of sample records"""
+
+    def __init__(self, columns, capacity=21600):
+        """
+        :param columns: names of the fields, e.g. the log header
+        :param capacity: samples kept (default 12 hours at 2 s)
+        """
+        import numpy as np
+
+        self.columns = list(columns)
+        self.capacity = capacity
+        self.dtype = np.dtype([(column, '<f8') for column in self.columns])
+        self.data = np.full(2 * capacity, NAN, dtype=self.dtype)
+        # One view per column, so append only stores floats into existing memory
+        self._fields = [self.data[column] for column in self.columns]
+        self.count = 0      # samples appended since the start
+        self.appended = threading.Condition()
+
+    def append(self, record):
+        """Store one sample. Columns missing from the record (or blank) are NaN"""
+        i = self.count % self.capacity
+        j = i + self.capacity
+        for column, field in zip(self.columns, self._fields):
+            value = record.get(column, NAN)
+            if value == '':
+                value = NAN
+            field[i] = value
+            field[j] = value
+        with self.appended:
+            self.count += 1
+            self.appended.notify_all()
+
+    def extend(self, samples):
+        """Store a structured array of samples at once (fields matched by name,
+        missing ones NaN), e.g. a chunk from monitor/tailreader.py"""
+        total = len(samples)
+        samples = samples[-self.capacity:]     # older ones would be overwritten anyway
+        n = len(samples)
+        start = (self.count + total - n) % self.capacity
+        first = min(n, self.capacity - start)  # up to the end of the first copy
+        for column, field in zip(self.columns, self._fields):
+            if column in samples.dtype.names:
+                values = samples[column]
+            else:
+                values = [NAN] * n
+            field[start:start + first] = values[:first]
+            field[start + self.capacity:start + self.capacity + first] = values[:first]
+            field[:n - first] = values[first:]
+            field[self.capacity:self.capacity + n - first] = values[first:]
+        with self.appended:
+            self.count += total
+            self.appended.notify_all()
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def window(self, n=None):
+        """Return a view of the last n samples (all held if None), oldest first.
+        The view aliases the buffer: copy it to keep it past the next
+        capacity - n appends."""
+        held = len(self)
+        if n is None or n > held:
+            n = held
+        end = self.count % self.capacity + self.capacity if self.count else 0
+        return self.data[end - n:end]
+
+    def since(self, count):
+        """Return a view of the samples appended after the first `count`, and
+        the new count. Lets a consumer pick up exactly what it has not seen,
+        up to the capacity."""
+        total = self.count
+        return self.window(total - count), total
+
+    def wait(self, count, timeout=None):
+        """Block until more than `count` samples have been appended"""
+        with self.appended:
+            return self.appended.wait_for(lambda: self.count > count, timeout)
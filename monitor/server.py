@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+#coding:utf-8
+"""
+  Purpose:  Share the instruments of a running monitor with other local
+            programs. The monitor keeps the serial ports; clients connect to a
+            Unix socket to get the latest sample, or to have a driver method
+            run on the instrument's worker thread. Client calls are queued
+            with CONTROL priority, ahead of the logging polls.
+  Created:  18/10/26
+
+  Protocol: one JSON object per line each way.
+    {"op": "latest"}
+        -> {"ok": true, "record": {"Sample": 12, "Temp 1": 20.4, ...}}
+    {"op": "read", "quantity": "rate", "channel": 1, "max_age": 0.2}
+        channel: the source as logged (Rate 1), or the gauge for pressure
+        -> {"ok": true, "reading": {"value": 0.12, "timestamp": 1234.5, "age": 0.05}}
+    {"op": "call", "instrument": "Inficon", "method": "shutterOpen", "args": []}
+        -> {"ok": true, "result": "Shutter Open"}
+    errors  -> {"ok": false, "error": "..."}
+
+  use:
+    python echo-monitor.py --serve /tmp/echo.sock
+    client = MonitorClient('/tmp/echo.sock')
+    client.latest()['Rate 1']
+    client.read('pressure')             # cached, at most 1 s old
+    client.call('TCU', 'set_altSP', 1, 180)
+"""
+
+import os
+import json
+import socket
+import threading
+import socketserver
+
+from monitor.polling import CONTROL
+from monitor.cache import CachedReader, Reading
+
+# Driver methods clients may call, per instrument driver (monitor/config.py).
+# The monitor keeps the TPG in continuous output, so only the methods
+# answered from its last line
+METHODS = {
+    'eurotherm': {'read_T', 'read_block', 'read_powerOut', 'exec_command', 'setRemote',
+            'setRemoteSP', 'set_altSP', 'set_TargetSP'},
+    'inficon': {'show_version', 'film_name', 'rate', 'thickness', 'rates', 'thicknesses',
+                'snapshot', 'crystal_stats', 'shutterOpen', 'shutterClose'},
+    'tpg261': {'pressure_gauge', 'pressure_gauges', 'latest_pressures'},
+}
+
+
+def _encode(value):
+    """JSON fallback for driver return values"""
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('latin-1')
+    raise TypeError('Cannot send {!r}'.format(value))
+
+
+class MonitorServer(socketserver.ThreadingUnixStreamServer):
+    """Serve the latest sample and driver calls of a running Poller"""
+
+    daemon_threads = True
+
+    def __init__(self, path, poller, chamber, timeout=10):
+        """
+        :param path: Unix socket path
+        :param poller: the monitor's Poller, whose workers own the instruments
+        :param chamber: the Chamber (monitor/config.py) it records, connected;
+            its instrument names are those of the poller
+        :param timeout: longest a call may wait for its instrument (s)
+        """
+        if os.path.exists(path):
+            os.unlink(path)  # Left over from a monitor which crashed
+        self.path = path
+        self.workers = {worker.name: worker for worker in poller.workers}
+        self.instruments = {instrument.name: instrument for instrument in chamber.instruments}
+        self.timeout = timeout
+        self.latest = {}     # updated by the monitor after every sample, see update
+        self.reader = CachedReader(poller, chamber, timeout=timeout)
+        socketserver.ThreadingUnixStreamServer.__init__(self, path, _Handler)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+        os.unlink(self.path)
+
+    def update(self, record):
+        """Publish a new sample, and warm the read cache with it. A sample
+        holds only the instruments read at its tick, so it is merged into the
+        latest values of every column."""
+        self.latest = dict(self.latest, **record)
+        self.reader.update(record)
+
+    def handle_request_line(self, request):
+        op = request.get('op')
+        if op == 'latest':
+            return {'ok': True, 'record': self.latest}
+        if op == 'read':
+            reading = self.reader.read(request['quantity'], request.get('channel', 1), request.get('max_age'))
+            return {'ok': True, 'reading': reading._asdict()}
+        if op == 'call':
+            instrument = request.get('instrument')
+            method = request.get('method')
+            if instrument not in self.instruments or method not in METHODS[self.instruments[instrument].kind]:
+                return {'ok': False, 'error': 'Unknown method {}.{}'.format(instrument, method)}
+            function = getattr(self.instruments[instrument].driver, method)
+            future = self.workers[instrument].submit(function, *request.get('args', []), priority=CONTROL)
+            return {'ok': True, 'result': future.result(timeout=self.timeout)}
+        return {'ok': False, 'error': 'Unknown op {!r}'.format(op)}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                reply = self.server.handle_request_line(json.loads(line))
+            except Exception as error:
+                reply = {'ok': False, 'error': '{}: {}'.format(type(error).__name__, error)}
+            self.wfile.write(json.dumps(reply, default=_encode).encode() + b'\n')
+
+
+class MonitorClient(object):
+    """Talk to the MonitorServer of a running monitor"""
+
+    def __init__(self, path, timeout=15):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(path)
+        self.file = self.socket.makefile('rwb')
+
+    def request(self, **request):
+        self.file.write(json.dumps(request).encode() + b'\n')
+        self.file.flush()
+        reply = json.loads(self.file.readline())
+        if not reply['ok']:
+            raise IOError(reply['error'])
+        return reply
+
+    def latest(self):
+        """Return the latest sample recorded by the monitor"""
+        return self.request(op='latest')['record']
+
+    def read(self, quantity, channel=1, max_age=None):
+        """Return a Reading of a quantity ('temperature', 'rate', 'thickness'
+        or 'pressure') of a source as logged, or of a gauge for pressure,
+        from the monitor's cache when it is fresh enough"""
+        reading = self.request(op='read', quantity=quantity, channel=channel, max_age=max_age)['reading']
+        return Reading(**reading)
+
+    def call(self, instrument, method, *args):
+        """Run a driver method on the monitor's instrument, ahead of its polls"""
+        return self.request(op='call', instrument=instrument, method=method, args=list(args))['result']
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
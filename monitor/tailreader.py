@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+#coding:utf-8
+"""
+  Purpose:  Follow an ECHO-LOG csv while it is being written. The reader
+            keeps its byte offset and only parses the rows appended since
+            the last read, so following a long run costs the same per
+            update as following a short one.
+  Created:  18/10/26
+
+  Only complete lines are parsed: a row the monitor is halfway through
+  writing stays in the file until its newline arrives. Comment lines
+  ('#', e.g. the trailer CSVLogSink writes on close) are skipped, and the
+  trailer marks the log as closed.
+
+    tail = LogTail('saved-logs/2026-10-18-11-11-ECHO-LOG.csv')
+    for chunk in tail.follow():             # NumPy structured arrays
+        print(chunk['Rate 1'].mean())
+"""
+
+import os
+import time
+
+NAN = float('nan')
+
+
+def _value(text):
+    return float(text) if text.strip() else NAN    # blank: instrument not read yet
+
+
+class LogTail(object):
+    """Incremental reader of a growing csv log"""
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0         # bytes of the file parsed so far
+        self.columns = None     # from the header line
+        self.dtype = None
+        self.rows = 0           # rows returned so far
+        self.closed = False     # the monitor wrote its trailer
+        self.trailer = None     # '# closed <time>, <rows> rows, <reason>'
+
+    def read(self):
+        """Return the complete rows appended since the last read, as a NumPy
+        structured array (float64 per column, blank cells NaN). Empty if
+        there are none, or if the header has not been written yet."""
+        import numpy as np
+
+        with open(self.path, 'rb') as log:
+            if os.fstat(log.fileno()).st_size < self.offset:
+                # Replaced by a new file of the same name: start again
+                self.offset, self.columns, self.rows, self.closed, self.trailer = 0, None, 0, False, None
+            log.seek(self.offset)
+            data = log.read()
+
+        end = data.rfind(b'\n') + 1     # a partial last line waits for the next read
+        self.offset += end
+        values = []
+        for line in data[:end].decode().splitlines():
+            if not line.strip():
+                continue
+            if line.startswith('#'):
+                if line.startswith('# closed'):
+                    self.closed, self.trailer = True, line
+                continue
+            if self.columns is None:
+                self.columns = line.split(',')
+                self.dtype = np.dtype([(column, '<f8') for column in self.columns])
+                continue
+            values.append(tuple(_value(text) for text in line.split(',')))
+
+        if self.dtype is None:
+            return np.empty(0, dtype=[('Sample', '<f8')])
+        self.rows += len(values)
+        return np.array(values, dtype=self.dtype)
+
+    def read_frame(self):
+        """Like read, as a pandas DataFrame indexed by row number in the log"""
+        import pandas as pd
+
+        first = self.rows
+        chunk = self.read()
+        return pd.DataFrame(chunk, index=pd.RangeIndex(first, first + len(chunk)))
+
+    def follow(self, interval=1, timeout=None, frames=False):
+        """Yield the new rows as they arrive, until the log is closed or
+        nothing has been appended for `timeout` s.
+        :param interval: s between checks of the file
+        :param frames: yield pandas DataFrames instead of NumPy arrays
+        """
+        idle = time.monotonic()
+        while True:
+            chunk = self.read_frame() if frames else self.read()
+            if len(chunk):
+                idle = time.monotonic()
+                yield chunk
+            if self.closed or (timeout is not None and time.monotonic() - idle > timeout):
+                return
+            time.sleep(interval)
@@ -4,54 +4,156 @@
   Author:   Ross <ross.warren@pm.me>
   Purpose:  Plot ECHO data
   Created:  23/05/19
+
+  Plot one log, or a whole directory in parallel, skipping the logs
+  already plotted:
+    python plot_evaporation.py 2019-05-16-14-45-ECHO-LOG.csv
+    python plot_evaporation.py . --fast -o previews
 """
 
+import os
 import sys
+import glob
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from monitor import binlog
+
 
 def main(arguments):
 
     parser = argparse.ArgumentParser(
         description=__doc__,
         formatter_class=argparse.RawDescriptionHelpFormatter)
-    parser.add_argument('file', help="The csv file which you want to plot", type=argparse.FileType('r'))
+    parser.add_argument('logs', nargs='+',
+                        help="The csv or binary (.bin) logs which you want to plot: files, directories or globs")
+    parser.add_argument('-o', '--outdir', default='plots-from-logs',
+                        help="Where to save the pdfs (default %(default)s)")
+    parser.add_argument('--fast', action='store_true',
+                        help="Preview quality: matplotlib text instead of LaTeX")
+    parser.add_argument('--force', action='store_true',
+                        help="Plot even the logs whose pdf is newer than the log")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help="Logs plotted in parallel (default %(default)s)")
 
     args = parser.parse_args(arguments)
-    
-    df = readcsv(args.file.name)
-    plotStats(df, args.file.name[:-4])
+
+    logs = findLogs(args.logs)
+    if not os.path.isdir(args.outdir):
+        os.makedirs(args.outdir)
+    jobs = [(log, plotPath(log, args.outdir)) for log in logs]
+    if not args.force:
+        jobs = [(log, pdf) for log, pdf in jobs if not upToDate(log, pdf)]
+    print(len(logs) - len(jobs), 'of', len(logs), 'plots up to date')
+
+    if len(jobs) <= 1 or args.jobs == 1:
+        setStyle(args.fast)
+        for log, pdf in jobs:
+            plotLog(log, pdf)
+        return
+
+    # Each worker imports pandas and matplotlib once, then plots many logs
+    with ProcessPoolExecutor(args.jobs, initializer=setStyle, initargs=(args.fast,)) as pool:
+        futures = {pool.submit(plotLog, log, pdf): log for log, pdf in jobs}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as error:
+                print('\nFailed to plot', futures[future], '-', error)
+
+
+def findLogs(patterns):
+    """Expand files, directories and globs into a sorted list of logs. Where a
+    run has both a csv and a binary log, use the binary one, faster to load."""
+    found = {}
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths = glob.glob(os.path.join(pattern, '*.csv')) + glob.glob(os.path.join(pattern, '*.bin'))
+        else:
+            paths = glob.glob(pattern) or [pattern]
+        for path in paths:
+            stem, ext = os.path.splitext(path)
+            if ext == '.bin' or stem not in found:
+                found[stem] = path
+    return sorted(found.values())
+
+
+def plotPath(logfile, outdir):
+    """pdf of a log, e.g. plots-from-logs/2019-05-16-14-45-ECHO-LOG.pdf"""
+    return os.path.join(outdir, os.path.splitext(os.path.basename(logfile))[0] + '.pdf')
+
+
+def upToDate(logfile, pdf):
+    """True if the pdf was made after the log was last written"""
+    return os.path.exists(pdf) and os.path.getmtime(pdf) >= os.path.getmtime(logfile)
+
+
+def plotLog(logfile, pdf):
+    """Read a log and save its plot"""
+    df = readlog(logfile)
+    plotStats(df, pdf[:-4])
+    return pdf
+
+
+def readlog(logfile):
+    """Read a log produced from ECHO live stats, csv or binary."""
+    if logfile.endswith('.bin'):
+        return readbin(logfile)
+    return readcsv(logfile)
 
 
 def readcsv(csvfile):
     """Read csv produced from ECHO live stats."""
-    df = pd.read_csv(csvfile, delimiter=',', header=0)
+    df = pd.read_csv(csvfile, delimiter=',', header=0, comment='#')   # '#' marks the trailer
     return df
 
 
+def readbin(binfile):
+    """Read binary log produced from ECHO live stats, memory-mapped."""
+    data, units = binlog.load(binfile)
+    return pd.DataFrame(data)
 
-def plotStats(data, savefile):
-    """Plots saved stats for publication."""
+
+
+def elapsedMinutes(data):
+    """Time since the first sample in minutes. Older logs have no timestamps
+    and assume exactly 2 s per sample."""
+    if 'Monotonic' in data:
+        return (data['Monotonic'] - data['Monotonic'].iloc[0]) / 60
+    return data['Sample'] / 30
+
+
+def setStyle(fast=False):
+    """Publication style, typeset by LaTeX, or matplotlib's own text if fast"""
 
     import matplotlib as mpl
-    mpl.use('pdf')        
-    width = 6.68
-    height = (width / 1.618)      # golden ratio
+    mpl.use('pdf')
+    if fast:
+        return
 
     # Direct input
-    plt.rcParams['text.latex.preamble'] = [r"\usepackage{lmodern}"]
+    plt.rcParams['text.latex.preamble'] = r"\usepackage{lmodern}"
     # Options
     params = {'text.usetex': True,
               'font.size': 10,
               'font.family': 'lmodern',
-              'text.latex.unicode': True,
               }
     plt.rcParams.update(params)
-    
+
+
+def plotStats(data, savefile):
+    """Plots saved stats for publication."""
+
+    width = 6.68
+    height = (width / 1.618)      # golden ratio
+
     markerSize = 3
 
+    minutes = elapsedMinutes(data)
+
     fig, axarr = plt.subplots(2, 2, figsize=(16, 8))
 
     # Chamber vent lines
@@ -73,9 +175,9 @@ def plotStats(data, savefile):
     #axarr[1, 1].axvline(x=46.4, color='red', alpha=0.6)
 
     # axarr[0, 0].set_title('Source Temperatures')
-    axarr[0, 0].plot(data['Sample'] / 30, data['Temp 1'], '.', label='Channel 1', markersize=markerSize)
-    axarr[0, 0].plot(data['Sample'] / 30, data['Temp 2'], '.', label='Channel 2', markersize=markerSize)
-    axarr[0, 0].plot(data['Sample'] / 30, data['Temp 3'], '.', label='Channel 3', markersize=markerSize)
+    axarr[0, 0].plot(minutes, data['Temp 1'], '.', label='Channel 1', markersize=markerSize)
+    axarr[0, 0].plot(minutes, data['Temp 2'], '.', label='Channel 2', markersize=markerSize)
+    axarr[0, 0].plot(minutes, data['Temp 3'], '.', label='Channel 3', markersize=markerSize)
     axarr[0, 0].set_xlabel('Time [mins]')
     axarr[0, 0].set_ylabel('Temperature [C]')
     axarr[0, 0].tick_params('y', which='both', colors='k', direction='in')
@@ -87,12 +189,12 @@ def plotStats(data, savefile):
     # axarr[0, 0].rate.plot(data['Sample'], data['Rate 1'], 'C1.', label='Rate')
 
     # axarr[0, 1].set_title('Source Rates')
-    axarr[0, 1].plot(data['Sample'] / 30, data['Rate 1'], '.', label='Channel 1', markersize=markerSize)
-    axarr[0, 1].plot(data['Sample'] / 30, data['Rate 2'], '.', label='Channel 2', markersize=markerSize)
-    axarr[0, 1].plot(data['Sample'] / 30, data['Rate 3'], '.', label='Channel 3', markersize=markerSize)
+    axarr[0, 1].plot(minutes, data['Rate 1'], '.', label='Channel 1', markersize=markerSize)
+    axarr[0, 1].plot(minutes, data['Rate 2'], '.', label='Channel 2', markersize=markerSize)
+    axarr[0, 1].plot(minutes, data['Rate 3'], '.', label='Channel 3', markersize=markerSize)
     axarr[0, 1].set_ylim(-0.1, 0.1)
     axarr[0, 1].set_xlabel('Time [mins]')
-    axarr[0, 1].set_ylabel('Rate [\AA/s]')
+    axarr[0, 1].set_ylabel('Rate [\AA/s]' if plt.rcParams['text.usetex'] else 'Rate [Å/s]')
     axarr[0, 1].tick_params('y', which='both', colors='k', direction='in')
     axarr[0, 1].tick_params('x', colors='k', direction='in')
     
@@ -100,9 +202,9 @@ def plotStats(data, savefile):
     # axarr[0, 1].legend()
 
     # axarr[1, 0].set_title('Film thickness')
-    axarr[1, 0].plot(data['Sample'] / 30, data['Thick 1'] * 100, '.', label='Channel 1', markersize=markerSize)
-    axarr[1, 0].plot(data['Sample'] / 30, data['Thick 2'] * 100, '.', label='Channel 2', markersize=markerSize)
-    axarr[1, 0].plot(data['Sample'] / 30, data['Thick 3'] * 100, '.', label='Channel 3', markersize=markerSize)
+    axarr[1, 0].plot(minutes, data['Thick 1'] * 100, '.', label='Channel 1', markersize=markerSize)
+    axarr[1, 0].plot(minutes, data['Thick 2'] * 100, '.', label='Channel 2', markersize=markerSize)
+    axarr[1, 0].plot(minutes, data['Thick 3'] * 100, '.', label='Channel 3', markersize=markerSize)
     axarr[1, 0].set_xlabel('Time [mins]')
     axarr[1, 0].set_ylabel('Thickness [nm]')
     axarr[1, 0].tick_params('y', which='both', colors='k', direction='in')
@@ -112,7 +214,7 @@ def plotStats(data, savefile):
     axarr[1, 0].legend()
 
     # axarr[1, 1].set_title('Pressure')
-    axarr[1, 1].semilogy(data['Sample'] / 30, data['Pressure'], '.', color='C3', markersize=markerSize)
+    axarr[1, 1].semilogy(minutes, data['Pressure'], '.', color='C3', markersize=markerSize)
     axarr[1, 1].set_xlabel('Time [mins]')
     axarr[1, 1].set_ylabel('Pressure [mBar]')
     axarr[1, 1].tick_params('y', which='both', colors='k', direction='in')
@@ -127,9 +229,10 @@ def plotStats(data, savefile):
 
     fig.set_size_inches(width, height)
     fig.subplots_adjust(left=.08, bottom=.09, right=.98, top=.98, hspace=0.28, wspace=0.4)
-    fig.savefig('plots-from-logs/' + savefile + '.pdf', dpi=300)
-    
-    print('\nPlot saved: plots-from-logs/', savefile, '.pdf')
+    fig.savefig(savefile + '.pdf', dpi=300)
+    plt.close(fig)      # Batches plot many logs in one process
+
+    print('\nPlot saved:', savefile + '.pdf')
 
 
 
@@ -0,0 +1,38 @@
+"""Process state of the adaptive sampling (monitor/adaptive.py)"""
+
+import os
+import csv
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from monitor.derived import Derived
+from monitor.adaptive import classify, DEPOSITING, IDLE, HEATING
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def states(path):
+    """State of every sample of a logged run, as classified while recording"""
+    derived = Derived()
+    latest = {}
+    result = []
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            record = {column: float(value) for column, value in row.items()}
+            latest.update(derived.process(record))
+            result.append(classify(latest))
+    return result
+
+
+def test_idle_log_is_not_depositing():
+    # Rates within 0.01 A/s, thicknesses jittering by one count
+    result = states(os.path.join(ROOT, 'saved-logs', '2019-05-16-15-10-ECHO-LOG.csv'))
+    assert len(result) == 651
+    assert DEPOSITING not in result
+
+
+def test_depositing():
+    assert classify({'Rate 2 EWMA': 0.3}) == DEPOSITING
+    assert classify({'Rate 1 Thick': 5.0}) == DEPOSITING
+    assert classify({'Rate 1 Thick': 2.5, 'Temp 1 Slope': 0.1}) == IDLE
+    assert classify({'Rate 1 Thick': 2.5, 'Temp 1 Slope': 3.0}) == HEATING
@@ -0,0 +1,38 @@
+"""Binary logs (monitor/binlog.py)"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from monitor.binlog import BinaryLogSink, binary_to_csv, csv_to_binary, load
+from monitor.logsink import CSVLogSink
+
+HEADER = ['Sample', 'State', 'TCU Status', 'Temp 1', 'Inficon Status', 'Rate 1']
+# Adaptive sampling (monitor/adaptive.py) leaves the instruments not read blank
+ROWS = [[0, 1, 0, 25.5, 0, 0.12],
+        [1, 2, 0, 25.75, '', ''],
+        [2, 2, '', '', 2, '']]
+
+
+def rows_of(path):
+    with open(path) as f:
+        return [line for line in f if not line.startswith('#')]
+
+
+def test_binary_to_csv_is_the_csv_log(tmp_path):
+    with CSVLogSink(str(tmp_path / 'log.csv'), HEADER) as csv_sink, \
+            BinaryLogSink(str(tmp_path / 'log.bin'), HEADER) as bin_sink:
+        for row in ROWS:
+            csv_sink.write(row)
+            bin_sink.write(row)
+    assert rows_of(binary_to_csv(str(tmp_path / 'log.bin'), str(tmp_path / 'back.csv'))) == rows_of(str(tmp_path / 'log.csv'))
+
+
+def test_csv_round_trip_keeps_integer_columns(tmp_path):
+    with CSVLogSink(str(tmp_path / 'log.csv'), ['Sample', 'Pressure', 'Counts'], flush_rows=1) as sink:
+        sink.write([0, 1.5e-6, 3])
+        sink.write([1, '', ''])
+    back = binary_to_csv(csv_to_binary(str(tmp_path / 'log.csv')), str(tmp_path / 'back.csv'))
+    assert rows_of(back) == rows_of(str(tmp_path / 'log.csv'))
+    data, units = load(str(tmp_path / 'log.bin'))
+    assert len(data) == 2 and units['Pressure'] == 'mbar'
@@ -0,0 +1,106 @@
+"""Cached reads and calls of a chamber's instruments (monitor/cache.py, monitor/server.py)"""
+
+import os
+import sys
+import time
+from concurrent.futures import Future
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from drivers.pressureDriver import TPG261
+from monitor import config
+from monitor.polling import OK
+from monitor.cache import CachedReader
+from monitor.server import MonitorServer
+
+
+class Worker(object):
+    """Runs submitted calls straight away"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def submit(self, function, *args, priority=None):
+        future = Future()
+        future.set_result(function(*args))
+        return future
+
+
+class TCU(object):
+
+    def read_T(self, unit):
+        return 100.0 + unit
+
+
+class QCM(object):
+
+    def rate(self, channel):
+        return str(channel / 10)
+
+    def shutterOpen(self):
+        return 'Shutter Open'
+
+
+def evap2():
+    """The second evaporator of the monitor/config.py docstring, with a
+    renamed Inficon"""
+    chamber = config.parse({'chamber': [{'name': 'EVAP2', 'instrument': [
+        {'driver': 'eurotherm', 'port': 'a', 'channels': [1, 2], 'sources': [4, 5]},
+        {'driver': 'inficon', 'name': 'QCM', 'port': 'b', 'channels': [1, 2], 'sources': [4, 5]}]}]})[0]
+    chamber['TCU'].driver, chamber['QCM'].driver = TCU(), QCM()
+    poller = type('Poller', (), {'workers': [Worker('TCU'), Worker('QCM')]})()
+    return chamber, poller
+
+
+def test_read_by_source():
+    chamber, poller = evap2()
+    reader = CachedReader(poller, chamber)
+    assert reader.read('temperature', 4).value == 101.0     # unit 1 reads source 4
+    assert reader.read('rate', 5).value == 0.2
+    with pytest.raises(ValueError):
+        reader.read('temperature', 1)
+
+
+def test_update_from_sources():
+    chamber, poller = evap2()
+    reader = CachedReader(poller, chamber)
+    now = time.monotonic()
+    reader.update({'TCU Status': OK, 'TCU Start': now, 'Temp 4': 30.0, 'Temp 5': 40.0})
+    assert reader.read('temperature', 5).value == 40.0
+    assert reader.read('temperature', 4).timestamp == now
+
+
+def test_call_renamed_instrument(tmp_path):
+    chamber, poller = evap2()
+    server = MonitorServer(str(tmp_path / 'evap2.sock'), poller, chamber)
+    try:
+        assert server.handle_request_line({'op': 'call', 'instrument': 'QCM', 'method': 'shutterOpen'}) == \
+            {'ok': True, 'result': 'Shutter Open'}
+        assert not server.handle_request_line({'op': 'call', 'instrument': 'QCM', 'method': 'read_T'})['ok']
+    finally:
+        server.server_close()
+
+
+def gauge(age):
+    """A chamber whose TPG's last continuous line is `age` s old"""
+    chamber = config.default()[0]
+    pcu = chamber['TPG'].driver = TPG261(port=None)
+    pcu._reader = object()
+    arrived = time.monotonic() - age
+    pcu._latest = pcu._parse_pressures('0,1.0000E-06,0,2.0000E-03') + (arrived,)
+    poller = type('Poller', (), {'workers': [Worker('TCU'), Worker('Inficon'), Worker('TPG')]})()
+    return CachedReader(poller, chamber), arrived
+
+
+def test_pressure_timestamp_of_the_line():
+    reader, arrived = gauge(0.5)
+    reading = reader.read('pressure', 2, max_age=1)
+    assert reading.value == 2e-3
+    assert reading.timestamp == arrived and reading.age >= 0.5
+
+
+def test_pressure_from_stopped_gauge():
+    reader, arrived = gauge(600)
+    with pytest.raises(IOError):
+        reader.read('pressure', 1)
@@ -0,0 +1,83 @@
+"""Rate control (monitor/control.py)"""
+
+import os
+import sys
+import argparse
+from concurrent.futures import Future
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from monitor import config
+from monitor.polling import OK
+from monitor.control import RateController, RateLoop, parse_loop
+
+
+def test_parse_loop():
+    loop = parse_loop('2:0.5:0.1')
+    assert (loop.source, loop.rate, loop.thickness) == (2, 0.5, 0.1)
+    assert parse_loop('1:1').thickness is None
+
+
+@pytest.mark.parametrize('text', ['1:0', '1:-0.5', '1:nan', '1:0.5:0', '1:0.5:-1', '1', '1:x'])
+def test_parse_loop_rejects(text):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_loop(text)
+
+
+def test_set_target_rejects_zero():
+    loop = RateLoop(1, 0.5)
+    with pytest.raises(ValueError):
+        loop.set_target(0)
+    assert loop.rate == 0.5
+
+
+class Worker(object):
+    """Runs submitted calls straight away"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def submit(self, function, *args, priority=None):
+        future = Future()
+        future.set_result(function(*args))
+        return future
+
+
+class Driver(object):
+    """Records the calls made to it"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name,) + args)
+
+
+def test_sources_other_than_channels():
+    chamber = config.parse({'chamber': [{'name': 'EVAP2', 'instrument': [
+        {'driver': 'eurotherm', 'port': 'a', 'channels': [1, 2], 'sources': [4, 5]},
+        {'driver': 'inficon', 'name': 'QCM', 'port': 'b', 'channels': [2, 3], 'sources': [4, 5]}]}]})[0]
+    for instrument in chamber.instruments:
+        instrument.driver = Driver()
+    tcu = chamber['TCU'].driver
+    poller = type('Poller', (), {'workers': [Worker('TCU'), Worker('QCM')]})()
+
+    loop = RateLoop(5, 0.5, 0.1)
+    controller = RateController([loop])
+    controller.start(poller, chamber)
+    assert (loop.tcu, loop.unit, loop.inficon, loop.qcm) == ('TCU', 2, 'QCM', 3)
+    assert tcu.calls == [('exec_command', 'setRamp', 2, loop.ramp)]
+
+    controller.process({'TCU Status': OK, 'Temp 4': 30.0, 'Temp 5': 150.0})
+    record = controller.process({'QCM Status': OK, 'QCM Start': 1.0, 'Rate 4': 2.0, 'Rate 5': 0.5,
+                                 'Thick 4': 0.0, 'Thick 5': 0.0})
+    name, unit, setpoint = tcu.calls[-1]
+    assert (name, unit) == ('set_altSP', 2)
+    assert setpoint == record['Temp 5 Setpoint'] == 150.0      # engaged at source 5's temperature
+
+
+def test_configure_rejects_unknown_source():
+    chamber = config.default()[0]
+    with pytest.raises(ValueError):
+        RateController([RateLoop(4, 0.5)]).configure(chamber)
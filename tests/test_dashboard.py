@@ -0,0 +1,37 @@
+"""Incremental decimation of the dashboard lines (monitor/dashboard.py)"""
+
+import os
+import sys
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from monitor.dashboard import MinMaxDecimator
+
+
+def test_short_line_unchanged():
+    decimator = MinMaxDecimator(100)
+    decimator.extend(np.arange(5.0), np.arange(5.0) * 2)
+    x, y = decimator.data()
+    assert list(x) == [0, 1, 2, 3, 4] and list(y) == [0, 2, 4, 6, 8]
+
+
+def test_bounded_and_keeps_extremes():
+    random = np.random.RandomState(0)
+    n = 200000
+    x = np.arange(n, dtype=float)
+    y = random.normal(size=n)
+    y[123457] = 50.0        # spike
+    y[170001] = -50.0       # dropout
+    y[5000:5100] = np.nan   # gap
+    decimator = MinMaxDecimator(1000)
+    for start in range(0, n, 997):          # chunks as at each refresh
+        decimator.extend(x[start:start + 997], y[start:start + 997])
+    dx, dy = decimator.data()
+    assert len(dx) <= 2 * 1000 + decimator.size
+    assert np.all(np.diff(dx) > 0)
+    assert 50.0 in dy and -50.0 in dy
+    assert np.nanmax(dy) == 50.0 and np.nanmin(dy) == -50.0
+    assert dx[0] < decimator.size and dx[-1] >= n - 2 * decimator.size
@@ -0,0 +1,84 @@
+"""Inficon bursts (inficon310C.comm_many) against InficonSim, without a port"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from drivers.inficonDriver import inficon310C
+from drivers.simulatedDevices import Chamber, InficonSim
+
+
+class FakeSerial(object):
+    """Serial port answered by a simulated device. `mangle(i, reply)`
+    alters the i-th reply of the next write only."""
+
+    def __init__(self, device, mangle=None):
+        self.device = device
+        self.mangle = mangle
+        self.buffer = b''
+        self.writes = 0
+        self.timeout = None
+
+    def write(self, data):
+        replies = self.device.receive(data)
+        if self.mangle is not None:
+            replies = [self.mangle(i, reply) for i, reply in enumerate(replies)]
+            self.mangle = None
+        self.buffer += b''.join(replies)
+        self.writes += 1
+
+    def read(self, size):
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    @property
+    def in_waiting(self):
+        return len(self.buffer)
+
+    def reset_input_buffer(self):
+        self.buffer = b''
+
+
+def inficon(mangle=None):
+    chamber = Chamber(seed=0)
+    chamber.thickness = [0.1, 0.2, 0.3]
+    inf = inficon310C(port=None, reply_timeout=0.05, retries=2)
+    inf.serial = FakeSerial(InficonSim(chamber), mangle)
+    return inf
+
+
+def second(change):
+    return lambda i, reply: change(reply) if i == 1 else reply
+
+
+def test_snapshot():
+    inf = inficon()
+    snapshot = inf.snapshot()
+    assert snapshot['thickness'] == [0.1, 0.2, 0.3]
+    assert inf.serial.writes == 1
+
+
+def test_lost_frame_start_discards_burst():
+    inf = inficon(second(lambda reply: reply[1:]))
+    snapshot = inf.snapshot()
+    assert snapshot['thickness'] == [0.1, 0.2, 0.3]
+    assert len(snapshot['rate']) == 3 and all(abs(rate) < 1 for rate in snapshot['rate'])
+    assert inf.serial.writes == 1 + 6          # the burst, then each command again
+
+
+def test_corrupt_frame_start_discards_burst():
+    inf = inficon(second(lambda reply: b'#' + reply[1:]))
+    assert inf.snapshot()['thickness'] == [0.1, 0.2, 0.3]
+    assert inf.serial.writes == 1 + 6
+
+
+def test_corrupt_crc_discards_burst():
+    inf = inficon(second(lambda reply: reply[:-1] + bytes((reply[-1] ^ 1,))))
+    assert inf.snapshot()['thickness'] == [0.1, 0.2, 0.3]
+    assert inf.serial.writes == 1 + 6
+
+
+def test_extra_bytes_discard_burst():
+    inf = inficon(lambda i, reply: reply + b'x' if i == 5 else reply)
+    assert inf.snapshot()['thickness'] == [0.1, 0.2, 0.3]
+    assert inf.serial.writes == 1 + 6
@@ -0,0 +1,31 @@
+"""Metrics registry (monitor/metrics.py)"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from monitor.metrics import Metrics
+
+
+class Instrument(object):
+    metrics = None
+
+    def read(self):
+        if self.metrics is not None:
+            self.metrics.inc('echo_reads_total', instrument='TCU')
+            self.metrics.observe('echo_read_seconds', 0.01, instrument='TCU')
+
+
+def test_chambers_in_their_own_series():
+    metrics = Metrics()
+    first, second = Instrument(), Instrument()
+    metrics.attach(first, chamber='EVAP1')
+    metrics.attach(second, chamber='EVAP2')
+    first.read()
+    second.read()
+    second.read()
+    assert Instrument.metrics is None
+    text = metrics.render()
+    assert 'echo_reads_total{chamber="EVAP1",instrument="TCU"} 1' in text
+    assert 'echo_reads_total{chamber="EVAP2",instrument="TCU"} 2' in text
+    assert 'echo_read_seconds_count{chamber="EVAP2",instrument="TCU"} 2' in text
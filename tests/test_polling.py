@@ -0,0 +1,145 @@
+"""Polling engine (monitor/polling.py): faults, the circuit breaker, hung
+reads, stale readings and per-instrument periods"""
+
+import os
+import sys
+import math
+import time
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from monitor.polling import Breaker, Poller, schedule, OK, STALE, FAULT, OFFLINE
+
+
+class Reader(object):
+    """Instrument read returning {'<column>': n}, or raising while failing"""
+
+    def __init__(self, column):
+        self.column = column
+        self.failing = False
+        self.reads = 0
+        self.reconnects = 0
+
+    def __call__(self):
+        self.reads += 1
+        if self.failing:
+            raise IOError('no reply')
+        return {self.column: float(self.reads)}
+
+    def reconnect(self):
+        self.reconnects += 1
+        if self.failing:
+            raise IOError('port gone')
+
+
+def poll(poller, wait=0.5):
+    """One poll of every instrument, as a tick would"""
+    return poller.poll(time.monotonic() + wait)
+
+
+def test_fault_is_a_gap_and_others_are_read():
+    tcu, inficon = Reader('Temp 1'), Reader('Rate 1')
+    with Poller({'TCU': tcu, 'Inficon': inficon}, period=0.01) as poller:
+        poll(poller)
+        time.sleep(0.01)
+        inficon.failing = True
+        record = poll(poller)
+    assert record['TCU Status'] == OK and record['Temp 1'] == 2.0
+    assert record['Inficon Status'] == FAULT
+    assert math.isnan(record['Rate 1'])
+
+
+def test_breaker_backoff_doubles_to_max():
+    breaker = Breaker(failures=2, backoff=1, backoff_max=3)
+    assert not breaker.failure(0)
+    assert breaker.failure(0) and breaker.open      # opens on the second fault
+    assert not breaker.allow(0.5) and breaker.allow(1)
+    delays = []
+    for now in range(1, 4):
+        breaker.failure(now)
+        delays.append(breaker.retry_at - now)
+    assert delays == [2, 3, 3]
+    assert breaker.success() and not breaker.open and breaker.delay == 1
+
+
+def test_offline_then_reconnects():
+    tcu, inficon = Reader('Temp 1'), Reader('Rate 1')
+    with Poller({'TCU': tcu, 'Inficon': inficon}, period=0.01,
+                reconnects={'Inficon': inficon.reconnect}) as poller:
+        worker = poller.workers[1]
+        worker.breaker = Breaker(failures=2, backoff=0.05, backoff_max=0.2)
+        poll(poller)
+        inficon.failing = True
+        statuses = []
+        for i in range(3):
+            time.sleep(0.01)
+            statuses.append(poll(poller)['Inficon Status'])
+        assert statuses == [FAULT, FAULT, OFFLINE]
+        assert inficon.reconnects == 0                  # backing off
+
+        time.sleep(0.06)
+        assert poll(poller)['Inficon Status'] == FAULT  # the reconnect failed too
+        assert inficon.reconnects == 1
+        assert worker.breaker.delay == 0.1
+
+        inficon.failing = False
+        time.sleep(0.11)
+        record = poll(poller)
+    assert record['Inficon Status'] == OK and inficon.reconnects == 2
+    assert not worker.breaker.open
+    assert all(status == OK for status in [record['TCU Status']])
+
+
+def test_hung_read_is_stale_then_fault():
+    release = threading.Event()
+    tcu, inficon = Reader('Temp 1'), Reader('Rate 1')
+    calls = []
+
+    def hanging():
+        calls.append(1)
+        if len(calls) > 1:
+            release.wait(5)
+        return {'Rate 1': float(len(calls))}
+
+    with Poller({'TCU': tcu, 'Inficon': hanging}, period=0.01,
+                reconnects={'Inficon': lambda: None}) as poller:
+        poller.workers[1].breaker = Breaker(read_timeout=0.1)
+        poll(poller)
+        time.sleep(0.01)
+        start = time.monotonic()
+        record = poll(poller, wait=0.02)
+        assert time.monotonic() - start < 0.1           # the sample does not wait for it
+        assert 'Inficon Status' not in record and record['TCU Status'] == OK
+
+        time.sleep(0.01)
+        record = poll(poller, wait=0.02)
+        assert record['Inficon Status'] == STALE and record['Rate 1'] == 1.0   # previous reading
+
+        time.sleep(0.1)
+        record = poll(poller, wait=0.02)
+        assert record['Inficon Status'] == FAULT and math.isnan(record['Rate 1'])
+        assert poller.workers[1].breaker.faults == 1
+        release.set()
+
+
+def test_instruments_at_their_own_periods():
+    fast, slow = Reader('Temp 1'), Reader('Pressure')
+    with Poller({'TCU': fast, 'TPG': slow}, period=0.05) as poller:
+        poller.set_periods({'TPG': 0.15})
+        records = list(poller.run(sample_max=6))
+    assert [record['Sample'] for record in records] == list(range(6))
+    assert all(record['TCU Status'] == OK for record in records)
+    assert ['TPG Status' in record for record in records] == [True, False, False, True, False, False]
+
+
+def test_schedule_does_not_drift_and_skips_missed_ticks():
+    ticks = schedule(0.02)
+    first = next(ticks)
+    time.sleep(0.01)                                    # work shorter than a tick
+    assert next(ticks) - first == pytest.approx(0.02)
+    time.sleep(0.07)                                    # late by several ticks
+    late = next(ticks)
+    assert late - first == pytest.approx(0.08)
+    assert late <= time.monotonic()
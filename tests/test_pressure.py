@@ -0,0 +1,90 @@
+"""TPG commands while the gauge is in continuous output mode"""
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from drivers.pressureDriver import TPG261
+from drivers.simulatedDevices import Chamber, TPGSim
+
+
+class FakeSerial(object):
+
+    def __init__(self):
+        self.written = b''
+
+    def write(self, data):
+        self.written += data
+
+
+def continuous():
+    """A TPG261 as if start_continuous had received a first line"""
+    pcu = TPG261(port=None)
+    pcu.serial = FakeSerial()
+    pcu._reader = object()
+    pcu._mode = 1
+    pcu._latest = pcu._parse_pressures('0,1.0000E-06,0,2.0000E-03') + (time.monotonic(),)
+    return pcu
+
+
+def test_pressures_from_last_line():
+    pcu = continuous()
+    assert pcu.pressure_gauge(1) == 1e-6
+    assert pcu.pressure_gauge(2) == 2e-3
+    assert pcu.pressure_gauges()[2] == 2e-3
+    assert pcu.serial.written == b''
+
+
+@pytest.mark.parametrize('method', ['program_number', 'gauge_identification', 'pressure_unit'])
+def test_no_command_sent(method):
+    pcu = continuous()
+    with pytest.raises(IOError):
+        getattr(pcu, method)()
+    assert pcu.serial.written == b''
+
+
+class SimSerial(FakeSerial):
+    """Serial port answered by TPGSim, or by nothing if device is None"""
+
+    def __init__(self, device):
+        FakeSerial.__init__(self)
+        self.device = device
+        self.buffer = b''
+
+    def write(self, data):
+        FakeSerial.write(self, data)
+        if self.device is not None:
+            self.buffer += b''.join(self.device.receive(data))
+
+    def readline(self):
+        deadline = time.monotonic() + 0.2      # the port timeout
+        while b'\n' not in self.buffer and time.monotonic() < deadline:
+            if self.device is not None:
+                self.buffer += b''.join(self.device.idle())
+            time.sleep(0.01)
+        end = self.buffer.find(b'\n') + 1 or len(self.buffer)
+        line, self.buffer = self.buffer[:end], self.buffer[end:]
+        return line
+
+    def reset_input_buffer(self):
+        self.buffer = b''
+
+
+def test_start_continuous_waits_for_first_line():
+    pcu = TPG261(port=None)
+    pcu.serial = SimSerial(TPGSim(Chamber(seed=0)))
+    assert pcu.start_continuous(mode=0)
+    assert pcu.pressure_gauge(1, max_age=0.5) > 0     # no fault on the first sample
+    pcu.stop_continuous()
+    assert not pcu.continuous
+
+
+def test_start_continuous_silent_gauge():
+    pcu = TPG261(port=None)
+    pcu.serial = SimSerial(None)
+    with pytest.raises(IOError):
+        pcu.start_continuous(mode=1)
+    assert not pcu.continuous